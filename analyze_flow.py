@@ -1,32 +1,71 @@
-"""Optimized standalone V2 flow cytometry analysis script.
+"""Standalone flow cytometry analysis pipeline.
 
-This version keeps behavior/output equivalent to `analyze_flow.py` while
-reducing duplication and improving maintainability.
-
-This script takes a directory containing two CSV inputs:
-1) Raw FlowJo-exported results.
+Each plate is a directory (or `.zip`/`.tar` archive, or a folder inside one)
+containing two CSV inputs:
+1) Raw FlowJo-exported results (or `<folder> FlowJo table (gated).csv`
+   written by `gating.py` from FCS files, which takes precedence).
 2) Plate mapping metadata (sample name mapping, sample type, replicate).
 
-It produces three output artifacts in a project-local output folder:
-- `processed_flow_data.csv` (cleaned + merged per-row data)
-- `experiment_summary.md` (key findings + summary table + figure links)
-- Four PNG figures (bar charts with mean ± SEM)
+It writes these artifacts to a project-local `<plate>_analyzed_data` folder:
+- `processed_flow_data.csv` (cleaned + merged per-row data), plus
+  `processed_flow_data.parquet`/`.feather` with `--columnar-format`.
+- `sample_stats.parquet`/`.feather` (sample-level means/SEMs) with
+  `--columnar-format`.
+- `experiment_summary.md` (key findings + summary table + figure links), and
+  `summary_table.csv`/`.parquet` when the table exceeds `--table-max-rows`.
+- `hit_calls.csv` (per-sample pass/fail for every hit rule).
+- One PNG figure per `METRIC_CONFIGS` entry: a bar chart with mean ± SEM,
+  one `_pageN` PNG per page for large libraries, or a ranked plot.
+- `threshold_sweep.csv` (and `threshold_sweep.png` for two rules) with
+  `--sweep`.
+- `run_profile.json` (per-stage wall/CPU time, memory, and I/O).
+- `analysis_manifest.json` and `.stage_cache/` (result cache and per-stage
+  artifacts, so unchanged inputs and stages are skipped).
+
+Entry points:
+- `python3 analyze_flow.py <data_dir>` for one plate. Several paths or globs,
+  `--discover ROOT`, or `--manifest FILE` run in batch mode over a process
+  pool (`--jobs`) and write `batch_summary.json`/`batch_summary.md`.
+  `--validate-only` only checks the inputs and writes `preflight_summary.json`.
+- `run_analysis(data_dir, options)` / `run_batch(data_dirs, jobs, options)`
+  for the same runs from Python, and `analyze(raw_df, mapping_df, config)`
+  for in-memory DataFrames (`AnalysisResult`).
+- `flow_server.py` (warm worker pool over local HTTP) and `flow_watch.py`
+  (analyze plate folders as they land) both run plates through `run_analysis`.
 
 Core responsibilities:
 - Locate and validate expected input files.
 - Clean known raw-data artifacts ("Mean"/"SD" rows).
 - Resolve mapping column names robustly even with formatting variations.
 - Fail fast when mapping metadata is incomplete.
-- Compute requested thresholds and summary metrics.
+- Compute requested thresholds and summary metrics, optionally streamed in
+  chunks (`--stream-chunk-rows`) or pooled across plates (`--accumulator-store`).
 - Render consistently ordered figures with styling and threshold overlays.
 """
 
 import argparse
+import ast
+import contextlib
+import fnmatch
+import glob
+import hashlib
+import inspect
+import json
 import os
+import pickle
+import re
+import sys
+import tarfile
+import time
+import tracemalloc
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from matplotlib.patches import Patch
 
 REQUIRED_METRIC_KEYS = ("percent_parent", "mfi_ratio", "mfi_af488", "mirfp_expression")
@@ -66,52 +105,379 @@ METRIC_CONFIGS = [
 ]
 
 
+BATCH_SUMMARY_JSON = "batch_summary.json"
+BATCH_SUMMARY_MD = "batch_summary.md"
+PREFLIGHT_SUMMARY_JSON = "preflight_summary.json"
+CACHE_MANIFEST = "analysis_manifest.json"
+CACHE_MANIFEST_VERSION = 2
+HASH_CHUNK_BYTES = 1 << 20
+STAGE_CACHE_DIR = ".stage_cache"
+RUN_PROFILE = "run_profile.json"
+
+
+def _input_name(data_dir):
+    """Dataset name of an input folder, archive (suffix dropped), or `<archive>::<folder>`."""
+    archive, member = split_archive_path(data_dir)
+    if archive is None:
+        return os.path.basename(os.path.abspath(os.path.normpath(data_dir)))
+    if member:
+        return member.rsplit("/", 1)[-1]
+    name = os.path.basename(archive)
+    suffix = next(sfx for sfx in sorted(ARCHIVE_SUFFIXES, key=len, reverse=True) if name.lower().endswith(sfx))
+    return name[: -len(suffix)]
+
+
+def _output_dir_path(data_dir):
+    """Project-local output path for an input dataset folder or archive (not created)."""
+    input_name = _input_name(data_dir)
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(project_dir, f"{input_name}_analyzed_data")
+
+
 def get_output_dir(data_dir):
     """Build the project-local output directory for a given input dataset folder."""
-    input_dir = os.path.abspath(os.path.normpath(data_dir))
-    input_name = os.path.basename(input_dir)
-    project_dir = os.path.dirname(os.path.abspath(__file__))
-    output_dir = os.path.join(project_dir, f"{input_name}_analyzed_data")
+    output_dir = _output_dir_path(data_dir)
     os.makedirs(output_dir, exist_ok=True)
     return output_dir
 
 
-def _pick_csvs_from_dir(dir_path):
-    """Find candidate raw + mapping CSV files in a single directory."""
-    raw_csv = None
-    mapping_csv = None
-    for name in os.listdir(dir_path):
-        if not name.endswith(".csv"):
+# Case-insensitive filename globs per input role; mapping patterns take precedence.
+INPUT_FILE_PATTERNS = {
+    "mapping": ("*plate_mapping*.csv",),
+    "raw": ("*flowjo table*.csv", "*ratio_reanalysis*.csv", "*reanaly*.csv"),
+}
+# `gating.py` writes `<folder> FlowJo table (gated).csv` next to any FlowJo export;
+# a raw candidate with this marker supersedes the other raw CSVs in its folder.
+GATED_RAW_MARKER = "(gated)"
+DISCOVERY_INDEX_VERSION = 2
+# Archives are scanned like folders; their CSVs are addressed as `<archive>::<member>`.
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz")
+ARCHIVE_MEMBER_SEP = "::"
+
+
+def is_archive_file(path):
+    """True for `.zip`/`.tar`/`.tar.gz`/`.tgz` file names."""
+    return str(path).lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def split_archive_path(path):
+    """`(archive, member)` for `<archive>::<member>` paths; `(archive, "")` for a bare archive.
+
+    Returns `(None, None)` for ordinary filesystem paths.
+    """
+    path = str(path)
+    if ARCHIVE_MEMBER_SEP in path:
+        archive, member = path.split(ARCHIVE_MEMBER_SEP, 1)
+        return archive, member.strip("/")
+    if is_archive_file(path):
+        return path, ""
+    return None, None
+
+
+def _list_archive_members(archive):
+    """[(member_name, size)] of regular files in a zip or tar archive, sorted by name."""
+    if archive.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive) as zf:
+            members = [(info.filename, info.file_size) for info in zf.infolist() if not info.is_dir()]
+    else:
+        with tarfile.open(archive, "r:*") as tf:
+            members = [(info.name, info.size) for info in tf.getmembers() if info.isfile()]
+    return sorted(members)
+
+
+@contextlib.contextmanager
+def open_input(path):
+    """Open a plain file or an archive member (`<archive>::<member>`) as a binary stream.
+
+    Archive members are decompressed on the fly; nothing is extracted to disk.
+    """
+    archive, member = split_archive_path(path)
+    if archive is None:
+        with open(path, "rb") as f:
+            yield f
+    elif archive.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive) as zf, zf.open(member) as f:
+            yield f
+    else:
+        with tarfile.open(archive, "r:*") as tf:
+            f = tf.extractfile(member)
+            if f is None:
+                raise FileNotFoundError(f"{member} is not a regular file in {archive}")
+            with f:
+                yield f
+
+
+def read_input_csv(path, **kwargs):
+    """`pd.read_csv` for plain paths and archive members alike."""
+    with open_input(path) as f:
+        return pd.read_csv(f, **kwargs)
+
+
+def input_path_exists(path):
+    """True for existing folders, archives, and `<archive>::<folder>` prefixes."""
+    archive, _member = split_archive_path(path)
+    return os.path.isfile(archive) if archive is not None else os.path.isdir(path)
+
+
+def classify_input_file(name, patterns=None):
+    """Role (`"mapping"`/`"raw"`) of a file name under `patterns`, or None."""
+    lower_name = name.lower()
+    for role, role_patterns in (patterns or INPUT_FILE_PATTERNS).items():
+        if any(fnmatch.fnmatchcase(lower_name, pattern.lower()) for pattern in role_patterns):
+            return role
+    return None
+
+
+class DiscoveryIndex:
+    """Persisted per-directory listing of input candidates: (name, size, mtime_ns, role).
+
+    A directory is only re-listed when its own mtime changes (an entry was
+    added, removed, or renamed), so repeat scans of a large archive cost one
+    `stat` per directory. File sizes/mtimes recorded here are from the last
+    listing; content hashing in the cache manifest does not rely on them.
+    """
+
+    def __init__(self, path=None, patterns=None):
+        self.path = path
+        self.patterns = patterns or INPUT_FILE_PATTERNS
+        self.dirs = {}
+        self.archives = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            with open(path) as f:
+                stored = json.load(f)
+            # Roles depend on the patterns, so an index built with other patterns is discarded.
+            if stored.get("version") == DISCOVERY_INDEX_VERSION and stored.get("patterns") == {
+                role: list(values) for role, values in self.patterns.items()
+            }:
+                self.dirs = stored.get("dirs", {})
+                self.archives = stored.get("archives", {})
+
+    def listing(self, dir_path):
+        """(candidate files, subdirectory names) of one directory, from cache when unchanged."""
+        dir_mtime = os.stat(dir_path).st_mtime_ns
+        cached = self.dirs.get(dir_path)
+        if cached and cached["mtime_ns"] == dir_mtime:
+            return cached["files"], cached["subdirs"]
+
+        files = []
+        subdirs = []
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                # Symlinked folders are not followed, so archive links cannot create cycles.
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                    continue
+                role = "archive" if is_archive_file(entry.name) else classify_input_file(entry.name, self.patterns)
+                if role is not None and entry.is_file():
+                    stat = entry.stat()
+                    files.append([entry.name, stat.st_size, stat.st_mtime_ns, role])
+        files.sort()
+        subdirs.sort()
+        self.dirs[dir_path] = {"mtime_ns": dir_mtime, "files": files, "subdirs": subdirs}
+        self.dirty = True
+        return files, subdirs
+
+    def archive_members(self, archive):
+        """[(member_name, size)] of an archive, re-read only when its size or mtime changes."""
+        stat = os.stat(archive)
+        cached = self.archives.get(archive)
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["members"]
+        members = _list_archive_members(archive)
+        self.archives[archive] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "members": [list(member) for member in members],
+        }
+        self.dirty = True
+        return self.archives[archive]["members"]
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        payload = {
+            "version": DISCOVERY_INDEX_VERSION,
+            "patterns": {role: list(values) for role, values in self.patterns.items()},
+            "dirs": self.dirs,
+            "archives": self.archives,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+def _scan_archive(archive, prefix, base_depth, max_depth, index, found):
+    """Add input candidates inside one archive; its folders count as further depth levels."""
+    stat = os.stat(archive)
+    prefix = f"{prefix}/" if prefix else ""
+    for name, size in index.archive_members(archive):
+        if not name.startswith(prefix):
             continue
-        lower_name = name.lower()
-        if "plate_mapping" in lower_name and mapping_csv is None:
-            mapping_csv = os.path.join(dir_path, name)
-        elif raw_csv is None and (
-            "flowjo table" in lower_name
-            or "ratio_reanalysis" in lower_name
-            or "reanaly" in lower_name
-        ):
-            raw_csv = os.path.join(dir_path, name)
-    return raw_csv, mapping_csv
-
-
-def find_input_csvs(data_dir):
-    """Locate required CSVs in `data_dir` or one nested level below it."""
-    # First, try the provided directory directly.
-    raw_csv, mapping_csv = _pick_csvs_from_dir(data_dir)
-    if raw_csv and mapping_csv:
-        return raw_csv, mapping_csv
-
-    # Fallback: search immediate child folders (common for archived exports).
-    for child in os.listdir(data_dir):
-        child_path = os.path.join(data_dir, child)
-        if not os.path.isdir(child_path):
+        rel_dir, _, file_name = name[len(prefix) :].rpartition("/")
+        role = classify_input_file(file_name, index.patterns)
+        depth = base_depth + (rel_dir.count("/") + 1 if rel_dir else 0)
+        if role is None or (max_depth is not None and depth > max_depth):
             continue
-        raw_csv, mapping_csv = _pick_csvs_from_dir(child_path)
-        if raw_csv and mapping_csv:
-            return raw_csv, mapping_csv
+        member_dir = f"{prefix}{rel_dir}".strip("/")
+        found.append(
+            {
+                "path": f"{archive}{ARCHIVE_MEMBER_SEP}{name}",
+                "dir": f"{archive}{ARCHIVE_MEMBER_SEP}{member_dir}",
+                "depth": depth,
+                "size": size,
+                "mtime_ns": stat.st_mtime_ns,
+                "role": role,
+            }
+        )
+
+
+def scan_input_files(root, max_depth=1, patterns=None, index=None):
+    """Recursively list input candidates below `root` (depth 0 = `root` itself).
+
+    Returns dicts with `path`, `dir`, `depth`, `size`, `mtime_ns`, and `role`,
+    sorted by depth, then path. `max_depth=None` scans without limit; hidden
+    folders and `*_analyzed_data` output folders are skipped. Zip/tar archives
+    (and `<archive>::<folder>` prefixes) are scanned like one more folder
+    level, without extracting them.
+    """
+    if index is None:
+        index = DiscoveryIndex(patterns=patterns)
+    found = []
+    archive, prefix = split_archive_path(root)
+    if archive is not None:
+        _scan_archive(os.path.abspath(archive), prefix, 0, max_depth, index, found)
+        return sorted(found, key=lambda item: (item["depth"], item["path"]))
+
+    root = os.path.abspath(os.path.normpath(root))
+    stack = [(root, 0)]
+    while stack:
+        dir_path, depth = stack.pop()
+        files, subdirs = index.listing(dir_path)
+        for name, size, mtime_ns, role in files:
+            path = os.path.join(dir_path, name)
+            if role == "archive":
+                if max_depth is None or depth < max_depth:
+                    _scan_archive(path, "", depth + 1, max_depth, index, found)
+                continue
+            found.append(
+                {
+                    "path": path,
+                    "dir": dir_path,
+                    "depth": depth,
+                    "size": size,
+                    "mtime_ns": mtime_ns,
+                    "role": role,
+                }
+            )
+        if max_depth is None or depth < max_depth:
+            for name in subdirs:
+                if not name.startswith(".") and not name.endswith("_analyzed_data"):
+                    stack.append((os.path.join(dir_path, name), depth + 1))
+    return sorted(found, key=lambda item: (item["depth"], item["path"]))
+
+
+def _group_candidates_by_dir(candidates):
+    """{dir: {"raw": [paths], "mapping": [paths]}} preserving scan order."""
+    by_dir = {}
+    for item in candidates:
+        roles = by_dir.setdefault(item["dir"], {"raw": [], "mapping": []})
+        roles[item["role"]].append(item["path"])
+    for roles in by_dir.values():
+        gated = [path for path in roles["raw"] if _is_gated_table(path)]
+        if gated:
+            roles["raw"] = gated
+    return by_dir
+
+
+def _is_gated_table(path):
+    """True for raw tables written by `gating.py` (`... (gated).csv`)."""
+    return GATED_RAW_MARKER in os.path.basename(path).lower()
+
+
+def _describe_ambiguity(dir_path, roles):
+    parts = [
+        f"{len(paths)} {role} files ({', '.join(os.path.basename(p) for p in paths)})"
+        for role, paths in roles.items()
+        if len(paths) > 1
+    ]
+    return f"{dir_path}: " + "; ".join(parts)
+
+
+def _pick_csvs_from_dir(dir_path, patterns=None):
+    """Candidate raw + mapping CSV files in a single directory (first by name when several match)."""
+    roles = _group_candidates_by_dir(scan_input_files(dir_path, 0, patterns)).get(
+        os.path.abspath(os.path.normpath(dir_path)), {"raw": [], "mapping": []}
+    )
+    return (roles["raw"] or [None])[0], (roles["mapping"] or [None])[0]
+
+
+def find_input_csvs(data_dir, max_depth=1, patterns=None, index=None):
+    """Locate the raw + mapping CSV pair in `data_dir` or up to `max_depth` levels below it.
+
+    `data_dir` may also be a zip/tar archive (or `<archive>::<folder>`); the
+    returned paths are then `<archive>::<member>` references for `read_input_csv`.
+
+    The shallowest folder holding both roles wins. A gated table written by
+    `gating.py` takes precedence over other raw CSVs in the same folder. Several
+    remaining candidates for a role in that folder, or several complete folders
+    at the same depth, raise `ValueError` listing every match instead of
+    picking one arbitrarily.
+    """
+    if not input_path_exists(data_dir):
+        raise FileNotFoundError(f"Could not find required CSV files in {data_dir}")
+    candidates = scan_input_files(data_dir, max_depth, patterns, index)
+    depth_of = {item["dir"]: item["depth"] for item in candidates}
+    by_dir = _group_candidates_by_dir(candidates)
+    complete = {
+        dir_path: roles for dir_path, roles in by_dir.items() if roles["raw"] and roles["mapping"]
+    }
+    if not complete:
+        raise FileNotFoundError(f"Could not find required CSV files in {data_dir}")
+
+    best_depth = min(depth_of[dir_path] for dir_path in complete)
+    best = sorted(dir_path for dir_path in complete if depth_of[dir_path] == best_depth)
+    if len(best) > 1:
+        raise ValueError(
+            f"Ambiguous inputs in {data_dir}: {len(best)} folders at the same depth contain a "
+            f"raw + mapping CSV pair ({', '.join(best)}). Point data_dir at one of them."
+        )
+    roles = complete[best[0]]
+    if len(roles["raw"]) > 1 or len(roles["mapping"]) > 1:
+        raise ValueError(
+            f"Ambiguous inputs in {_describe_ambiguity(best[0], roles)}. "
+            "Remove or rename the extra files so exactly one raw and one mapping CSV match."
+        )
+    if _is_gated_table(roles["raw"][0]):
+        print(f"Using gated table {os.path.basename(roles['raw'][0])} as the raw CSV")
+    return roles["raw"][0], roles["mapping"][0]
+
+
+def discover_plate_dirs(root, max_depth=None, patterns=None, index=None):
+    """Folders below `root` holding a complete raw + mapping pair (sorted), plus ambiguous ones.
 
-    raise FileNotFoundError(f"Could not find required CSV files in {data_dir}")
+    Pairs found inside archives are returned as `<archive>::<folder>` (or the
+    bare archive path when the pair sits at the archive's top level).
+
+    Returns `(plate_dirs, ambiguous)` where `ambiguous` maps each folder with
+    several candidates for a role to a description of the matches.
+    """
+    by_dir = _group_candidates_by_dir(scan_input_files(root, max_depth, patterns, index))
+    plate_dirs = []
+    ambiguous = {}
+    for dir_path in sorted(by_dir):
+        roles = by_dir[dir_path]
+        if not (roles["raw"] and roles["mapping"]):
+            continue
+        if dir_path.endswith(ARCHIVE_MEMBER_SEP):
+            dir_path = dir_path[: -len(ARCHIVE_MEMBER_SEP)]
+        if len(roles["raw"]) > 1 or len(roles["mapping"]) > 1:
+            ambiguous[dir_path] = _describe_ambiguity(dir_path, roles)
+        else:
+            plate_dirs.append(dir_path)
+    return plate_dirs, ambiguous
 
 
 def _normalize_column_name(name):
@@ -145,25 +511,17 @@ def resolve_mapping_columns(mapping_columns):
     return resolved
 
 
-def clean_and_merge(data_dir, output_dir):
-    """Load raw/mapping CSVs, clean artifacts, merge metadata, and export merged CSV."""
-    raw_csv, mapping_csv = find_input_csvs(data_dir)
-    print(f"Loading raw data from: {raw_csv}")
-    print(f"Loading mapping from: {mapping_csv}")
-
-    # The first raw column is treated as sample identifier regardless of its header text.
-    raw_df = pd.read_csv(raw_csv)
-    sample_col = raw_df.columns[0]
-
-    # Remove FlowJo artifact summary rows and empty sample rows.
+def _drop_artifact_rows(raw_df, sample_col):
+    """Remove FlowJo `Mean`/`SD` summary rows and rows without a sample identifier."""
     normalized_sample_names = raw_df[sample_col].astype(str).str.strip().str.lower()
     raw_df = raw_df[~normalized_sample_names.isin(["mean", "sd"])]
-    raw_df = raw_df.dropna(subset=[sample_col])
+    return raw_df.dropna(subset=[sample_col])
 
-    # Standardize mapping column names so all downstream code uses stable keys.
-    mapping_df = pd.read_csv(mapping_csv)
+
+def canonicalize_mapping(mapping_df):
+    """Rename mapping columns to the canonical `REQUIRED_MAPPING_COLUMNS` names."""
     mapping_col_map = resolve_mapping_columns(mapping_df.columns)
-    mapping_df = mapping_df.rename(
+    return mapping_df.rename(
         columns={
             mapping_col_map["Sample Name"]: "Sample Name",
             mapping_col_map["Updated Sample Name"]: "Updated Sample Name",
@@ -172,35 +530,30 @@ def clean_and_merge(data_dir, output_dir):
         }
     )
 
-    # Left join keeps every raw sample row; we fail fast on missing mapping metadata below.
-    merged_df = pd.merge(
-        raw_df,
-        mapping_df,
-        left_on=sample_col,
-        right_on="Sample Name",
-        how="left",
-    )
 
-    # Explicitly fail on unmatched samples to avoid silent drops in later groupby operations.
+def _unmatched_samples(merged_df, sample_col):
+    """Raw sample names whose merged rows lack any required mapping metadata."""
     unmatched_mask = (
         merged_df["Updated Sample Name"].isna()
         | merged_df["Sample Type"].isna()
         | merged_df["Replicate"].isna()
     )
-    if unmatched_mask.any():
-        unmatched_samples = (
-            merged_df.loc[unmatched_mask, sample_col]
-            .astype(str)
-            .drop_duplicates()
-            .tolist()
-        )
-        preview = ", ".join(unmatched_samples[:10])
-        suffix = "..." if len(unmatched_samples) > 10 else ""
-        raise ValueError(
-            "Found raw samples missing mapping metadata (Updated Sample Name, Sample Type, and/or Replicate). "
-            f"Unmatched samples ({len(unmatched_samples)}): {preview}{suffix}"
-        )
+    if not unmatched_mask.any():
+        return []
+    return merged_df.loc[unmatched_mask, sample_col].astype(str).drop_duplicates().tolist()
+
+
+def _raise_unmatched(unmatched_samples):
+    preview = ", ".join(unmatched_samples[:10])
+    suffix = "..." if len(unmatched_samples) > 10 else ""
+    raise ValueError(
+        "Found raw samples missing mapping metadata (Updated Sample Name, Sample Type, and/or Replicate). "
+        f"Unmatched samples ({len(unmatched_samples)}): {preview}{suffix}"
+    )
 
+
+def _finalize_merged_columns(merged_df, sample_col):
+    """Rename to user-facing names, drop placeholder columns, and front-load metadata."""
     # Keep the raw sample identifier column first and avoid duplicate merge-key columns.
     if sample_col != "Sample Name":
         merged_df = merged_df.drop(columns=["Sample Name"], errors="ignore")
@@ -217,18 +570,282 @@ def clean_and_merge(data_dir, output_dir):
     # Front-load metadata columns to make exported CSV easier to inspect manually.
     leading_cols = ["Sample Name", "True Sample Name", "Sample Type", "Replicate"]
     remaining_cols = [col for col in merged_df.columns if col not in leading_cols]
-    merged_df = merged_df[leading_cols + remaining_cols]
+    return merged_df[leading_cols + remaining_cols]
+
+
+def merge_raw_and_mapping(raw_df, mapping_df):
+    """Clean FlowJo artifacts from a raw table and merge plate-mapping metadata (no file I/O)."""
+    # The first raw column is treated as sample identifier regardless of its header text.
+    sample_col = raw_df.columns[0]
+    raw_df = _drop_artifact_rows(raw_df, sample_col)
+
+    # Standardize mapping column names so all downstream code uses stable keys.
+    mapping_df = canonicalize_mapping(mapping_df)
+
+    # Left join keeps every raw sample row; we fail fast on missing mapping metadata below.
+    merged_df = pd.merge(
+        raw_df,
+        mapping_df,
+        left_on=sample_col,
+        right_on="Sample Name",
+        how="left",
+    )
+
+    # Explicitly fail on unmatched samples to avoid silent drops in later groupby operations.
+    unmatched_samples = _unmatched_samples(merged_df, sample_col)
+    if unmatched_samples:
+        _raise_unmatched(unmatched_samples)
+
+    return _finalize_merged_columns(merged_df, sample_col)
+
+
+# Pruned loading: metric columns parse as float32, repeated metadata becomes categorical.
+RAW_METRIC_DTYPE = "float32"
+RAW_METRIC_DTYPES = ("float32", "float64")
+MERGED_CATEGORY_COLUMNS = ("True Sample Name", "Sample Type")
+
+
+def plan_raw_columns(raw_header, passthrough_columns=(), metric_dtype=RAW_METRIC_DTYPE):
+    """`usecols`/`dtype` for a pruned raw load, resolved from the header alone.
+
+    Keeps the sample column, the four metric columns found by the
+    `identify_columns` patterns, and any requested passthrough columns.
+    float32 metrics halve memory but carry ~7 significant digits; the
+    statistics are computed in float64 (`metric_values_float64`), and
+    `metric_dtype="float64"` also keeps full precision in the merged table.
+    """
+    if metric_dtype not in RAW_METRIC_DTYPES:
+        raise ValueError(
+            f"Unsupported metric dtype {metric_dtype!r}; expected one of: {', '.join(RAW_METRIC_DTYPES)}"
+        )
+    target_cols = match_metric_columns(raw_header)
+    validate_target_columns(target_cols, raw_header)
+    missing = [col for col in passthrough_columns if col not in raw_header]
+    if missing:
+        raise ValueError(
+            f"Passthrough columns not found in raw CSV: {', '.join(missing)}. "
+            f"Available columns: {', '.join(str(col) for col in raw_header)}"
+        )
+    metric_cols = list(dict.fromkeys(target_cols[key] for key in REQUIRED_METRIC_KEYS))
+    usecols = list(dict.fromkeys([raw_header[0], *metric_cols, *passthrough_columns]))
+    return usecols, {col: metric_dtype for col in metric_cols}
+
+
+def load_raw_table(raw_csv, passthrough_columns=(), metric_dtype=RAW_METRIC_DTYPE):
+    """Read only the analysis columns of a raw FlowJo table with explicit dtypes."""
+    usecols, dtype = plan_raw_columns(
+        list(read_input_csv(raw_csv, nrows=0).columns), passthrough_columns, metric_dtype
+    )
+    try:
+        return read_input_csv(raw_csv, usecols=usecols, dtype=dtype)
+    except ValueError as e:
+        raise ValueError(
+            f"Could not parse metric columns of {raw_csv} as {metric_dtype} ({e}). "
+            "Run without --prune-columns to load them with inferred types."
+        ) from None
+
+
+# Columnar exports (Parquet via pyarrow/fastparquet, Feather via pyarrow) keep dtypes that CSV loses.
+COLUMNAR_FORMATS = ("parquet", "feather")
+MERGED_BASENAME = "processed_flow_data"
+PLOT_DATA_BASENAME = "sample_stats"
+COLUMNAR_CATEGORY_COLUMNS = ("Sample Name", "True Sample Name", "Sample Type")
+
+
+def columnar_frame(df, metric_dtype=RAW_METRIC_DTYPE):
+    """Copy of `df` typed for columnar export.
+
+    Metadata columns become categorical, `Replicate` a nullable integer, and
+    float columns `metric_dtype`; integer columns (event counts) are kept.
+    """
+    if metric_dtype not in RAW_METRIC_DTYPES:
+        raise ValueError(
+            f"Unsupported metric dtype {metric_dtype!r}; expected one of: {', '.join(RAW_METRIC_DTYPES)}"
+        )
+    out = df.copy()
+    for col in COLUMNAR_CATEGORY_COLUMNS:
+        if col in out.columns:
+            out[col] = out[col].astype("category")
+    if "Replicate" in out.columns:
+        out["Replicate"] = pd.to_numeric(out["Replicate"], errors="coerce").round().astype("Int32")
+    float_cols = list(out.select_dtypes("floating").columns)
+    if float_cols:
+        out[float_cols] = out[float_cols].astype(metric_dtype)
+    return out
+
+
+def write_columnar_table(df, output_dir, basename, columnar_format, metric_dtype=RAW_METRIC_DTYPE):
+    """Write `<basename>.parquet` / `.feather` (see `columnar_frame`) and return its path."""
+    if columnar_format not in COLUMNAR_FORMATS:
+        raise ValueError(
+            f"Unsupported columnar format {columnar_format!r}; expected one of: {', '.join(COLUMNAR_FORMATS)}"
+        )
+    output_path = os.path.join(output_dir, f"{basename}.{columnar_format}")
+    table = columnar_frame(df, metric_dtype)
+    try:
+        if columnar_format == "parquet":
+            table.to_parquet(output_path, index=False)
+        else:
+            table.to_feather(output_path)
+    except ImportError as e:
+        raise ImportError(
+            f"Writing {columnar_format} output needs pyarrow ({e}). Install it with "
+            "`pip install pyarrow`, or run without --columnar-format."
+        ) from None
+    print(f"Saved {columnar_format} table to {output_path}")
+    return output_path
 
-    output_path = os.path.join(output_dir, "processed_flow_data.csv")
-    merged_df.to_csv(output_path, index=False)
-    print(f"Saved merged data to {output_path}")
+
+def write_merged_tables(df, output_dir, columnar_format=None, merged_csv=True, metric_dtype=RAW_METRIC_DTYPE):
+    """Write the merged table as `processed_flow_data.csv` and/or its columnar copy."""
+    if columnar_format:
+        write_columnar_table(df, output_dir, MERGED_BASENAME, columnar_format, metric_dtype)
+    if merged_csv:
+        output_path = os.path.join(output_dir, f"{MERGED_BASENAME}.csv")
+        df.to_csv(output_path, index=False)
+        print(f"Saved merged data to {output_path}")
+
+
+def write_sample_stats(plot_data, output_dir, columnar_format):
+    """Write `sample_stats.<format>`: aggregated statistics without classification columns."""
+    stats = plot_data.drop(columns=list(SAMPLE_CLASS_COLUMNS), errors="ignore")
+    return write_columnar_table(stats, output_dir, PLOT_DATA_BASENAME, columnar_format)
+
+
+def clean_and_merge(
+    data_dir,
+    output_dir,
+    input_csvs=None,
+    prune_columns=False,
+    passthrough_columns=(),
+    full_merged_csv=False,
+    metric_dtype=RAW_METRIC_DTYPE,
+    columnar_format=None,
+    merged_csv=True,
+):
+    """Load raw/mapping CSVs, clean artifacts, merge metadata, and export merged CSV.
+
+    With `prune_columns`, only the sample, metric, and passthrough columns are
+    loaded (see `load_raw_table`); `full_merged_csv` then still exports every
+    raw column by re-reading the raw table for the CSV alone.
+
+    `columnar_format` also writes `processed_flow_data.<format>` with typed
+    columns (see `columnar_frame`); `merged_csv=False` then skips the CSV.
+    """
+    if not merged_csv and not columnar_format:
+        raise ValueError("merged_csv=False needs a columnar_format, otherwise no merged table is written")
+    raw_csv, mapping_csv = input_csvs or find_input_csvs(data_dir)
+    print(f"Loading raw data from: {raw_csv}")
+    print(f"Loading mapping from: {mapping_csv}")
+    mapping_df = read_input_csv(mapping_csv)
+    if prune_columns:
+        merged_df = merge_raw_and_mapping(
+            load_raw_table(raw_csv, passthrough_columns, metric_dtype), mapping_df
+        )
+        for col in MERGED_CATEGORY_COLUMNS:
+            merged_df[col] = merged_df[col].astype("category")
+        export_df = (
+            merge_raw_and_mapping(read_input_csv(raw_csv), mapping_df) if full_merged_csv else merged_df
+        )
+    else:
+        merged_df = export_df = merge_raw_and_mapping(read_input_csv(raw_csv), mapping_df)
+
+    write_merged_tables(export_df, output_dir, columnar_format, merged_csv, metric_dtype)
+    del export_df
 
     return merged_df
 
 
+def stream_clean_and_merge(
+    raw_csv,
+    mapping_csv,
+    output_dir,
+    chunk_rows,
+    usecols=None,
+    dtype=None,
+):
+    """Chunked `clean_and_merge` that never holds the whole raw table in memory.
+
+    Each chunk is cleaned (`Mean`/`SD` rows, `Unnamed:` columns), joined to
+    the mapping through a prebuilt `Sample Name` index, appended to
+    `processed_flow_data.csv`, and folded into a `GroupedAccumulator` plus
+    per-name expression totals (`expression_totals_by_name`). Integer columns are written as floats so
+    every chunk formats a column the same way.
+
+    Returns a small summary artifact (`streamed=True`) carrying the merged
+    column names, row count, sample-level `plot_data`, and the expression
+    totals the mock threshold is computed from, in place of the merged DataFrame.
+    """
+    print(f"Loading raw data from: {raw_csv} (streaming, {chunk_rows} rows per chunk)")
+    print(f"Loading mapping from: {mapping_csv}")
+    header = list(read_input_csv(raw_csv, nrows=0).columns)
+    target_cols = match_metric_columns(header)
+    validate_target_columns(target_cols, header)
+    sample_col = header[0]
+
+    mapping_index = canonicalize_mapping(read_input_csv(mapping_csv)).set_index("Sample Name")
+    accumulator = GroupedAccumulator(
+        ["True Sample Name", "Sample Type"], {key: target_cols[key] for key in PLOT_METRIC_KEYS}
+    )
+    expression_col = target_cols["mirfp_expression"]
+    expression_totals = {}
+    unmatched = {}
+    columns = None
+    rows = 0
+
+    output_path = os.path.join(output_dir, "processed_flow_data.csv")
+    with open_input(raw_csv) as raw_file, open(output_path, "w", newline="") as out:
+        for chunk in pd.read_csv(raw_file, chunksize=chunk_rows, usecols=usecols, dtype=dtype):
+            chunk = _drop_artifact_rows(chunk, sample_col)
+            int_cols = [col for col in chunk.select_dtypes("integer").columns if col != sample_col]
+            if int_cols:
+                chunk[int_cols] = chunk[int_cols].astype(np.float64)
+            merged = chunk.join(mapping_index, on=sample_col, how="left")
+            for name in _unmatched_samples(merged, sample_col):
+                unmatched.setdefault(name, None)
+            if unmatched:
+                # Keep scanning to report every unmatched sample, but stop writing output.
+                continue
+            merged = _finalize_merged_columns(merged, sample_col)
+            merged.to_csv(out, header=columns is None, index=False)
+            columns = list(merged.columns)
+            rows += len(merged)
+
+            accumulator.update(merged)
+            expression_totals = merge_expression_totals(
+                expression_totals, expression_totals_by_name(merged, expression_col)
+            )
+
+    if unmatched:
+        os.remove(output_path)
+        _raise_unmatched(list(unmatched))
+    if columns is None:
+        raise ValueError(f"No sample rows found in {raw_csv}")
+    print(f"Saved merged data to {output_path} ({rows} rows)")
+
+    plot_data = accumulator.result(("mean", "sem")).rename(columns={"True Sample Name": "Sample Name"})
+    return {
+        "streamed": True,
+        "columns": columns,
+        "rows": rows,
+        "plot_data": plot_data,
+        "accumulator": accumulator,
+        "expression_totals": expression_totals,
+    }
+
+
+def _is_streamed(merge_artifact):
+    """True when the merge stage produced a `stream_clean_and_merge` summary."""
+    return isinstance(merge_artifact, dict) and merge_artifact.get("streamed", False)
+
+
 def identify_columns(df):
     """Discover required metric columns using robust pattern matching."""
-    cols = df.columns
+    return match_metric_columns(df.columns)
+
+
+def match_metric_columns(cols):
+    """`identify_columns` on a bare list of column names (e.g. a CSV header)."""
     target_cols = {}
 
     parent_match = [c for c in cols if "Freq. of Parent (%)" in str(c) and "AF488(+)" in str(c)]
@@ -276,45 +893,193 @@ def get_sem(x):
     return x.std() / np.sqrt(len(x)) if len(x) > 1 else 0
 
 
-def _sample_type_rank(sample_type):
-    """Sort rank to keep plot groups ordered: Negative -> Positive -> Experimental."""
-    sample_type_norm = str(sample_type).strip().lower()
-    if "negative" in sample_type_norm:
-        return 0
-    if "positive" in sample_type_norm:
-        return 1
-    return 2
+# Sample classification rules (case-insensitive regexes), evaluated once per distinct name/type.
+SAMPLE_CLASS_RULES = {
+    # Boolean columns from `Sample Name`.
+    "name_flags": {"is_mock": "mock", "is_flag": "flag", "is_his": "his"},
+    # `is_<role>` columns from `Sample Type`; each role is matched on its own, so a type may hold several.
+    "roles": {"negative": "negative", "positive": "positive", "experimental": "experimental"},
+    # Figure group order from `Sample Type` (`type_rank`); unmatched types rank last.
+    "type_order": ["negative", "positive"],
+    # Order of positive controls from `Sample Name` (`positive_rank`); unmatched names rank last.
+    "positive_order": ["a-his", "k1-70"],
+}
+SAMPLE_ROLES = ("negative", "positive", "experimental")
+SAMPLE_CLASS_COLUMNS = (
+    "is_mock",
+    "is_flag",
+    "is_his",
+    "type_rank",
+    "positive_rank",
+    *(f"is_{role}" for role in SAMPLE_ROLES),
+)
+CONTROL_ROLES = ("negative", "positive")
 
 
-def _positive_control_rank(sample_name):
-    """Secondary ordering within positives to keep controls visually consistent."""
-    sample_name_norm = str(sample_name).strip().lower()
-    if "a-his" in sample_name_norm:
-        return 0
-    if "k1-70" in sample_name_norm:
-        return 1
-    return 2
+def resolve_class_rules(overrides=None):
+    """`SAMPLE_CLASS_RULES` with per-key `overrides` applied and every pattern checked."""
+    unknown = sorted(set(overrides or {}) - set(SAMPLE_CLASS_RULES))
+    if unknown:
+        raise ValueError(
+            f"Unknown classification rule keys: {', '.join(unknown)}. "
+            f"Expected any of: {', '.join(SAMPLE_CLASS_RULES)}"
+        )
+    rules = {**SAMPLE_CLASS_RULES, **(overrides or {})}
+    if sorted(rules["roles"]) != sorted(SAMPLE_ROLES):
+        raise ValueError(f"Classification rule 'roles' must define exactly: {', '.join(SAMPLE_ROLES)}")
+    missing_flags = [flag for flag in ("is_mock", "is_flag", "is_his") if flag not in rules["name_flags"]]
+    if missing_flags:
+        raise ValueError(f"Classification rule 'name_flags' must define: {', '.join(missing_flags)}")
+    patterns = [
+        *rules["name_flags"].values(),
+        *rules["roles"].values(),
+        *rules["type_order"],
+        *rules["positive_order"],
+    ]
+    for pattern in patterns:
+        try:
+            re.compile(pattern)
+        except (re.error, TypeError) as e:
+            raise ValueError(f"Invalid classification pattern {pattern!r}: {e}") from None
+    return rules
+
+
+def load_class_rules(path):
+    """Read classification rule overrides from JSON and validate them."""
+    with open(path) as f:
+        overrides = json.load(f)
+    resolve_class_rules(overrides)
+    return overrides
+
+
+def _contains(values, pattern):
+    """Case-insensitive regex search over a string Series, as a NumPy mask (missing -> False)."""
+    return values.str.contains(pattern, case=False, na=False, regex=True).to_numpy(dtype=bool)
+
+
+def _first_match(values, patterns):
+    """Index of the first pattern each value contains (`len(patterns)` when none match)."""
+    result = np.full(len(values), len(patterns), dtype=np.int8)
+    for idx in range(len(patterns) - 1, -1, -1):
+        result[_contains(values, patterns[idx])] = idx
+    return result
+
+
+def _factorize_text(series):
+    """Codes into distinct values (as a string Series), so patterns run once per distinct value."""
+    codes, uniques = pd.factorize(series.astype(str), use_na_sentinel=False)
+    return codes, pd.Series(uniques)
 
 
-def calculate_mock_expression_threshold(df, target_cols):
+def classify_names(name_series, rules=None):
+    """`name_flags` columns and `positive_rank` for a Series of sample names."""
+    rules = rules or SAMPLE_CLASS_RULES
+    codes, names = _factorize_text(name_series)
+    classes = pd.DataFrame(index=name_series.index)
+    for column, pattern in rules["name_flags"].items():
+        classes[column] = _contains(names, pattern)[codes]
+    classes["positive_rank"] = _first_match(names, rules["positive_order"])[codes]
+    return classes
+
+
+def classify_samples(df, rules=None):
+    """Classification columns (`SAMPLE_CLASS_COLUMNS`) for rows with `Sample Name`/`Sample Type`.
+
+    Each distinct name and type is matched once, so replicate rows and
+    repeated sample types cost a lookup instead of another substring scan.
+    """
+    rules = rules or SAMPLE_CLASS_RULES
+    classes = classify_names(df["Sample Name"], rules)
+    codes, types = _factorize_text(df["Sample Type"])
+    classes["type_rank"] = _first_match(types, rules["type_order"])[codes]
+    # Independent masks, as in the original per-role `str.contains` checks.
+    for role in SAMPLE_ROLES:
+        classes[f"is_{role}"] = _contains(types, rules["roles"][role])[codes]
+    return classes[list(SAMPLE_CLASS_COLUMNS)]
+
+
+def control_mask(classes):
+    """Rows whose `Sample Type` matches any control role (`CONTROL_ROLES`), as a NumPy mask."""
+    return np.logical_or.reduce([classes[f"is_{role}"].to_numpy(dtype=bool) for role in CONTROL_ROLES])
+
+
+def add_sample_classes(plot_data, rules=None):
+    """Copy of `plot_data` with the classification columns appended (see `classify_samples`)."""
+    classes = classify_samples(plot_data, rules)
+    return pd.concat([plot_data.drop(columns=list(SAMPLE_CLASS_COLUMNS), errors="ignore"), classes], axis=1)
+
+
+def sample_classes(plot_data):
+    """Classification columns of `plot_data`, computed on the fly when not already present."""
+    if all(column in plot_data.columns for column in SAMPLE_CLASS_COLUMNS):
+        return plot_data[list(SAMPLE_CLASS_COLUMNS)]
+    return classify_samples(plot_data)
+
+
+def _mock_marker_mask(name_series, rules=None):
+    """Rows named like mock His/FLAG controls (see `calculate_mock_expression_threshold`)."""
+    flags = (rules or SAMPLE_CLASS_RULES)["name_flags"]
+    codes, names = _factorize_text(name_series)
+    mask = _contains(names, flags["is_mock"]).copy()
+    # Only mock names need the marker scans.
+    mock_names = names[mask]
+    mask[mask] = _contains(mock_names, flags["is_his"]) | _contains(mock_names, flags["is_flag"])
+    return pd.Series(mask[codes], index=name_series.index)
+
+
+def expression_totals_by_name(df, expression_col):
+    """Per distinct `Sample Name` / `True Sample Name`: expression sum, non-null count, and rows."""
+    expression = pd.to_numeric(df[expression_col], errors="coerce")
+    totals = {}
+    for name_col in ("Sample Name", "True Sample Name"):
+        if name_col not in df.columns:
+            continue
+        grouped = expression.groupby(df[name_col].astype(str), sort=False, dropna=False)
+        totals[name_col] = pd.DataFrame(
+            {"sum": grouped.sum(), "count": grouped.count(), "rows": grouped.size()}
+        )
+    return totals
+
+
+def merge_expression_totals(totals, other):
+    """Add two `expression_totals_by_name` results (e.g. from consecutive chunks)."""
+    merged = dict(totals)
+    for name_col, frame in other.items():
+        merged[name_col] = frame if name_col not in totals else totals[name_col].add(frame, fill_value=0)
+    return merged
+
+
+def mock_expression_threshold_from_totals(totals, rules=None):
+    """`calculate_mock_expression_threshold` from per-name totals (streamed runs).
+
+    Names in `Sample Name` are used unless none of them is a mock marker,
+    in which case `True Sample Name` is used instead.
+    """
+    selected = None
+    for name_col in ("Sample Name", "True Sample Name"):
+        if name_col not in totals:
+            continue
+        frame = totals[name_col]
+        selected = frame[_mock_marker_mask(pd.Series(frame.index, index=frame.index), rules)]
+        if selected["rows"].sum() > 0:
+            break
+    if selected is None or selected["count"].sum() == 0:
+        raise ValueError(
+            "Could not compute mock expression threshold because no valid mock_His/mock_FLAG "
+            "expression values were found."
+        )
+    return float(selected["sum"].sum() / selected["count"].sum()) * 2.0
+
+
+def calculate_mock_expression_threshold(df, target_cols, rules=None):
     """Compute expression threshold: 2x mean of mock_His/mock_FLAG expression."""
     expression_col = target_cols["mirfp_expression"]
     expression_values = pd.to_numeric(df[expression_col], errors="coerce")
 
-    def build_mock_mask(name_series):
-        # Case-insensitive marker filter requested by user.
-        return (
-            name_series.str.contains("mock", case=False, na=False)
-            & (
-                name_series.str.contains("his", case=False, na=False)
-                | name_series.str.contains("flag", case=False, na=False)
-            )
-        )
-
     # Fallback to True Sample Name if mock markers are absent in raw Sample Name.
-    mock_with_marker_mask = build_mock_mask(df["Sample Name"].astype(str))
+    mock_with_marker_mask = _mock_marker_mask(df["Sample Name"], rules)
     if not mock_with_marker_mask.any() and "True Sample Name" in df.columns:
-        mock_with_marker_mask = build_mock_mask(df["True Sample Name"].astype(str))
+        mock_with_marker_mask = _mock_marker_mask(df["True Sample Name"], rules)
 
     mock_marker_mean = expression_values[mock_with_marker_mask].mean()
     if pd.isna(mock_marker_mean):
@@ -327,11 +1092,8 @@ def calculate_mock_expression_threshold(df, target_cols):
 
 def calculate_percent_parent_threshold(plot_data):
     """Compute 2x threshold from strongest non-mock FLAG %Parent control group."""
-    sample_names = plot_data["Sample Name"].astype(str)
-    flag_non_mock = plot_data[
-        sample_names.str.contains("flag", case=False, na=False)
-        & ~sample_names.str.contains("mock", case=False, na=False)
-    ]
+    classes = sample_classes(plot_data)
+    flag_non_mock = plot_data[(classes["is_flag"] & ~classes["is_mock"]).to_numpy()]
     if flag_non_mock.empty:
         return None
 
@@ -351,8 +1113,7 @@ def calculate_percent_parent_plot_threshold(plot_data):
     if flag_threshold is not None:
         return flag_threshold
 
-    sample_names = plot_data["Sample Name"].astype(str)
-    mock_rows = plot_data[sample_names.str.contains("mock", case=False, na=False)]
+    mock_rows = plot_data[sample_classes(plot_data)["is_mock"].to_numpy()]
     if mock_rows.empty:
         return None
 
@@ -366,108 +1127,453 @@ def calculate_percent_parent_plot_threshold(plot_data):
     return float(mock_group_means.iloc[0]) * 2.0
 
 
-def build_plot_data(df, target_cols):
-    """Aggregate replicate-level rows into sample-level means and SEMs."""
-    grouped = (
-        df.groupby(["True Sample Name", "Sample Type"], sort=False)
-        .agg(
-            {
-                target_cols["percent_parent"]: ["mean", get_sem],
-                target_cols["mfi_ratio"]: ["mean", get_sem],
-                target_cols["mfi_af488"]: ["mean", get_sem],
-                target_cols["mirfp_expression"]: ["mean", get_sem],
-            }
-        )
-        .reset_index()
-    )
-    # Flatten MultiIndex columns created by grouped aggregation.
-    grouped.columns = [
-        "Sample Name",
-        "Sample Type",
-        "percent_parent_mean",
-        "percent_parent_sem",
-        "mfi_ratio_mean",
-        "mfi_ratio_sem",
-        "mfi_af488_mean",
-        "mfi_af488_sem",
-        "mirfp_expression_mean",
-        "mirfp_expression_sem",
-    ]
-    return grouped
+GROUPED_STATS = ("mean", "std", "count", "size", "sem", "median", "cv")
+PLOT_METRIC_KEYS = ("percent_parent", "mfi_ratio", "mfi_af488", "mirfp_expression")
 
 
-def build_figure_data(plot_data):
-    """Filter/sort rows used for all figures to keep ordering consistent."""
-    # Figures omit mock rows by requirement, while tables keep them.
-    figure_data = plot_data[
-        ~plot_data["Sample Name"].astype(str).str.contains("mock", case=False, na=False)
-    ].copy()
+def metric_values_float64(df, group_cols, cols):
+    """`df[group_cols + cols]` with the `cols` metrics as float64, float32 ones restored to their decimals.
 
-    # Experimental bars are globally ordered by percent_parent_mean and reused across all plots.
-    experimental_order = (
-        figure_data[
-            figure_data["Sample Type"].astype(str).str.contains(
-                "experimental", case=False, na=False
-            )
-        ]
-        .sort_values("percent_parent_mean", ascending=True)["Sample Name"]
-        .tolist()
-    )
-    experimental_rank = {name: idx for idx, name in enumerate(experimental_order)}
+    Pruned loading stores metrics as float32; a plain upcast keeps float32's
+    binary error (0.1 becomes 0.10000000149), which moves means that sit on
+    a rounding boundary. Each distinct float32 value is instead re-read from
+    its shortest decimal form, which is the CSV text for values with up to
+    ~7 significant digits, so statistics match a float64 load.
+    """
+    values = df[list(group_cols) + list(cols)].copy()
+    for col in cols:
+        if values[col].dtype == np.float32:
+            uniques, inverse = np.unique(values[col].to_numpy(), return_inverse=True)
+            values[col] = uniques.astype(str).astype(np.float64)[inverse]
+        else:
+            values[col] = values[col].astype(np.float64)
+    return values
 
-    figure_data["sample_type_rank"] = figure_data["Sample Type"].apply(_sample_type_rank)
-    figure_data["positive_rank"] = figure_data["Sample Name"].apply(_positive_control_rank)
-    figure_data["experimental_rank"] = (
-        figure_data["Sample Name"].map(experimental_rank).fillna(-1)
-    )
 
-    return figure_data.sort_values(
-        by=["sample_type_rank", "positive_rank", "experimental_rank", "Sample Name"],
-        ascending=[True, True, True, True],
-    ).drop(columns=["sample_type_rank", "positive_rank", "experimental_rank"])
+def grouped_stats(df, group_cols, value_cols, stats=("mean", "sem")):
+    """Grouped descriptive statistics for many columns in one vectorized pass.
 
+    `value_cols` maps output prefixes to source columns; the result has the
+    group columns followed by flattened `<prefix>_<stat>` columns. Every stat
+    uses pandas' cythonized groupby reductions (no Python callback per group):
+    - `mean`, `std` (ddof=1), `median`, `count` (non-null values), `size` (rows).
+    - `sem` matches `get_sem`: `std / sqrt(size)` and 0 for singleton groups.
+    - `cv` is `std / mean`.
+    """
+    unknown = [stat for stat in stats if stat not in GROUPED_STATS]
+    if unknown:
+        raise ValueError(f"Unsupported grouped statistics: {', '.join(unknown)}")
 
-def draw_metric_plot(
-    ax,
-    figure_data,
-    metric_cfg,
-    mock_expression_threshold,
-    percent_parent_threshold,
-):
-    """Render one bar chart (mean ± SEM) with requested styling and thresholds."""
-    metric_id = metric_cfg["metric_id"]
-    x_positions = np.arange(len(figure_data))
-    means = figure_data[f"{metric_id}_mean"].to_numpy()
-    sems = figure_data[f"{metric_id}_sem"].to_numpy()
-    bar_colors = [COLOR_MAP.get(st, "#B0B0B0") for st in figure_data["Sample Type"]]
-
-    # Explicit bar + yerr keeps data-to-bar mapping deterministic.
-    bars = ax.bar(
-        x_positions,
-        means,
-        yerr=sems,
-        capsize=3,
-        color=bar_colors,
-        edgecolor="black",
-        linewidth=0.5,
-        zorder=3,
-    )
-
-    ax.set_title(metric_cfg["title"])
-    ax.set_xticks(x_positions)
-    ax.set_xticklabels(figure_data["Sample Name"], rotation=45, ha="right", fontsize=8)
-    ax.set_ylabel(metric_cfg["y_label"])
-    ax.set_xlabel("Sample Name")
+    source_cols = list(dict.fromkeys(value_cols.values()))
+    values = metric_values_float64(df, group_cols, source_cols)
+    grouped = values.groupby(list(group_cols), sort=False, observed=True)[source_cols]
 
-    # Scale axis with headroom; ensure threshold line fits on mirfp expression plot.
+    computed = {}
+
+    def stat_frame(stat):
+        if stat not in computed:
+            if stat == "size":
+                sizes = grouped.size()
+                computed[stat] = pd.DataFrame({col: sizes for col in source_cols})
+            elif stat == "sem":
+                sizes = stat_frame("size")
+                sem = stat_frame("std") / np.sqrt(sizes)
+                computed[stat] = sem.mask(sizes <= 1, 0.0)
+            elif stat == "cv":
+                computed[stat] = stat_frame("std") / stat_frame("mean")
+            else:
+                computed[stat] = getattr(grouped, stat)()
+        return computed[stat]
+
+    columns = {}
+    for prefix, source_col in value_cols.items():
+        for stat in stats:
+            columns[f"{prefix}_{stat}"] = stat_frame(stat)[source_col]
+    result = pd.DataFrame(columns).reset_index()
+    # Categorical keys group faster, but downstream code expects plain labels.
+    for col in group_cols:
+        if isinstance(result[col].dtype, pd.CategoricalDtype):
+            result[col] = result[col].astype(object)
+    return result
+
+
+def build_plot_data(
+    df,
+    target_cols,
+    extra_stats=(),
+    accumulator_store=None,
+    source_id=None,
+    output_dir=None,
+    columnar_format=None,
+):
+    """Aggregate replicate-level rows into sample-level means and SEMs.
+
+    `extra_stats` (e.g. `("median", "cv")`) appends further `<metric>_<stat>`
+    columns after the standard mean/SEM layout.
+
+    With an `AccumulatorStore`, this plate's per-sample accumulators replace
+    any earlier ones stored under `source_id`, and the statistics returned
+    pool replicates from every source in the store.
+
+    With `output_dir` and `columnar_format`, the result is also written to
+    `sample_stats.<format>` (see `write_columnar_table`).
+    """
+    value_cols = {key: target_cols[key] for key in PLOT_METRIC_KEYS}
+    if accumulator_store is not None:
+        accumulator = GroupedAccumulator(["True Sample Name", "Sample Type"], value_cols)
+        accumulator.update(df)
+        accumulator_store.set_source(source_id, accumulator)
+        plot_data = accumulator_store.plot_data(("mean", "sem", *extra_stats))
+    else:
+        plot_data = _aggregate_plot_data(df, value_cols, extra_stats)
+    if output_dir is not None and columnar_format:
+        write_sample_stats(plot_data, output_dir, columnar_format)
+    return plot_data
+
+
+def _aggregate_plot_data(df, value_cols, extra_stats):
+    """In-memory `build_plot_data` path: `grouped_stats` over the merged rows."""
+    grouped = grouped_stats(
+        df,
+        ["True Sample Name", "Sample Type"],
+        value_cols,
+        stats=("mean", "sem"),
+    )
+    # Flattened column layout expected downstream.
+    grouped = grouped.rename(columns={"True Sample Name": "Sample Name"})
+    if extra_stats:
+        extra = grouped_stats(df, ["True Sample Name", "Sample Type"], value_cols, stats=extra_stats)
+        grouped = pd.concat([grouped, extra.drop(columns=["True Sample Name", "Sample Type"])], axis=1)
+    return grouped
+
+
+class GroupedAccumulator:
+    """Running per-group size/count/sum/mean/M2 that absorbs a table chunk by chunk.
+
+    Each chunk is reduced with pandas' grouped kernels, then folded into the
+    running totals with Chan et al.'s pairwise update, so `result()` matches
+    `grouped_stats` on the concatenated chunks without materializing them.
+    The reported mean is `sum / count` from the same row-by-row Kahan sum
+    pandas' grouped mean uses, carried across chunks (`sum`, `sum_error`), so
+    it equals the in-memory mean exactly instead of drifting across a
+    rounding boundary; the running mean only feeds the M2 update.
+    Groups keep first-appearance order, like `groupby(sort=False)`.
+    """
+
+    STATS = ("mean", "std", "count", "size", "sem", "cv")
+
+    def __init__(self, group_cols, value_cols):
+        self.group_cols = list(group_cols)
+        self.value_cols = dict(value_cols)
+        self.source_cols = list(dict.fromkeys(self.value_cols.values()))
+        self.keys = []
+        self._positions = {}
+        n_cols = len(self.source_cols)
+        self.size = np.zeros(0)
+        self.count = np.zeros((0, n_cols))
+        self.sum = np.zeros((0, n_cols))
+        self.sum_error = np.zeros((0, n_cols))
+        self.mean = np.zeros((0, n_cols))
+        self.m2 = np.zeros((0, n_cols))
+
+    def _locate(self, keys):
+        """Row positions for group keys, appending unseen groups in order."""
+        positions = np.fromiter(
+            (self._positions.setdefault(key, len(self._positions)) for key in keys),
+            dtype=np.int64,
+            count=len(keys),
+        )
+        n_new = len(self._positions) - len(self.keys)
+        if n_new:
+            self.keys.extend(keys[i] for i in range(len(keys)) if positions[i] >= len(self.keys))
+            n_cols = len(self.source_cols)
+            self.size = np.concatenate([self.size, np.zeros(n_new)])
+            self.count = np.vstack([self.count, np.zeros((n_new, n_cols))])
+            self.sum = np.vstack([self.sum, np.zeros((n_new, n_cols))])
+            self.sum_error = np.vstack([self.sum_error, np.zeros((n_new, n_cols))])
+            self.mean = np.vstack([self.mean, np.zeros((n_new, n_cols))])
+            self.m2 = np.vstack([self.m2, np.zeros((n_new, n_cols))])
+        return positions
+
+    def update(self, df):
+        """Fold one chunk of rows into the running statistics."""
+        values = metric_values_float64(df, self.group_cols, self.source_cols)
+        by_group = values.groupby(self.group_cols, sort=False, observed=True)
+        grouped = by_group[self.source_cols]
+        count = grouped.count().to_numpy(dtype=np.float64)
+        mean = grouped.mean().to_numpy(dtype=np.float64)
+        m2 = np.nan_to_num(grouped.var(ddof=0).to_numpy(dtype=np.float64)) * count
+        size = grouped.size()
+        keys = list(size.index) if len(self.group_cols) > 1 else [(key,) for key in size.index]
+        positions = self.merge(keys, size.to_numpy(dtype=np.float64), count, mean, m2)
+
+        # Row-level Kahan sums in row order: step k adds every group's k-th row at once.
+        row_positions = positions[by_group.ngroup().to_numpy()]
+        within = by_group.cumcount().to_numpy()
+        order = np.argsort(within, kind="stable")
+        bounds = np.searchsorted(within[order], np.arange(within.max() + 2 if len(within) else 1))
+        row_values = values[self.source_cols].to_numpy(dtype=np.float64)
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            rows = order[start:stop]
+            self._add_to_sums(row_positions[rows], row_values[rows])
+
+    def _add_to_sums(self, positions, values):
+        """One Kahan step per group (`positions` unique), as in pandas' grouped mean; NaN skipped."""
+        total = self.sum[positions]
+        compensation = self.sum_error[positions]
+        y = values - compensation
+        t = total + y
+        with np.errstate(invalid="ignore"):
+            new_compensation = (t - total) - y
+        new_compensation[np.isnan(new_compensation)] = 0.0
+        present = ~np.isnan(values)
+        self.sum[positions] = np.where(present, t, total)
+        self.sum_error[positions] = np.where(present, new_compensation, compensation)
+
+    def merge(self, keys, size, count, mean, m2, total=None):
+        """Combine another partial result (aligned to `keys`) into this one; return their positions.
+
+        `total` is the partial result's per-group sum, added to the running
+        sums; `update` adds its rows itself.
+        """
+        positions = self._locate(keys)
+        if total is not None:
+            self._add_to_sums(positions, np.asarray(total, dtype=np.float64))
+        count_a = self.count[positions]
+        mean_a = self.mean[positions]
+        mean_b = np.nan_to_num(mean)
+        total = count_a + count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weight_b = np.where(total > 0, count / total, 0.0)
+            delta = mean_b - mean_a
+            self.mean[positions] = mean_a + delta * weight_b
+            self.m2[positions] = self.m2[positions] + m2 + delta**2 * count_a * weight_b
+        self.count[positions] = total
+        self.size[positions] += size
+        return positions
+
+    def result(self, stats=("mean", "sem")):
+        """Statistics in `grouped_stats` layout: group columns, then `<prefix>_<stat>`."""
+        unknown = [stat for stat in stats if stat not in self.STATS]
+        if unknown:
+            raise ValueError(
+                f"Statistics not available from a streamed accumulator: {', '.join(unknown)}. "
+                f"Supported: {', '.join(self.STATS)}"
+            )
+        if not self.keys:
+            raise ValueError("No rows were accumulated")
+        sizes = np.repeat(self.size[:, None], len(self.source_cols), axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(self.count > 0, self.sum / self.count, np.nan)
+            std = np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+            computed = {
+                "mean": mean,
+                "std": std,
+                "count": self.count.astype(np.int64),
+                "size": sizes.astype(np.int64),
+                "sem": np.where(sizes <= 1, 0.0, std / np.sqrt(sizes)),
+                "cv": std / mean,
+            }
+        result = pd.DataFrame(self.keys, columns=self.group_cols)
+        for prefix, source_col in self.value_cols.items():
+            col_idx = self.source_cols.index(source_col)
+            for stat in stats:
+                result[f"{prefix}_{stat}"] = computed[stat][:, col_idx]
+        return result
+
+
+ACCUMULATOR_STORE_VERSION = 2
+
+
+class AccumulatorStore:
+    """Persisted, mergeable per-sample accumulators (size, count, sum, mean, M2) per metric.
+
+    Each source (normally one plate folder) keeps its own partial
+    accumulators, so re-analyzing a plate replaces its contribution instead
+    of double-counting it, and pooled statistics never need earlier plates'
+    rows. Pooled SEM follows `get_sem`: sample std (ddof=1) of the non-null
+    replicates over sqrt(replicate rows), and 0 for single-replicate samples.
+    Metrics are keyed by `PLOT_METRIC_KEYS` prefix, so plates may name their
+    FlowJo columns differently.
+    """
+
+    GROUP_COLS = ("True Sample Name", "Sample Type")
+
+    def __init__(self, path=None, metrics=PLOT_METRIC_KEYS):
+        self.path = path
+        self.metrics = list(metrics)
+        self.sources = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                stored = json.load(f)
+            if stored.get("version") == 1:
+                # Version 1 stores had no sums; `combined` rebuilds them from mean * count.
+                stored["version"] = ACCUMULATOR_STORE_VERSION
+            if stored.get("version") != ACCUMULATOR_STORE_VERSION or stored.get("metrics") != self.metrics:
+                raise ValueError(
+                    f"Accumulator store {path} has version {stored.get('version')} / metrics "
+                    f"{stored.get('metrics')}; expected version {ACCUMULATOR_STORE_VERSION} / {self.metrics}. "
+                    "Use a new store path."
+                )
+            self.sources = stored["sources"]
+
+    def set_source(self, source_id, accumulator, label=None):
+        """Store (or replace) one source's partial accumulators."""
+        if source_id is None:
+            raise ValueError("A source_id is required to update an accumulator store")
+        col_idx = [accumulator.source_cols.index(accumulator.value_cols[prefix]) for prefix in self.metrics]
+        self.sources[source_id] = {
+            "label": label or source_id,
+            "groups": [list(key) for key in accumulator.keys],
+            "size": accumulator.size.tolist(),
+            "count": accumulator.count[:, col_idx].tolist(),
+            "sum": accumulator.sum[:, col_idx].tolist(),
+            "mean": accumulator.mean[:, col_idx].tolist(),
+            "m2": accumulator.m2[:, col_idx].tolist(),
+        }
+
+    def remove_source(self, source_id):
+        self.sources.pop(source_id, None)
+
+    def fingerprint(self, exclude=None):
+        """SHA-256 of every source's contribution except `exclude`."""
+        others = {key: value for key, value in self.sources.items() if key != exclude}
+        return hashlib.sha256(json.dumps(others, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def source_fingerprint(self, source_id):
+        """SHA-256 of one source's contribution; None when the store has none."""
+        if source_id not in self.sources:
+            return None
+        return hashlib.sha256(json.dumps(self.sources[source_id], sort_keys=True).encode("utf-8")).hexdigest()
+
+    def combined(self):
+        """One `GroupedAccumulator` pooling all sources (insertion order)."""
+        accumulator = GroupedAccumulator(self.GROUP_COLS, {prefix: prefix for prefix in self.metrics})
+        for source in self.sources.values():
+            if not source["groups"]:
+                continue
+            accumulator.merge(
+                [tuple(key) for key in source["groups"]],
+                np.asarray(source["size"], dtype=np.float64),
+                np.asarray(source["count"], dtype=np.float64),
+                np.asarray(source["mean"], dtype=np.float64),
+                np.asarray(source["m2"], dtype=np.float64),
+                np.asarray(
+                    source["sum"] if "sum" in source else np.nan_to_num(source["mean"]) * source["count"],
+                    dtype=np.float64,
+                ),
+            )
+        return accumulator
+
+    def plot_data(self, stats=("mean", "sem")):
+        """Pooled sample-level statistics in `build_plot_data` layout."""
+        return self.combined().result(stats).rename(columns={"True Sample Name": "Sample Name"})
+
+    def save(self):
+        payload = {"version": ACCUMULATOR_STORE_VERSION, "metrics": self.metrics, "sources": self.sources}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self.path)
+
+
+@contextlib.contextmanager
+def locked_accumulator_store(path):
+    """Load, yield, and save an `AccumulatorStore` under an exclusive file lock.
+
+    The lock (`<path>.lock`, POSIX `flock`) keeps parallel batch workers
+    from overwriting each other's updates; it is skipped where unavailable.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    with open(f"{path}.lock", "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        store = AccumulatorStore(path)
+        yield store
+        store.save()
+
+
+def build_figure_data(plot_data):
+    """Filter/sort rows used for all figures to keep ordering consistent."""
+    classes = sample_classes(plot_data)
+    # Figures omit mock rows by requirement, while tables keep them.
+    keep = ~classes["is_mock"].to_numpy()
+    figure_data = plot_data[keep].copy()
+    classes = classes[keep]
+
+    # Experimental bars are globally ordered by percent_parent_mean and reused across all plots.
+    experimental_order = (
+        figure_data[classes["is_experimental"].to_numpy(dtype=bool)]
+        .sort_values("percent_parent_mean", ascending=True)["Sample Name"]
+        .tolist()
+    )
+    experimental_rank = {name: idx for idx, name in enumerate(experimental_order)}
+
+    figure_data["sample_type_rank"] = classes["type_rank"].to_numpy()
+    figure_data["positive_rank"] = classes["positive_rank"].to_numpy()
+    figure_data["experimental_rank"] = (
+        figure_data["Sample Name"].map(experimental_rank).fillna(-1)
+    )
+
+    return figure_data.sort_values(
+        by=["sample_type_rank", "positive_rank", "experimental_rank", "Sample Name"],
+        ascending=[True, True, True, True],
+    ).drop(columns=["sample_type_rank", "positive_rank", "experimental_rank"])
+
+
+# Large-library figures. "auto" keeps one bar per sample up to `large_library_threshold`
+# figure samples and switches to a single ranked plot above it; "paged" splits the bar
+# chart into pages of `bars_per_page` samples sharing one y scale.
+FIGURE_MODES = ("auto", "bars", "paged", "rank")
+FIGURE_OPTION_DEFAULTS = {
+    "figure_mode": "auto",
+    "large_library_threshold": 200,
+    "bars_per_page": 60,
+    "label_top_k": 10,
+}
+FIGURE_OPTION_KEYS = tuple(FIGURE_OPTION_DEFAULTS)
+
+
+def resolve_figure_options(options=None):
+    """Fill figure options from `FIGURE_OPTION_DEFAULTS` and validate them."""
+    options = {**FIGURE_OPTION_DEFAULTS, **{k: v for k, v in (options or {}).items() if v is not None}}
+    if options["figure_mode"] not in FIGURE_MODES:
+        raise ValueError(
+            f"Unsupported figure_mode {options['figure_mode']!r}; expected one of: {', '.join(FIGURE_MODES)}"
+        )
+    for key in ("large_library_threshold", "bars_per_page"):
+        if int(options[key]) < 1:
+            raise ValueError(f"{key} must be a positive integer, got {options[key]!r}")
+    if int(options["label_top_k"]) < 0:
+        raise ValueError(f"label_top_k must be >= 0, got {options['label_top_k']!r}")
+    return options
+
+
+def resolve_figure_mode(n_samples, figure_options=None):
+    """Concrete figure mode ("bars", "paged" or "rank") for `n_samples` figure rows."""
+    options = resolve_figure_options(figure_options)
+    mode = options["figure_mode"]
+    if mode == "auto":
+        return "rank" if n_samples > options["large_library_threshold"] else "bars"
+    if mode == "paged" and n_samples <= options["bars_per_page"]:
+        return "bars"
+    return mode
+
+
+def metric_y_max(figure_data, metric_cfg, mock_expression_threshold):
+    """Upper data bound for a metric axis (the expression threshold must stay visible)."""
+    means = figure_data[f"{metric_cfg['metric_id']}_mean"].to_numpy()
     y_max = float(np.nanmax(means)) if len(means) else 0.0
-    if metric_id == "mirfp_expression":
+    if metric_cfg["metric_id"] == "mirfp_expression":
         y_max = max(y_max, float(mock_expression_threshold))
-    ax.set_ylim(0, (y_max * 1.3) if y_max > 0 else 1.0)
-    ax.set_axisbelow(True)
-    ax.yaxis.grid(True, linestyle="--", linewidth=0.25, color="gray", alpha=0.7, which="major")
+    return y_max
+
 
-    # Draw requested threshold reference lines.
+def _draw_threshold_lines(ax, metric_id, mock_expression_threshold, percent_parent_threshold):
+    """Dashed red reference lines for the %Parent and expression thresholds."""
     if metric_id == "percent_parent" and percent_parent_threshold is not None:
         ax.axhline(
             y=percent_parent_threshold,
@@ -485,23 +1591,115 @@ def draw_metric_plot(
             zorder=2,
         )
 
-    # Compose legend only for sample types present in the filtered figure data.
+
+def _sample_type_legend(figure_data):
+    """Legend patches for the sample types present in the figure data."""
     legend_order = ["Negative Control", "Positive Control", "Experimental Sample"]
     present_types = figure_data["Sample Type"].dropna().astype(str).unique().tolist()
-    legend_handles = [
+    return [
         Patch(facecolor=COLOR_MAP[sample_type], edgecolor="black", label=sample_type)
         for sample_type in legend_order
         if sample_type in present_types
     ]
 
-    # Hatch insufficient-expression bars and add legend entry when applicable.
-    if metric_id == "mirfp_expression":
-        has_hatched = False
-        for bar, mean_value in zip(bars, means):
-            if float(mean_value) < float(mock_expression_threshold):
-                bar.set_hatch("//")
-                has_hatched = True
-        if has_hatched:
+
+class BarChartAxes:
+    """Bar chart (mean ± SEM) for a fixed sample order, redrawn per metric.
+
+    Bars, tick labels, grid and the threshold line are created once on `ax`;
+    `show_metric` only updates bar heights, error bars, hatching, the
+    threshold line, title, y axis and legend. Every metric figure shares the
+    sample order from `build_figure_data`, so one instance serves them all.
+    """
+
+    def __init__(self, ax, figure_data):
+        self.ax = ax
+        self.figure_data = figure_data
+        self.x_positions = np.arange(len(figure_data))
+        bar_colors = [COLOR_MAP.get(st, "#B0B0B0") for st in figure_data["Sample Type"]]
+        zeros = np.zeros(len(figure_data))
+
+        # Explicit bar + yerr keeps data-to-bar mapping deterministic.
+        self.bars = ax.bar(
+            self.x_positions,
+            zeros,
+            yerr=zeros,
+            capsize=3,
+            color=bar_colors,
+            edgecolor="black",
+            linewidth=0.5,
+            zorder=3,
+        )
+        _data_line, self.caplines, (self.error_lines,) = self.bars.errorbar.lines
+        self.hatched = np.zeros(len(figure_data), dtype=bool)
+
+        ax.set_xticks(self.x_positions)
+        ax.set_xticklabels(figure_data["Sample Name"], rotation=45, ha="right", fontsize=8)
+        ax.set_xlabel("Sample Name")
+        ax.set_axisbelow(True)
+        ax.yaxis.grid(True, linestyle="--", linewidth=0.25, color="gray", alpha=0.7, which="major")
+
+        # Only %Parent and expression figures have a reference line, so one line serves both.
+        self.threshold_line = ax.axhline(
+            y=0,
+            color="red",
+            linestyle="--",
+            linewidth=1.0,
+            zorder=2,
+            visible=False,
+        )
+        # Legend entries only for sample types present in the filtered figure data.
+        self.type_legend = _sample_type_legend(figure_data)
+
+    def show_metric(
+        self,
+        metric_cfg,
+        mock_expression_threshold,
+        percent_parent_threshold,
+        y_max=None,
+        title=None,
+    ):
+        """Point the chart at one metric; see `draw_metric_plot` for the arguments."""
+        ax = self.ax
+        metric_id = metric_cfg["metric_id"]
+        means = self.figure_data[f"{metric_id}_mean"].to_numpy(dtype=float)
+        sems = self.figure_data[f"{metric_id}_sem"].to_numpy(dtype=float)
+
+        for bar, mean_value in zip(self.bars, means):
+            bar.set_height(mean_value)
+        lower, upper = means - sems, means + sems
+        self.error_lines.set_segments(
+            np.stack([np.column_stack([self.x_positions, lower]), np.column_stack([self.x_positions, upper])], axis=1)
+        )
+        self.caplines[0].set_data(self.x_positions, lower)
+        self.caplines[1].set_data(self.x_positions, upper)
+
+        ax.set_title(title or metric_cfg["title"])
+        ax.set_ylabel(metric_cfg["y_label"])
+        # Scale axis with headroom; ensure threshold line fits on mirfp expression plot.
+        if y_max is None:
+            y_max = metric_y_max(self.figure_data, metric_cfg, mock_expression_threshold)
+        ax.set_ylim(0, (y_max * 1.3) if y_max > 0 else 1.0)
+
+        # Draw requested threshold reference line.
+        threshold = {
+            "percent_parent": percent_parent_threshold,
+            "mirfp_expression": mock_expression_threshold,
+        }.get(metric_id)
+        self.threshold_line.set_visible(threshold is not None)
+        if threshold is not None:
+            self.threshold_line.set_ydata([threshold, threshold])
+
+        # Hatch insufficient-expression bars; only bars whose state changes are touched.
+        hatched = np.zeros(len(means), dtype=bool)
+        if metric_id == "mirfp_expression":
+            hatched = means < float(mock_expression_threshold)
+        for idx in np.flatnonzero(hatched != self.hatched):
+            self.bars[idx].set_hatch("//" if hatched[idx] else None)
+        self.hatched = hatched
+
+        legend_handles = list(self.type_legend)
+        if hatched.any():
             legend_handles.append(
                 Patch(
                     facecolor="white",
@@ -510,209 +1708,2626 @@ def draw_metric_plot(
                     label="Insufficient Expression",
                 )
             )
+        legend = ax.get_legend()
+        if legend is not None:
+            legend.remove()
+        if legend_handles:
+            ax.legend(handles=legend_handles, title="Sample Type", loc="upper right")
+
+
+def draw_metric_plot(
+    ax,
+    figure_data,
+    metric_cfg,
+    mock_expression_threshold,
+    percent_parent_threshold,
+    y_max=None,
+    title=None,
+):
+    """Render one bar chart (mean ± SEM) with requested styling and thresholds.
+
+    `y_max` overrides the data bound used for the y limit (paged figures
+    share one scale); `title` overrides the metric title. Returns the
+    `BarChartAxes`, which can be pointed at further metrics.
+    """
+    chart = BarChartAxes(ax, figure_data)
+    chart.show_metric(metric_cfg, mock_expression_threshold, percent_parent_threshold, y_max, title)
+    return chart
+
+
+def draw_rank_plot(
+    ax,
+    figure_data,
+    metric_cfg,
+    mock_expression_threshold,
+    percent_parent_threshold,
+    label_top_k=FIGURE_OPTION_DEFAULTS["label_top_k"],
+):
+    """Render one ranked dot/line plot (mean ± SEM band) for large libraries.
+
+    Samples are ranked by the metric mean (highest first). Markers, the
+    connecting line and the SEM band are rasterized, so drawing cost does
+    not depend on per-sample vector artists; only controls and the top
+    `label_top_k` experimental samples get text labels.
+    """
+    metric_id = metric_cfg["metric_id"]
+    means = figure_data[f"{metric_id}_mean"].to_numpy(dtype=float)
+    # Stable sort with NaN means last keeps ties in figure order.
+    order = np.argsort(-np.nan_to_num(means, nan=-np.inf), kind="stable")
+    ranked = figure_data.iloc[order]
+    means = means[order]
+    sems = np.nan_to_num(ranked[f"{metric_id}_sem"].to_numpy(dtype=float))
+    ranks = np.arange(1, len(ranked) + 1)
+    sample_types = ranked["Sample Type"].astype(str)
+    colors = sample_types.map(COLOR_MAP).fillna("#B0B0B0").to_numpy()
+    is_control = control_mask(sample_classes(ranked))
+
+    ax.fill_between(ranks, means - sems, means + sems, color="gray", alpha=0.3, linewidth=0, rasterized=True)
+    ax.plot(ranks, means, color="gray", linewidth=0.6, zorder=2, rasterized=True)
+
+    legend_handles = _sample_type_legend(figure_data)
+    # Insufficient-expression samples are drawn hollow (the bar chart's hatching).
+    hollow = np.zeros(len(ranked), dtype=bool)
+    if metric_id == "mirfp_expression":
+        hollow = means < float(mock_expression_threshold)
+        if hollow.any():
+            legend_handles.append(
+                Patch(facecolor="white", edgecolor="black", label="Insufficient Expression")
+            )
+    marker_size = np.where(is_control, 36.0, 10.0)
+    filled = ~hollow
+    ax.scatter(
+        ranks[filled], means[filled], s=marker_size[filled], c=colors[filled],
+        edgecolors="black", linewidths=0.2, zorder=3, rasterized=True,
+    )
+    ax.scatter(
+        ranks[hollow], means[hollow], s=marker_size[hollow], facecolors="none",
+        edgecolors=colors[hollow], linewidths=0.6, zorder=3, rasterized=True,
+    )
+
+    names = ranked["Sample Name"].astype(str).to_numpy()
+    for idx in np.flatnonzero(is_control & np.isfinite(means)):
+        ax.annotate(
+            names[idx],
+            (ranks[idx], means[idx]),
+            xytext=(4, 4),
+            textcoords="offset points",
+            rotation=30,
+            fontsize=7,
+        )
+    # Top-ranked samples sit next to each other, so their labels form a column with leader lines.
+    experimental = np.flatnonzero((roles == "experimental") & np.isfinite(means))[: int(label_top_k)]
+    for step, idx in enumerate(experimental):
+        ax.annotate(
+            names[idx],
+            (ranks[idx], means[idx]),
+            xytext=(0.08, 0.95 - 0.045 * step),
+            textcoords="axes fraction",
+            fontsize=7,
+            va="center",
+            arrowprops={"arrowstyle": "-", "color": "gray", "linewidth": 0.4},
+        )
 
+    ax.set_title(f"{metric_cfg['title']} (ranked, n={len(ranked)})")
+    ax.set_xlabel("Rank (highest mean first)")
+    ax.set_ylabel(metric_cfg["y_label"])
+    ax.set_xlim(0, len(ranked) + 1)
+    y_max = metric_y_max(figure_data, metric_cfg, mock_expression_threshold)
+    ax.set_ylim(0, (y_max * 1.3) if y_max > 0 else 1.0)
+    ax.set_axisbelow(True)
+    ax.yaxis.grid(True, linestyle="--", linewidth=0.25, color="gray", alpha=0.7, which="major")
+    _draw_threshold_lines(ax, metric_id, mock_expression_threshold, percent_parent_threshold)
     if legend_handles:
         ax.legend(handles=legend_handles, title="Sample Type", loc="upper right")
 
 
-def generate_plots(df, target_cols, output_dir, mock_expression_threshold, export_png=False):
-    """Generate and save all figures; return filenames + aggregated plot dataset."""
-    # Retained for CLI compatibility; this script always exports PNGs.
-    del export_png
-    validate_target_columns(target_cols, df.columns)
-
-    # Shared sample ordering across all metrics prevents visual reordering confusion.
-    plot_data = build_plot_data(df, target_cols)
-    figure_data = build_figure_data(plot_data)
-    percent_parent_threshold = calculate_percent_parent_plot_threshold(plot_data)
+def build_metric_figure(
+    figure_data,
+    metric_cfg,
+    mock_expression_threshold,
+    percent_parent_threshold,
+    figure_mode="bars",
+    label_top_k=FIGURE_OPTION_DEFAULTS["label_top_k"],
+    y_max=None,
+    title=None,
+):
+    """Draw one metric figure in memory and return it.
 
-    # Iterate metric configuration so title/axis/file naming stays centralized.
-    plot_files = []
-    for metric_cfg in METRIC_CONFIGS:
-        fig, ax = plt.subplots(figsize=(14, 7))
+    Uses a standalone Agg `Figure` rather than pyplot, so figures can be
+    rendered concurrently without sharing pyplot's global figure registry.
+    `figure_mode` is "bars" (one bar per row of `figure_data`) or "rank".
+    """
+    fig = Figure(figsize=(14, 7))
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    if figure_mode == "rank":
+        draw_rank_plot(
+            ax,
+            figure_data,
+            metric_cfg,
+            mock_expression_threshold,
+            percent_parent_threshold,
+            label_top_k,
+        )
+    else:
         draw_metric_plot(
             ax,
             figure_data,
             metric_cfg,
             mock_expression_threshold,
             percent_parent_threshold,
+            y_max,
+            title,
         )
-        fig.tight_layout()
+    fig.tight_layout()
+    return fig
 
-        filename = os.path.join(output_dir, metric_cfg["filename"])
-        fig.savefig(filename, dpi=150, bbox_inches="tight")
-        print(f"Exported {filename}")
-        plt.close(fig)
 
-        plot_files.append((metric_cfg["title"], metric_cfg["filename"]))
+def page_filename(filename, page):
+    """Filename of bar-chart page `page` (1-based); page 1 keeps the metric filename."""
+    if page == 1:
+        return filename
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}_page{page}{ext}"
 
-    return plot_files, plot_data, percent_parent_threshold
 
+def figure_pages(figure_data, metric_cfg, figure_options=None):
+    """Split figure rows into bar-chart pages: list of (title, filename, rows)."""
+    options = resolve_figure_options(figure_options)
+    if resolve_figure_mode(len(figure_data), options) != "paged":
+        return [(metric_cfg["title"], metric_cfg["filename"], figure_data)]
+    per_page = int(options["bars_per_page"])
+    n_pages = -(-len(figure_data) // per_page)
+    return [
+        (
+            f"{metric_cfg['title']} (page {page}/{n_pages})",
+            page_filename(metric_cfg["filename"], page),
+            figure_data.iloc[(page - 1) * per_page : page * per_page],
+        )
+        for page in range(1, n_pages + 1)
+    ]
 
-def _format_sample_list(sample_names):
-    """Human-readable sample list for markdown bullet points."""
-    return ", ".join(sample_names) if sample_names else "None"
 
+class MetricFigureTemplate:
+    """Bar-chart figure built once per plate (or page) and saved once per metric.
 
-def generate_report(
-    plot_data,
-    plot_files,
-    target_cols,
+    The axes, bars and tick labels are created once; each metric only
+    updates the data-dependent artists (see `BarChartAxes`) before saving,
+    which skips figure construction and tick-label creation for every
+    further metric. `tight_layout` is recomputed only when the margins it
+    derives can change (see `_layout`), so saved figures match a freshly
+    built `build_metric_figure`.
+    """
+
+    _SUBPLOT_PARAMS = ("left", "bottom", "right", "top", "wspace", "hspace")
+
+    def __init__(self, figure_data):
+        self.fig = Figure(figsize=(14, 7))
+        FigureCanvasAgg(self.fig)
+        self.chart = BarChartAxes(self.fig.subplots(), figure_data)
+        self._default_params = self._subplot_params()
+        self._layout_extents = None
+        self._layout_params = None
+
+    def _subplot_params(self):
+        return {key: getattr(self.fig.subplotpars, key) for key in self._SUBPLOT_PARAMS}
+
+    def _layout(self):
+        """Apply `tight_layout` as a fresh figure would, reusing it while the margins cannot move.
+
+        A fresh figure lays out from the default subplot position. The x tick
+        labels are shared by every metric, so only the y axis (tick labels and
+        label) and the title can change the margins; their extents at the
+        default position are cheap to measure compared with a full layout.
+        """
+        self.fig.subplots_adjust(**self._default_params)
+        renderer = self.fig.canvas.get_renderer()
+        ax = self.chart.ax
+        extents = (
+            tuple(ax.yaxis.get_tightbbox(renderer).bounds),
+            tuple(ax.title.get_window_extent(renderer).bounds),
+        )
+        if extents != self._layout_extents:
+            self.fig.tight_layout()
+            self._layout_extents = extents
+            self._layout_params = self._subplot_params()
+        else:
+            self.fig.subplots_adjust(**self._layout_params)
+
+    def render(self, path, metric_cfg, mock_expression_threshold, percent_parent_threshold, y_max=None, title=None):
+        """Show one metric and save it to `path`."""
+        self.chart.show_metric(metric_cfg, mock_expression_threshold, percent_parent_threshold, y_max, title)
+        self._layout()
+        self.fig.savefig(path, dpi=150, bbox_inches="tight")
+        print(f"Exported {path}")
+
+
+def render_metric_figures(
+    figure_data,
+    metric_cfgs,
     output_dir,
     mock_expression_threshold,
     percent_parent_threshold,
+    figure_options=None,
 ):
-    """Build markdown report: key findings, summary table, and figure references."""
-    # Kept in signature for compatibility with caller shape.
-    del target_cols, percent_parent_threshold
+    """Render several metric figures in this process; return [(entry, wall, cpu)].
 
-    output_path = os.path.join(output_dir, "experiment_summary.md")
-    with open(output_path, "w") as f:
-        f.write("# Flow Cytometry Analysis Summary\n\n")
-
-        # Key Findings subset 1: experimental samples above expression threshold.
-        experimental_samples = plot_data[
-            plot_data["Sample Type"].astype(str).str.contains("experimental", case=False, na=False)
-        ].copy()
-        passed_expression = experimental_samples[
-            experimental_samples["mirfp_expression_mean"] > float(mock_expression_threshold)
-        ].copy()
-        passed_expression_names = passed_expression["Sample Name"].astype(str).tolist()
-
-        # Key Findings subset 2: from subset 1, samples above 2x FLAG %Parent threshold.
-        key_findings_flag_threshold = calculate_percent_parent_threshold(plot_data)
-        if key_findings_flag_threshold is None:
-            passed_percent_parent = passed_expression.iloc[0:0].copy()
-        else:
-            passed_percent_parent = passed_expression[
-                passed_expression["percent_parent_mean"] > float(key_findings_flag_threshold)
-            ].copy()
-        passed_percent_parent_names = passed_percent_parent["Sample Name"].astype(str).tolist()
-
-        # Key Findings subset 3: from subset 2, samples above average control ratio.
-        controls = plot_data[
-            plot_data["Sample Type"].astype(str).str.contains("negative|positive", case=False, na=False)
-        ]
-        controls_ratio_mean = float(controls["mfi_ratio_mean"].mean()) if not controls.empty else float("nan")
-        passed_ratio = passed_percent_parent[
-            passed_percent_parent["mfi_ratio_mean"] > controls_ratio_mean
-        ].copy()
-        passed_ratio_names = passed_ratio["Sample Name"].astype(str).tolist()
-
-        f.write("## Key Findings\n\n")
-        f.write(
-            f"- Experimental samples >2X mock expression: {len(passed_expression_names)} "
-            f"({_format_sample_list(passed_expression_names)})\n"
-        )
-        if key_findings_flag_threshold is not None:
-            f.write(
-                f"- From that subset, samples >2X FLAG binding %Parent threshold: {len(passed_percent_parent_names)} "
-                f"({_format_sample_list(passed_percent_parent_names)})\n"
-            )
-        else:
-            f.write(
-                "- From that subset, samples >2X FLAG binding %Parent threshold: "
-                "threshold unavailable (no qualifying FLAG non-mock control found)\n"
-            )
-        if np.isnan(controls_ratio_mean):
-            f.write(
-                "- From that subset, samples above mean AF488/AF647 ratio of all controls: "
-                "control average unavailable\n\n"
+    Bar charts (and every page of paged charts) reuse one
+    `MetricFigureTemplate` across metrics. Ranked plots order samples by
+    each metric, so they are built per metric. Entries are (title, filename)
+    pairs, or lists of them for paged figures, in `metric_cfgs` order.
+    """
+    options = resolve_figure_options(figure_options)
+    figure_mode = resolve_figure_mode(len(figure_data), options)
+    templates = None
+    results = []
+    for metric_cfg in metric_cfgs:
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        if figure_mode == "rank":
+            fig = build_metric_figure(
+                figure_data,
+                metric_cfg,
+                mock_expression_threshold,
+                percent_parent_threshold,
+                figure_mode,
+                options["label_top_k"],
             )
+            filename = os.path.join(output_dir, metric_cfg["filename"])
+            fig.savefig(filename, dpi=150, bbox_inches="tight")
+            print(f"Exported {filename}")
+            entry = (metric_cfg["title"], metric_cfg["filename"])
         else:
-            f.write(
-                f"- From that subset, samples above mean AF488/AF647 ratio of all controls "
-                f"({controls_ratio_mean:.2f}): {len(passed_ratio_names)} "
-                f"({_format_sample_list(passed_ratio_names)})\n\n"
-            )
+            pages = figure_pages(figure_data, metric_cfg, options)
+            if templates is None:
+                templates = [MetricFigureTemplate(rows) for _title, _filename, rows in pages]
+            # Paged figures share one y scale across pages.
+            y_max = metric_y_max(figure_data, metric_cfg, mock_expression_threshold)
+            entries = []
+            for template, (title, page_file, _rows) in zip(templates, pages):
+                template.render(
+                    os.path.join(output_dir, page_file),
+                    metric_cfg,
+                    mock_expression_threshold,
+                    percent_parent_threshold,
+                    y_max,
+                    title,
+                )
+                entries.append((title, page_file))
+            entry = entries if figure_mode == "paged" else entries[0]
+        results.append((entry, time.perf_counter() - start, time.process_time() - cpu_start))
+    return results
+
+
+def render_metric_plot(
+    figure_data,
+    metric_cfg,
+    output_dir,
+    mock_expression_threshold,
+    percent_parent_threshold,
+    figure_options=None,
+):
+    """Render and save one metric figure; return its (title, filename) entry.
+
+    In paged mode every page is saved and a list of entries (one per page)
+    is returned instead.
+    """
+    results = render_metric_figures(
+        figure_data,
+        [metric_cfg],
+        output_dir,
+        mock_expression_threshold,
+        percent_parent_threshold,
+        figure_options,
+    )
+    return results[0][0]
+
+
+def flatten_plot_entries(entries):
+    """Flatten per-metric plot entries (paged figures return a list) into (title, filename) pairs."""
+    flat = []
+    for entry in entries:
+        flat.extend(entry if isinstance(entry, list) else [entry])
+    return flat
+
+
+_WORKER_FIGURE_DATA = None
+# Set by `_init_batch_worker` in batch/watch pool processes (see `resolve_plot_jobs`).
+_IN_BATCH_WORKER = False
+
+
+def _init_plot_worker(figure_data):
+    """Plot-pool initializer: receive the shared figure data once per worker."""
+    global _WORKER_FIGURE_DATA
+    _WORKER_FIGURE_DATA = figure_data
+
+
+def _render_metric_figures_worker(
+    metric_cfgs, output_dir, mock_expression_threshold, percent_parent_threshold, figure_options=None
+):
+    """Plot-pool task: render a share of the figures from the worker's copy of the figure data."""
+    return render_metric_figures(
+        _WORKER_FIGURE_DATA,
+        metric_cfgs,
+        output_dir,
+        mock_expression_threshold,
+        percent_parent_threshold,
+        figure_options,
+    )
+
+
+def resolve_plot_jobs(plot_jobs, n_figures, figures_per_worker=1):
+    """Worker count for figure rendering.
+
+    0 means up to the CPU count, with at least `figures_per_worker` figures
+    per worker (bar charts pass 2 so each worker reuses its figure template).
+    Inside a batch worker (see `_init_batch_worker`), 0 means in-process:
+    plates already fill the batch pool, so a figure pool per plate would
+    only oversubscribe the CPUs.
+    """
+    if plot_jobs and plot_jobs > 0:
+        return min(plot_jobs, max(n_figures, 1))
+    if _IN_BATCH_WORKER:
+        return 1
+    return max(1, min(-(-n_figures // figures_per_worker), os.cpu_count() or 1))
+
+
+def render_metric_plots(
+    figure_data,
+    metric_cfgs,
+    output_dir,
+    mock_expression_threshold,
+    percent_parent_threshold,
+    plot_jobs=1,
+    plot_profile=None,
+    figure_options=None,
+):
+    """Render several metric figures, split across worker processes when `plot_jobs` > 1.
+
+    `figure_data` is shipped to each worker once (pool initializer) rather
+    than with every task. Each worker renders its share of the metrics with
+    one reused figure template (`render_metric_figures`), so fewer workers
+    than figures still save the per-figure setup. Entries are returned in
+    `metric_cfgs` order.
+    Per-figure wall/CPU seconds and PNG size are recorded in `plot_profile`
+    (keyed by metric id) when given. `figure_options` (see
+    `FIGURE_OPTION_DEFAULTS`) selects bar, paged or ranked figures.
+    """
+    if plot_profile is None:
+        plot_profile = {}
+    # Ranked plots are rebuilt per metric, so only bar charts benefit from sharing a worker.
+    figure_mode = resolve_figure_mode(len(figure_data), figure_options)
+    jobs = resolve_plot_jobs(plot_jobs, len(metric_cfgs), 1 if figure_mode == "rank" else 2)
+    thresholds = (mock_expression_threshold, percent_parent_threshold)
 
-        # Build table columns with user-requested naming/ordering.
-        f.write("## Data Table\n\n")
-        table_df = plot_data.copy()
-        display_cols = {
-            "Sample Name": "Sample Name",
-            "Sample Type": "Sample Type",
-            "mock_expression_pass": ">2X Mock Expression",
-            "mirfp_expression": "Expression Level (MFI_AF647)",
-            "percent_parent": "Singlets/AF647(+)/AF488(+) %Parent",
-            "mfi_ratio": "MFI Ratio (AF488/AF647)",
-            "mfi_af488": "MFI AF488",
+    def record(metric_cfg, entry, wall_seconds, cpu_seconds):
+        # Paged figures write one PNG per page; count them all.
+        png_paths = [os.path.join(output_dir, filename) for _title, filename in flatten_plot_entries([entry])]
+        plot_profile[metric_cfg["metric_id"]] = {
+            "wall_seconds": round(wall_seconds, 4),
+            "cpu_seconds": round(cpu_seconds, 4),
+            "bytes_written": (
+                sum(os.path.getsize(path) for path in png_paths)
+                if all(os.path.exists(path) for path in png_paths)
+                else None
+            ),
+            "files_written": len(png_paths),
+            "workers": jobs if len(metric_cfgs) > 1 else 1,
         }
 
-        # Mark mock rows as "No" by design for pass/fail display.
-        table_df[display_cols["mock_expression_pass"]] = table_df.apply(
-            lambda row: (
-                "Yes"
-                if (
-                    "mock" not in str(row["Sample Name"]).lower()
-                    and float(row["mirfp_expression_mean"]) > float(mock_expression_threshold)
+    if jobs <= 1 or len(metric_cfgs) <= 1:
+        results = render_metric_figures(figure_data, metric_cfgs, output_dir, *thresholds, figure_options)
+    else:
+        # Round-robin shares; results are put back into `metric_cfgs` order below.
+        shares = [list(range(worker, len(metric_cfgs), jobs)) for worker in range(jobs)]
+        results = [None] * len(metric_cfgs)
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_plot_worker,
+            initargs=(figure_data,),
+        ) as pool:
+            futures = [
+                pool.submit(
+                    _render_metric_figures_worker,
+                    [metric_cfgs[idx] for idx in share],
+                    output_dir,
+                    *thresholds,
+                    figure_options,
                 )
-                else "No"
-            ),
-            axis=1,
-        )
+                for share in shares
+            ]
+            for share, future in zip(shares, futures):
+                for idx, result in zip(share, future.result()):
+                    results[idx] = result
 
-        # Format aggregated values as "mean ± sem" strings for readability.
-        for metric in ("mirfp_expression", "percent_parent", "mfi_ratio", "mfi_af488"):
-            table_df[display_cols[metric]] = table_df.apply(
-                lambda r: f"{r[metric + '_mean']:.2f} ± {r[metric + '_sem']:.2f}",
-                axis=1,
-            )
+    entries = []
+    for metric_cfg, (entry, wall_seconds, cpu_seconds) in zip(metric_cfgs, results):
+        entries.append(entry)
+        record(metric_cfg, entry, wall_seconds, cpu_seconds)
+    return entries
 
-        final_table = table_df[
-            ["Sample Name", "Sample Type", display_cols["mock_expression_pass"]]
-            + [display_cols[m] for m in ("mirfp_expression", "percent_parent", "mfi_ratio", "mfi_af488")]
-        ]
-        f.write(final_table.to_markdown(index=False))
-        f.write("\n\n")
 
-        # Use markdown links to local PNG files (no base64 embedding).
-        f.write("## Figures\n\n")
-        for title, png_filename in plot_files:
-            f.write(f"### {title}\n")
-            f.write(f"![{title}]({png_filename})\n\n")
+def generate_plots(
+    df,
+    target_cols,
+    output_dir,
+    mock_expression_threshold,
+    export_png=False,
+    plot_jobs=1,
+    figure_options=None,
+):
+    """Generate and save all figures; return filenames + aggregated plot dataset."""
+    # Retained for CLI compatibility; this script always exports PNGs.
+    del export_png
+    validate_target_columns(target_cols, df.columns)
 
-    print(f"Generated {output_path}")
+    # Shared sample ordering across all metrics prevents visual reordering confusion.
+    plot_data = add_sample_classes(build_plot_data(df, target_cols))
+    figure_data = build_figure_data(plot_data)
+    percent_parent_threshold = calculate_percent_parent_plot_threshold(plot_data)
 
+    # Iterate metric configuration so title/axis/file naming stays centralized.
+    plot_files = render_metric_plots(
+        figure_data,
+        METRIC_CONFIGS,
+        output_dir,
+        mock_expression_threshold,
+        percent_parent_threshold,
+        plot_jobs,
+        figure_options=figure_options,
+    )
 
-def main():
-    """CLI entrypoint for the end-to-end analysis/report generation workflow."""
-    parser = argparse.ArgumentParser(description="Analyze Flow Cytometry Data")
-    parser.add_argument("data_dir", help="Path to directory containing raw CSV and plate mapping CSV")
-    parser.add_argument("--export-png", action="store_true", help="Export plots as PNG files")
-    args = parser.parse_args()
+    return plot_files, plot_data, percent_parent_threshold
 
-    try:
-        # 1) Resolve output location and merge cleaned data.
-        output_dir = get_output_dir(args.data_dir)
-        print(f"Writing outputs to: {output_dir}")
-
-        merged_df = clean_and_merge(args.data_dir, output_dir)
-        # 2) Identify metric columns and compute threshold(s).
-        target_cols = identify_columns(merged_df)
-        validate_target_columns(target_cols, merged_df.columns)
-        mock_expression_threshold = calculate_mock_expression_threshold(merged_df, target_cols)
-
-        print("Identified target columns:")
-        for k, v in target_cols.items():
-            print(f"  {k}: {v}")
-
-        # 3) Generate figures and markdown report from aggregated data.
-        plot_files, plot_data, percent_parent_threshold = generate_plots(
-            merged_df,
-            target_cols,
-            output_dir,
-            mock_expression_threshold,
-            args.export_png,
+
+def _format_sample_list(sample_names):
+    """Human-readable sample list for markdown bullet points."""
+    return ", ".join(sample_names) if sample_names else "None"
+
+
+REPORT_TABLE_FORMATS = ("csv", "parquet")
+REPORT_TABLE_BASENAME = "summary_table"
+HIT_CALLS_FILENAME = "hit_calls.csv"
+REPORT_DISPLAY_COLS = {
+    "Sample Name": "Sample Name",
+    "Sample Type": "Sample Type",
+    "mock_expression_pass": ">2X Mock Expression",
+    "mirfp_expression": "Expression Level (MFI_AF647)",
+    "percent_parent": "Singlets/AF647(+)/AF488(+) %Parent",
+    "mfi_ratio": "MFI Ratio (AF488/AF647)",
+    "mfi_af488": "MFI AF488",
+}
+
+
+def _format_mean_sem(means, sems):
+    """Vectorized `"{mean:.2f} ± {sem:.2f}"` formatting over whole columns."""
+    mean_text = np.char.mod("%.2f", means.to_numpy(dtype=float))
+    sem_text = np.char.mod("%.2f", sems.to_numpy(dtype=float))
+    return pd.Series(
+        np.char.add(np.char.add(mean_text, " ± "), sem_text),
+        index=means.index,
+        dtype=object,
+    )
+
+
+def build_report_table(plot_data, mock_expression_threshold):
+    """Build the report's data table with column-wise string ops and boolean masks."""
+    display_cols = REPORT_DISPLAY_COLS
+
+    # Mark mock rows as "No" by design for pass/fail display.
+    passes = ~sample_classes(plot_data)["is_mock"].to_numpy() & (
+        plot_data["mirfp_expression_mean"].astype(float).to_numpy() > float(mock_expression_threshold)
+    )
+    table_df = plot_data[["Sample Name", "Sample Type"]].copy()
+    table_df[display_cols["mock_expression_pass"]] = np.where(passes, "Yes", "No")
+
+    # Format aggregated values as "mean ± sem" strings for readability.
+    for metric in ("mirfp_expression", "percent_parent", "mfi_ratio", "mfi_af488"):
+        table_df[display_cols[metric]] = _format_mean_sem(
+            plot_data[f"{metric}_mean"], plot_data[f"{metric}_sem"]
+        )
+    return table_df
+
+
+def write_report_table(table_df, output_dir, table_format="csv"):
+    """Write the report table as CSV or Parquet (Parquet needs pyarrow or fastparquet)."""
+    if table_format not in REPORT_TABLE_FORMATS:
+        raise ValueError(
+            f"Unsupported table format {table_format!r}; expected one of {', '.join(REPORT_TABLE_FORMATS)}"
+        )
+    output_path = os.path.join(output_dir, f"{REPORT_TABLE_BASENAME}.{table_format}")
+    if table_format == "parquet":
+        table_df.to_parquet(output_path, index=False)
+    else:
+        table_df.to_csv(output_path, index=False)
+    print(f"Saved report table to {output_path}")
+    return output_path
+
+
+# Key Findings hit-calling, declared as data. Reference statistics are computed once per
+# plate; each rule compares a sample-level metric against `reference * multiplier`, restricted
+# to `rows` (see `_hit_row_selectors`) and to samples passing the rule named in `after`.
+HIT_REFERENCES = {
+    # Mean mock_His/mock_FLAG expression over replicate rows (the mock expression threshold / 2).
+    "mock_expression_mean": {"source": "mock_expression"},
+    # Strongest per-sample mean %Parent among non-mock FLAG controls.
+    "flag_percent_parent_max": {"metric": "percent_parent_mean", "rows": "flag_controls", "stat": "max"},
+    "controls_ratio_mean": {"metric": "mfi_ratio_mean", "rows": "controls", "stat": "mean"},
+}
+HIT_RULES = [
+    {
+        "name": "passed_expression",
+        "label": "Experimental samples >2X mock expression",
+        "rows": "experimental",
+        "metric": "mirfp_expression_mean",
+        "op": ">",
+        "reference": "mock_expression_mean",
+        "multiplier": 2.0,
+    },
+    {
+        "name": "passed_percent_parent",
+        "label": "From that subset, samples >2X FLAG binding %Parent threshold",
+        "after": "passed_expression",
+        "metric": "percent_parent_mean",
+        "op": ">",
+        "reference": "flag_percent_parent_max",
+        "multiplier": 2.0,
+        "unavailable": "threshold unavailable (no qualifying FLAG non-mock control found)",
+    },
+    {
+        "name": "passed_ratio",
+        "label": "From that subset, samples above mean AF488/AF647 ratio of all controls",
+        "after": "passed_percent_parent",
+        "metric": "mfi_ratio_mean",
+        "op": ">",
+        "reference": "controls_ratio_mean",
+        "multiplier": 1.0,
+        "show_threshold": True,
+        "unavailable": "control average unavailable",
+    },
+]
+HIT_COMPARATORS = {">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal}
+HIT_REFERENCE_STATS = ("mean", "max")
+
+
+def _hit_row_selectors(classes):
+    """Row masks that rules and references may restrict to, from the classification columns."""
+    is_mock = classes["is_mock"].to_numpy(dtype=bool)
+    return {
+        "all": np.ones(len(classes), dtype=bool),
+        "experimental": classes["is_experimental"].to_numpy(dtype=bool),
+        "controls": control_mask(classes),
+        "flag_controls": classes["is_flag"].to_numpy(dtype=bool) & ~is_mock,
+        "mock": is_mock,
+    }
+
+
+HIT_ROW_SELECTORS = ("all", "experimental", "controls", "flag_controls", "mock")
+
+
+def resolve_hit_rules(overrides=None):
+    """Hit `rules` and `references` with `overrides` applied, validated up front.
+
+    `overrides` may hold `rules` (replacing `HIT_RULES`) and/or `references`
+    (merged over `HIT_REFERENCES`).
+    """
+    unknown = sorted(set(overrides or {}) - {"rules", "references"})
+    if unknown:
+        raise ValueError(f"Unknown hit rule config keys: {', '.join(unknown)}. Expected: rules, references")
+    rules = list((overrides or {}).get("rules") or HIT_RULES)
+    references = {**HIT_REFERENCES, **(overrides or {}).get("references", {})}
+
+    problems = []
+    for name, spec in references.items():
+        if spec.get("source") == "mock_expression":
+            continue
+        if "metric" not in spec:
+            problems.append(f"reference {name!r} needs a metric (or source: mock_expression)")
+        if spec.get("rows", "all") not in HIT_ROW_SELECTORS:
+            problems.append(f"reference {name!r} has unknown rows {spec.get('rows')!r}")
+        if spec.get("stat", "mean") not in HIT_REFERENCE_STATS:
+            problems.append(f"reference {name!r} has unsupported stat {spec.get('stat')!r}")
+    seen = set()
+    for rule in rules:
+        name = rule.get("name")
+        if not name or name in seen:
+            problems.append(f"rule names must be present and unique (got {name!r})")
+        if rule.get("op") not in HIT_COMPARATORS:
+            problems.append(f"rule {name!r} has unsupported op {rule.get('op')!r}")
+        if rule.get("reference") not in references:
+            problems.append(f"rule {name!r} references unknown statistic {rule.get('reference')!r}")
+        if rule.get("rows", "all") not in HIT_ROW_SELECTORS:
+            problems.append(f"rule {name!r} has unknown rows {rule.get('rows')!r}")
+        if rule.get("after") is not None and rule["after"] not in seen:
+            problems.append(f"rule {name!r} chains after {rule['after']!r}, which is not an earlier rule")
+        if "metric" not in rule:
+            problems.append(f"rule {name!r} needs a metric")
+        seen.add(name)
+    if problems:
+        raise ValueError("Invalid hit rules: " + "; ".join(problems))
+    return {"rules": rules, "references": references}
+
+
+def load_hit_rules(path):
+    """Read hit rule overrides (`rules` / `references`) from JSON and validate them."""
+    with open(path) as f:
+        overrides = json.load(f)
+    resolve_hit_rules(overrides)
+    return overrides
+
+
+def hit_reference_values(plot_data, mock_expression_threshold, references=None):
+    """Evaluate every reference statistic once; None when its rows are absent."""
+    references = references or HIT_REFERENCES
+    selectors = _hit_row_selectors(sample_classes(plot_data))
+    values = {}
+    for name, spec in references.items():
+        if spec.get("source") == "mock_expression":
+            values[name] = float(mock_expression_threshold) / 2.0
+            continue
+        mask = selectors[spec.get("rows", "all")]
+        if not mask.any():
+            values[name] = None
+            continue
+        metric = plot_data[spec["metric"]][mask]
+        if spec.get("stat", "mean") == "max":
+            # Strongest sample: mean per sample name first, as in `calculate_percent_parent_threshold`.
+            metric = metric.groupby(plot_data["Sample Name"][mask], sort=False).mean()
+            values[name] = float(metric.max())
+        else:
+            values[name] = float(metric.mean())
+    return values
+
+
+def evaluate_hit_rules(plot_data, reference_values, rules=None, multipliers=None):
+    """Per-sample pass/fail for every rule as NumPy masks, in one pass over the rules.
+
+    Returns `(passes, thresholds)` keyed by rule name. Without `multipliers`,
+    each mask has one entry per `plot_data` row and each threshold is a float
+    (NaN when its reference is unavailable). `multipliers` maps rule names to
+    equal-length 1-D arrays; every mask then gains a trailing axis with one
+    column per multiplier setting, so many variants are evaluated at once.
+    """
+    rules = rules or HIT_RULES
+    selectors = _hit_row_selectors(sample_classes(plot_data))
+    sweep = multipliers is not None
+    passes = {}
+    thresholds = {}
+    for rule in rules:
+        name = rule["name"]
+        multiplier = np.atleast_1d(
+            np.asarray((multipliers or {}).get(name, rule.get("multiplier", 1.0)), dtype=np.float64)
+        )
+        reference = reference_values.get(rule["reference"])
+        threshold = multiplier * (np.nan if reference is None else reference)
+        values = plot_data[rule["metric"]].to_numpy(dtype=np.float64)
+        mask = HIT_COMPARATORS[rule["op"]](values[:, None], threshold[None, :])
+        mask &= selectors[rule.get("rows", "all")][:, None]
+        if rule.get("after") is not None:
+            mask = mask & passes[rule["after"]]
+        passes[name] = mask
+        thresholds[name] = threshold
+    if not sweep:
+        passes = {name: mask[:, 0] for name, mask in passes.items()}
+        thresholds = {name: float(threshold[0]) for name, threshold in thresholds.items()}
+    return passes, thresholds
+
+
+def hit_calls(plot_data, passes):
+    """Per-sample pass/fail table with one boolean column per rule."""
+    calls = plot_data[["Sample Name", "Sample Type"]].copy()
+    for name, mask in passes.items():
+        calls[name] = mask
+    return calls
+
+
+def compute_key_findings(plot_data, mock_expression_threshold, hit_rules=None):
+    """Key Findings cascade (`HIT_RULES`, or `hit_rules` overrides) over sample-level data.
+
+    Returns the sample names passing each rule (keyed by rule name), the
+    reference statistics and rule thresholds, and `hits` (the last rule).
+    With the default rules:
+    1) experimental samples above the mock expression threshold,
+    2) of those, samples above 2x the strongest FLAG %Parent control,
+    3) of those, samples above the mean AF488/AF647 ratio of all controls.
+    """
+    config = resolve_hit_rules(hit_rules)
+    references = hit_reference_values(plot_data, mock_expression_threshold, config["references"])
+    passes, thresholds = evaluate_hit_rules(plot_data, references, config["rules"])
+    sample_names = plot_data["Sample Name"].astype(str).to_numpy()
+
+    findings = {
+        "mock_expression_threshold": float(mock_expression_threshold),
+        "references": references,
+        "rule_thresholds": thresholds,
+        "rules": config["rules"],
+        "passes": passes,
+    }
+    for name, mask in passes.items():
+        findings[name] = sample_names[mask].tolist()
+    findings["hits"] = findings[config["rules"][-1]["name"]]
+    # Names kept from the fixed three-step cascade.
+    if references.get("flag_percent_parent_max") is not None:
+        findings["flag_percent_parent_threshold"] = references["flag_percent_parent_max"] * 2.0
+    else:
+        findings["flag_percent_parent_threshold"] = None
+    controls_ratio_mean = references.get("controls_ratio_mean")
+    findings["controls_ratio_mean"] = float("nan") if controls_ratio_mean is None else controls_ratio_mean
+    return findings
+
+
+SWEEP_TABLE_FILENAME = "threshold_sweep.csv"
+SWEEP_HEATMAP_FILENAME = "threshold_sweep.png"
+# Size limits: multipliers per rule, combinations per sweep, and sample x combination
+# mask cells evaluated at once (one byte each per rule).
+SWEEP_MAX_VALUES = 1000
+SWEEP_MAX_COMBINATIONS = 100_000
+SWEEP_CHUNK_CELLS = 4_000_000
+
+
+def parse_sweep_spec(spec):
+    """Parse `RULE=start:stop:step` (stop inclusive) or `RULE=m1,m2,...` into (rule, multipliers)."""
+    rule_name, sep, values = str(spec).partition("=")
+    if not sep or not rule_name.strip() or not values.strip():
+        raise ValueError(f"Invalid sweep {spec!r}; expected RULE=start:stop:step or RULE=m1,m2,...")
+    try:
+        if ":" in values:
+            start, stop, step = (float(part) for part in values.split(":"))
+            if step <= 0 or stop < start:
+                raise ValueError("need start <= stop and step > 0")
+            # Round so e.g. 1:3:0.1 ends exactly at 3.0 instead of accumulating float error.
+            count = int(np.floor((stop - start) / step + 1e-9)) + 1
+            if count > SWEEP_MAX_VALUES:
+                raise ValueError(f"{count} multipliers exceeds the limit of {SWEEP_MAX_VALUES}; use a larger step")
+            multipliers = np.round(start + step * np.arange(count), 10)
+        else:
+            multipliers = np.array([float(part) for part in values.split(",")])
+            if len(multipliers) > SWEEP_MAX_VALUES:
+                raise ValueError(f"{len(multipliers)} multipliers exceeds the limit of {SWEEP_MAX_VALUES}")
+    except ValueError as e:
+        raise ValueError(f"Invalid sweep {spec!r}: {e}") from None
+    return rule_name.strip(), multipliers.tolist()
+
+
+def check_sweep_size(ranges):
+    """Number of combinations in `ranges`; `ValueError` above `SWEEP_MAX_COMBINATIONS`."""
+    n_settings = int(np.prod([len(values) for values in ranges.values()], dtype=np.float64))
+    if n_settings > SWEEP_MAX_COMBINATIONS:
+        sizes = " x ".join(f"{len(values)} {name}" for name, values in ranges.items())
+        raise ValueError(
+            f"Threshold sweep has {n_settings} combinations ({sizes}), above the limit of "
+            f"{SWEEP_MAX_COMBINATIONS}. Sweep fewer rules or use coarser multiplier steps."
+        )
+    return n_settings
+
+
+def threshold_sweep(plot_data, mock_expression_threshold, ranges, hit_rules=None):
+    """Hit counts for every combination of rule multipliers, evaluated in broadcast chunks.
+
+    `ranges` maps hit rule names (see `HIT_RULES`) to multiplier lists. The
+    Cartesian product is expanded with `np.meshgrid` and evaluated by
+    `evaluate_hit_rules` in chunks of at most `SWEEP_CHUNK_CELLS` sample x
+    combination cells, so mask memory stays bounded on large plates. Sweeps
+    above `SWEEP_MAX_COMBINATIONS` raise `ValueError`. Returns one row per
+    combination: the swept `<rule>_multiplier` values, then `<rule>_threshold`
+    and `<rule>_hits` for every rule.
+    """
+    config = resolve_hit_rules(hit_rules)
+    rule_names = [rule["name"] for rule in config["rules"]]
+    unknown = [name for name in ranges if name not in rule_names]
+    if unknown:
+        raise ValueError(
+            f"Cannot sweep unknown hit rules: {', '.join(unknown)}. Available: {', '.join(rule_names)}"
+        )
+    if not ranges or any(len(values) == 0 for values in ranges.values()):
+        raise ValueError("A threshold sweep needs at least one rule with at least one multiplier")
+
+    n_settings = check_sweep_size(ranges)
+
+    grids = np.meshgrid(*(np.asarray(values, dtype=np.float64) for values in ranges.values()), indexing="ij")
+    multipliers = {name: grid.ravel() for name, grid in zip(ranges, grids)}
+    references = hit_reference_values(plot_data, mock_expression_threshold, config["references"])
+    thresholds = {name: np.empty(n_settings) for name in rule_names}
+    hits = {name: np.empty(n_settings, dtype=np.int64) for name in rule_names}
+    chunk = max(1, SWEEP_CHUNK_CELLS // max(1, len(plot_data)))
+    for start in range(0, n_settings, chunk):
+        part = slice(start, start + chunk)
+        passes, part_thresholds = evaluate_hit_rules(
+            plot_data, references, config["rules"], {name: values[part] for name, values in multipliers.items()}
+        )
+        size = min(chunk, n_settings - start)
+        for name in rule_names:
+            thresholds[name][part] = np.broadcast_to(part_thresholds[name], size)
+            hits[name][part] = np.broadcast_to(passes[name].sum(axis=0), size)
+
+    table = pd.DataFrame({f"{name}_multiplier": values for name, values in multipliers.items()})
+    for name in rule_names:
+        table[f"{name}_threshold"] = thresholds[name]
+        table[f"{name}_hits"] = hits[name]
+    return table
+
+
+def build_sweep_heatmap(sweep_table, ranges, hits_rule):
+    """Heatmap of `<hits_rule>_hits` over the first two swept rules' multipliers."""
+    (y_rule, y_values), (x_rule, x_values) = list(ranges.items())[:2]
+    counts = sweep_table[f"{hits_rule}_hits"].to_numpy().reshape(len(y_values), len(x_values))
+
+    fig = Figure(figsize=(max(6, 0.6 * len(x_values) + 3), max(4, 0.45 * len(y_values) + 2)))
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    image = ax.imshow(counts, cmap="viridis", aspect="auto", origin="lower")
+    ax.set_xticks(range(len(x_values)), [f"{value:g}" for value in x_values])
+    ax.set_yticks(range(len(y_values)), [f"{value:g}" for value in y_values])
+    ax.set_xlabel(f"{x_rule} multiplier")
+    ax.set_ylabel(f"{y_rule} multiplier")
+    ax.set_title(f"{hits_rule} hit count")
+    if counts.size <= 400:
+        midpoint = counts.max() / 2
+        for (row, col), count in np.ndenumerate(counts):
+            ax.text(col, row, str(count), ha="center", va="center", fontsize=8,
+                    color="black" if count > midpoint else "white")
+    fig.colorbar(image, ax=ax, label="Samples")
+    fig.tight_layout()
+    return fig
+
+
+def write_threshold_sweep(sweep_table, ranges, output_dir, hits_rule):
+    """Write `threshold_sweep.csv`, plus the heatmap when exactly two rules were swept."""
+    table_path = os.path.join(output_dir, SWEEP_TABLE_FILENAME)
+    sweep_table.to_csv(table_path, index=False)
+    print(f"Saved threshold sweep ({len(sweep_table)} combinations) to {table_path}")
+    if len(ranges) == 2:
+        heatmap_path = os.path.join(output_dir, SWEEP_HEATMAP_FILENAME)
+        build_sweep_heatmap(sweep_table, ranges, hits_rule).savefig(heatmap_path, dpi=150)
+        print(f"Exported {heatmap_path}")
+    return table_path
+
+
+def build_report_markdown(
+    plot_data,
+    plot_files,
+    mock_expression_threshold,
+    table_markdown=None,
+    hit_rules=None,
+    findings=None,
+):
+    """Render the full markdown report as a string (no file I/O).
+
+    `table_markdown` replaces the inline data table (e.g. with a link to a
+    separately written table file). Key Findings list one bullet per hit rule;
+    pass precomputed `findings` to avoid evaluating the rules again.
+    """
+    if findings is None:
+        findings = compute_key_findings(plot_data, mock_expression_threshold, hit_rules)
+
+    lines = ["# Flow Cytometry Analysis Summary\n\n"]
+    lines.append("## Key Findings\n\n")
+    for rule in findings["rules"]:
+        threshold = findings["rule_thresholds"][rule["name"]]
+        label = rule.get("label", rule["name"])
+        if np.isnan(threshold):
+            lines.append(f"- {label}: {rule.get('unavailable', 'reference unavailable')}\n")
+            continue
+        if rule.get("show_threshold"):
+            label = f"{label} ({threshold:.2f})"
+        names = findings[rule["name"]]
+        lines.append(f"- {label}: {len(names)} ({_format_sample_list(names)})\n")
+    lines.append("\n")
+
+    # Build table columns with user-requested naming/ordering.
+    lines.append("## Data Table\n\n")
+    if table_markdown is None:
+        table_markdown = build_report_table(plot_data, mock_expression_threshold).to_markdown(index=False)
+    lines.append(table_markdown)
+    lines.append("\n\n")
+
+    # Use markdown links to local PNG files (no base64 embedding).
+    lines.append("## Figures\n\n")
+    for title, png_filename in flatten_plot_entries(plot_files):
+        lines.append(f"### {title}\n")
+        lines.append(f"![{title}]({png_filename})\n\n")
+    return "".join(lines)
+
+
+def generate_report(
+    plot_data,
+    plot_files,
+    target_cols,
+    output_dir,
+    mock_expression_threshold,
+    percent_parent_threshold,
+    table_max_rows=None,
+    table_format="csv",
+    hit_rules=None,
+):
+    """Build markdown report: key findings, summary table, and figure references.
+
+    When `table_max_rows` is set and exceeded, the data table is written to
+    `summary_table.<table_format>` and linked instead of inlined as markdown.
+    Per-sample pass/fail for every hit rule is written to `hit_calls.csv`.
+    """
+    # Kept in signature for compatibility with caller shape.
+    del target_cols, percent_parent_threshold
+
+    table_markdown = None
+    if table_max_rows is not None and len(plot_data) > table_max_rows:
+        # Very large libraries: keep the markdown readable and ship the table as a data file.
+        final_table = build_report_table(plot_data, mock_expression_threshold)
+        table_path = write_report_table(final_table, output_dir, table_format)
+        table_filename = os.path.basename(table_path)
+        table_markdown = (
+            f"Table has {len(final_table)} rows (limit {table_max_rows}); "
+            f"see [{table_filename}]({table_filename})."
+        )
+
+    findings = compute_key_findings(plot_data, mock_expression_threshold, hit_rules)
+    output_path = os.path.join(output_dir, "experiment_summary.md")
+    with open(output_path, "w") as f:
+        f.write(
+            build_report_markdown(
+                plot_data, plot_files, mock_expression_threshold, table_markdown, findings=findings
+            )
+        )
+    print(f"Generated {output_path}")
+
+    calls_path = os.path.join(output_dir, HIT_CALLS_FILENAME)
+    hit_calls(plot_data, findings["passes"]).to_csv(calls_path, index=False)
+    print(f"Saved hit calls to {calls_path}")
+
+
+def _file_sha256(path):
+    """Stream a file through SHA-256 without loading it into memory."""
+    digest = hashlib.sha256()
+    with open_input(path) as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_SCRIPT_SHA256 = None
+
+
+def _script_sha256():
+    """Hash of this script's source, so any code/styling change invalidates the cache."""
+    global _SCRIPT_SHA256
+    if _SCRIPT_SHA256 is None:
+        _SCRIPT_SHA256 = _file_sha256(os.path.abspath(__file__))
+    return _SCRIPT_SHA256
+
+
+def _input_fingerprint(path, previous=None):
+    """Size/mtime/SHA-256 record for an input; reuse the old hash if stat is unchanged.
+
+    Archive members are stat'ed through their archive file.
+    """
+    archive, _member = split_archive_path(path)
+    stat = os.stat(archive if archive is not None else path)
+    fingerprint = {
+        "path": os.path.abspath(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    if (
+        previous
+        and previous.get("path") == fingerprint["path"]
+        and previous.get("size") == fingerprint["size"]
+        and previous.get("mtime_ns") == fingerprint["mtime_ns"]
+        and previous.get("sha256")
+    ):
+        fingerprint["sha256"] = previous["sha256"]
+    else:
+        fingerprint["sha256"] = _file_sha256(path)
+    return fingerprint
+
+
+def load_cache_manifest(output_dir):
+    """Read the cache manifest from an output folder; None when absent or unreadable."""
+    manifest_path = os.path.join(output_dir, CACHE_MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("manifest_version") != CACHE_MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def compute_cache_key(raw_csv, mapping_csv, config, previous_manifest=None):
+    """Fingerprint inputs, script source, and run config into a single cache key."""
+    previous_inputs = (previous_manifest or {}).get("inputs", {})
+    inputs = {
+        "raw_csv": _input_fingerprint(raw_csv, previous_inputs.get("raw_csv")),
+        "mapping_csv": _input_fingerprint(mapping_csv, previous_inputs.get("mapping_csv")),
+    }
+    key_material = {
+        "raw_csv": inputs["raw_csv"]["sha256"],
+        "mapping_csv": inputs["mapping_csv"]["sha256"],
+        "script_sha256": _script_sha256(),
+        "config": config,
+    }
+    cache_key = hashlib.sha256(
+        json.dumps(key_material, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return cache_key, inputs
+
+
+def is_cache_hit(manifest, cache_key, output_dir):
+    """True when the manifest matches the key and every recorded output still exists."""
+    if not manifest or manifest.get("cache_key") != cache_key:
+        return False
+    outputs = manifest.get("outputs", [])
+    return bool(outputs) and all(
+        os.path.exists(os.path.join(output_dir, name)) for name in outputs
+    )
+
+
+def write_cache_manifest(output_dir, cache_key, inputs, config, outputs, stages=None, store_source=None):
+    """Record what produced the current outputs so unchanged re-runs can be skipped.
+
+    `cache_key` is None while a rebuild is in progress, so an interrupted run
+    never looks like a hit while its completed stages stay reusable.
+    `store_source` is the fingerprint of this plate's own accumulator-store
+    contribution after the run (see `AccumulatorStore.source_fingerprint`).
+    """
+    manifest_path = os.path.join(output_dir, CACHE_MANIFEST)
+    with open(manifest_path, "w") as f:
+        json.dump(
+            {
+                "manifest_version": CACHE_MANIFEST_VERSION,
+                "cache_key": cache_key,
+                "script_sha256": _script_sha256(),
+                "config": config,
+                "inputs": inputs,
+                "outputs": outputs,
+                "stages": stages or {},
+                "accumulator_store_source": store_source,
+            },
+            f,
+            indent=2,
+        )
+    return manifest_path
+
+
+_MODULE_DEFINITIONS = None
+
+
+def _module_definitions():
+    """{name: (source, module-level names it reads)} for every top-level def/class (parsed once)."""
+    global _MODULE_DEFINITIONS
+    if _MODULE_DEFINITIONS is None:
+        with open(os.path.abspath(__file__), encoding="utf-8") as f:
+            module_source = f.read()
+        lines = module_source.splitlines(keepends=True)
+        _MODULE_DEFINITIONS = {}
+        for node in ast.parse(module_source).body:
+            if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+                start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+                names = {child.id for child in ast.walk(node) if isinstance(child, ast.Name)}
+                _MODULE_DEFINITIONS[node.name] = ("".join(lines[start - 1 : node.end_lineno]), sorted(names))
+    return _MODULE_DEFINITIONS
+
+
+def _source_and_names(obj):
+    """(source, module-level names it reads) for a function or class of this module."""
+    source, names = _module_definitions()[obj.__name__]
+    return source, [name for name in names if name in globals()]
+
+
+def stage_code(stage):
+    """Functions, classes, and constants a stage depends on, found by following its source.
+
+    Starts from the stage's `run`/`run_group` plus any extra `code` entries and
+    adds every function, class, or public constant of this module they name,
+    transitively. Private non-callable globals (worker state, caches) are skipped.
+    Returns `[(name, obj)]` sorted by name; extra non-callable entries use `None`.
+    """
+    pending = [part for part in (stage.get("run"), stage.get("run_group"), *stage.get("code", ())) if part is not None]
+    found = {}
+    extras = []
+    while pending:
+        part = pending.pop()
+        if not (inspect.isfunction(part) or inspect.isclass(part)):
+            extras.append((None, part))
+            continue
+        if part.__qualname__ in found:
+            continue
+        found[part.__qualname__] = part
+        for name in _source_and_names(part)[1]:
+            value = globals()[name]
+            if inspect.isfunction(value) or inspect.isclass(value):
+                if value.__module__ == __name__:
+                    pending.append(value)
+            elif not name.startswith("_") and not inspect.ismodule(value):
+                found.setdefault(name, value)
+    return sorted(found.items(), key=lambda item: item[0]) + extras
+
+
+def _code_fingerprint(parts):
+    """Hash function sources and constant values that define a stage's behavior."""
+    digest = hashlib.sha256()
+    for name, part in parts:
+        digest.update(str(name).encode("utf-8"))
+        if inspect.isfunction(part) or inspect.isclass(part):
+            digest.update(_source_and_names(part)[0].encode("utf-8"))
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _stage_discover(ctx, get):
+    """Stage: input file locations plus their content hashes."""
+    del get
+    return {
+        "input_csvs": ctx["input_csvs"],
+        "sha256": [ctx["inputs"][key]["sha256"] for key in ("raw_csv", "mapping_csv")],
+    }
+
+
+def _stage_merge(ctx, get):
+    """Stage: cleaned + merged replicate-level rows (writes processed_flow_data.csv)."""
+    config = ctx["config"]
+    if config.get("stream_chunk_rows"):
+        if config.get("columnar_format") or not config.get("merged_csv", True):
+            raise ValueError(
+                "--stream-chunk-rows writes the merged table as CSV only; drop --columnar-format/"
+                "--no-merged-csv, or load the table whole"
+            )
+        raw_csv, mapping_csv = get("discover")["input_csvs"]
+        usecols, dtype = None, None
+        if config.get("prune_columns") and not config.get("full_merged_csv"):
+            usecols, dtype = plan_raw_columns(
+                list(read_input_csv(raw_csv, nrows=0).columns),
+                tuple(config.get("passthrough_columns") or ()),
+                config.get("metric_dtype", RAW_METRIC_DTYPE),
+            )
+        return stream_clean_and_merge(
+            raw_csv, mapping_csv, ctx["output_dir"], config["stream_chunk_rows"], usecols, dtype
+        )
+    return clean_and_merge(
+        ctx["data_dir"],
+        ctx["output_dir"],
+        get("discover")["input_csvs"],
+        config.get("prune_columns", False),
+        tuple(config.get("passthrough_columns") or ()),
+        config.get("full_merged_csv", False),
+        config.get("metric_dtype", RAW_METRIC_DTYPE),
+        config.get("columnar_format"),
+        config.get("merged_csv", True),
+    )
+
+
+def _stage_identify(ctx, get):
+    """Stage: resolved metric column names."""
+    del ctx
+    merged = get("merge")
+    columns = merged["columns"] if _is_streamed(merged) else merged.columns
+    target_cols = match_metric_columns(columns)
+    validate_target_columns(target_cols, columns)
+    print("Identified target columns:")
+    for k, v in target_cols.items():
+        print(f"  {k}: {v}")
+    return target_cols
+
+
+def _stage_aggregate(ctx, get):
+    """Stage: sample-level means/SEMs (pooled across plates with an accumulator store)."""
+    merged = get("merge")
+    output_dir = ctx["output_dir"]
+    columnar_format = ctx["config"].get("columnar_format")
+    store_path = ctx["config"].get("accumulator_store")
+    if store_path:
+        source_id = os.path.abspath(ctx["data_dir"])
+        with locked_accumulator_store(store_path) as store:
+            if not _is_streamed(merged):
+                return build_plot_data(
+                    merged,
+                    get("identify"),
+                    accumulator_store=store,
+                    source_id=source_id,
+                    output_dir=output_dir,
+                    columnar_format=columnar_format,
+                )
+            store.set_source(source_id, merged["accumulator"])
+            plot_data = store.plot_data()
+    elif _is_streamed(merged):
+        plot_data = merged["plot_data"]
+    else:
+        return build_plot_data(merged, get("identify"), output_dir=output_dir, columnar_format=columnar_format)
+    if columnar_format:
+        write_sample_stats(plot_data, output_dir, columnar_format)
+    return plot_data
+
+
+def _stage_classify(ctx, get):
+    """Stage: sample-level data plus classification columns read by every later stage."""
+    return add_sample_classes(get("aggregate"), resolve_class_rules(ctx["config"].get("class_rules")))
+
+
+def _stage_thresholds(ctx, get):
+    """Stage: expression and %Parent plot threshold values."""
+    merged = get("merge")
+    rules = resolve_class_rules(ctx["config"].get("class_rules"))
+    return {
+        "mock_expression_threshold": (
+            mock_expression_threshold_from_totals(merged["expression_totals"], rules)
+            if _is_streamed(merged)
+            else calculate_mock_expression_threshold(merged, get("identify"), rules)
+        ),
+        "percent_parent_threshold": calculate_percent_parent_plot_threshold(get("classify")),
+    }
+
+
+def _run_plot_stages(ctx, get, stages):
+    """Stage group runner: render all stale figures together on the plot pool."""
+    thresholds = get("thresholds")
+    plot_profile = {}
+    entries = render_metric_plots(
+        build_figure_data(get("classify")),
+        [stage["metric_cfg"] for stage in stages],
+        ctx["output_dir"],
+        thresholds["mock_expression_threshold"],
+        thresholds["percent_parent_threshold"],
+        ctx.get("plot_jobs", 1),
+        plot_profile,
+        {key: ctx["config"].get(key) for key in FIGURE_OPTION_KEYS},
+    )
+    return entries, {f"plot:{metric_id}": profile for metric_id, profile in plot_profile.items()}
+
+
+def _make_plot_stage(metric_cfg):
+    """Stage spec for a single metric figure (run as part of the `plots` group)."""
+
+    def outputs(config, artifact=None):
+        # Paged figures write `page_filename(...)` per page; the rendered entry lists them all.
+        if artifact is None:
+            return [metric_cfg["filename"]]
+        return [filename for _title, filename in flatten_plot_entries([artifact])]
+
+    return {
+        "name": f"plot:{metric_cfg['metric_id']}",
+        "deps": ["classify", "thresholds"],
+        "group": "plots",
+        "run_group": _run_plot_stages,
+        "metric_cfg": metric_cfg,
+        "code": [metric_cfg],
+        "config_keys": FIGURE_OPTION_KEYS,
+        "outputs": outputs,
+    }
+
+
+def _stage_report(ctx, get):
+    """Stage: markdown report from aggregated data and figure links."""
+    thresholds = get("thresholds")
+    plot_files = [get(f"plot:{cfg['metric_id']}") for cfg in METRIC_CONFIGS]
+    generate_report(
+        get("classify"),
+        plot_files,
+        get("identify"),
+        ctx["output_dir"],
+        thresholds["mock_expression_threshold"],
+        thresholds["percent_parent_threshold"],
+        ctx["config"].get("table_max_rows"),
+        ctx["config"].get("table_format", "csv"),
+        ctx["config"].get("hit_rules"),
+    )
+    return plot_files
+
+
+def _stage_sweep(ctx, get):
+    """Stage: hit counts over `--sweep` multiplier ranges (no-op without a sweep)."""
+    ranges = ctx["config"].get("threshold_sweep")
+    if not ranges:
+        return None
+    hit_rules = ctx["config"].get("hit_rules")
+    table = threshold_sweep(get("classify"), get("thresholds")["mock_expression_threshold"], ranges, hit_rules)
+    hits_rule = resolve_hit_rules(hit_rules)["rules"][-1]["name"]
+    write_threshold_sweep(table, ranges, ctx["output_dir"], hits_rule)
+    return table
+
+
+def _sweep_stage_outputs(config, artifact=None):
+    ranges = config.get("threshold_sweep") or {}
+    outputs = [SWEEP_TABLE_FILENAME] if ranges else []
+    if len(ranges) == 2:
+        outputs.append(SWEEP_HEATMAP_FILENAME)
+    return outputs
+
+
+def build_pipeline_stages():
+    """Explicit stage graph in topological order.
+
+    Each stage lists its upstream stages (`deps`), the files it writes into
+    the output folder (`outputs`), the run options it reads (`config_keys`),
+    and optionally `always_run`. Its code fingerprint covers everything
+    `stage_code` reaches from `run`/`run_group`, plus extra `code` values. Stages
+    sharing a `group` are consecutive and their stale members are executed
+    together by `run_group(ctx, get, stages) -> (artifacts, profile_by_stage)`.
+    """
+    plot_stages = [_make_plot_stage(metric_cfg) for metric_cfg in METRIC_CONFIGS]
+    return [
+        # Discovery is cheap and its output carries the input hashes, so it always runs.
+        {
+            "name": "discover",
+            "deps": [],
+            "run": _stage_discover,
+            "outputs": [],
+            "always_run": True,
+        },
+        {
+            "name": "merge",
+            "deps": ["discover"],
+            "run": _stage_merge,
+            "config_keys": (
+                "prune_columns",
+                "passthrough_columns",
+                "full_merged_csv",
+                "metric_dtype",
+                "stream_chunk_rows",
+                "columnar_format",
+                "merged_csv",
+            ),
+            "outputs": _merge_stage_outputs,
+        },
+        {
+            "name": "identify",
+            "deps": ["merge"],
+            "run": _stage_identify,
+            "outputs": [],
+        },
+        {
+            "name": "aggregate",
+            "deps": ["merge", "identify"],
+            "run": _stage_aggregate,
+            "config_keys": ("accumulator_store", "accumulator_store_others", "columnar_format"),
+            "outputs": _aggregate_stage_outputs,
+        },
+        {
+            "name": "classify",
+            "deps": ["aggregate"],
+            "run": _stage_classify,
+            "config_keys": ("class_rules",),
+            "outputs": [],
+        },
+        {
+            "name": "thresholds",
+            "deps": ["merge", "identify", "classify"],
+            "run": _stage_thresholds,
+            "config_keys": ("class_rules",),
+            "outputs": [],
+        },
+        *plot_stages,
+        {
+            "name": "report",
+            "deps": ["classify", "identify", "thresholds"] + [stage["name"] for stage in plot_stages],
+            "run": _stage_report,
+            "config_keys": ("table_max_rows", "table_format", "hit_rules"),
+            "outputs": ["experiment_summary.md", HIT_CALLS_FILENAME],
+        },
+        # Depends only on sample-level data and thresholds, so adding a sweep re-runs nothing upstream.
+        {
+            "name": "sweep",
+            "deps": ["classify", "thresholds"],
+            "run": _stage_sweep,
+            "config_keys": ("threshold_sweep", "hit_rules"),
+            "outputs": _sweep_stage_outputs,
+        },
+    ]
+
+
+def stage_outputs(stage, config, artifact=None):
+    """Files a stage writes for this run's config.
+
+    `outputs` may be a callable of `(config, artifact)`; `artifact` is the
+    stage's result once it has run, for outputs that depend on the data
+    (e.g. the pages of a paged figure), and None before that.
+    """
+    outputs = stage["outputs"]
+    return list(outputs(config, artifact) if callable(outputs) else outputs)
+
+
+def _merge_stage_outputs(config, artifact=None):
+    outputs = [f"{MERGED_BASENAME}.csv"] if config.get("merged_csv", True) else []
+    if config.get("columnar_format"):
+        outputs.append(f"{MERGED_BASENAME}.{config['columnar_format']}")
+    return outputs
+
+
+def _aggregate_stage_outputs(config, artifact=None):
+    if config.get("columnar_format"):
+        return [f"{PLOT_DATA_BASENAME}.{config['columnar_format']}"]
+    return []
+
+
+def _stage_artifact_path(output_dir, stage_name):
+    """Pickle path of a stage's persisted artifact."""
+    safe_name = stage_name.replace(":", "__")
+    return os.path.join(output_dir, STAGE_CACHE_DIR, f"{safe_name}.pkl")
+
+
+def _proc_io_counters():
+    """Bytes read/written by this process (Linux `/proc/self/io`); None elsewhere."""
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _max_rss_bytes(who="self"):
+    """Peak resident set size so far; None when unavailable.
+
+    `who="self"` is this process's lifetime high-water mark; `who="children"`
+    is the largest peak among reaped child processes (e.g. plot workers).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is reported in bytes on macOS and kilobytes on Linux.
+    return int(usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024)
+
+
+def _children_cpu_seconds():
+    """User+system CPU seconds of reaped child processes; None when unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _current_rss_bytes():
+    """Current resident set size of this process (Linux `/proc/self/statm`); None elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+@contextlib.contextmanager
+def profile_block(record, trace_memory=False):
+    """Fill `record` with wall/CPU time, memory, and I/O for the enclosed block.
+
+    Memory per block is the change in current RSS (`rss_delta_bytes`);
+    `process_max_rss_bytes` is the process-lifetime high-water mark, so it
+    only rises at the block that set it. Work fanned out to child processes
+    (plot workers) is reported as `children_cpu_seconds` and
+    `children_max_rss_bytes`; it is absent from this process's CPU time and
+    `/proc/self/io` counters. Peak Python-heap allocation (`tracemalloc`,
+    which also sees NumPy buffers) is only measured when `trace_memory` is
+    set, because tracing slows allocation-heavy pandas code noticeably.
+    """
+    io_before = _proc_io_counters()
+    rss_before = _current_rss_bytes()
+    children_cpu_before = _children_cpu_seconds()
+    if trace_memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield record
+    finally:
+        record["wall_seconds"] = round(time.perf_counter() - start, 4)
+        record["cpu_seconds"] = round(time.process_time() - cpu_start, 4)
+        rss_after = _current_rss_bytes()
+        record["rss_end_bytes"] = rss_after
+        record["rss_delta_bytes"] = rss_after - rss_before if rss_before and rss_after else None
+        record["process_max_rss_bytes"] = _max_rss_bytes()
+        children_cpu_after = _children_cpu_seconds()
+        children_ran = children_cpu_before is not None and children_cpu_after > children_cpu_before
+        record["children_cpu_seconds"] = (
+            round(children_cpu_after - children_cpu_before, 4) if children_ran else None
+        )
+        record["children_max_rss_bytes"] = _max_rss_bytes("children") if children_ran else None
+        record["tracemalloc_peak_bytes"] = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        io_after = _proc_io_counters()
+        if io_before and io_after:
+            record["bytes_read"] = io_after[0] - io_before[0]
+            record["bytes_written"] = io_after[1] - io_before[1]
+        else:
+            record["bytes_read"] = None
+            record["bytes_written"] = None
+
+
+def _artifact_shape(artifact):
+    """(rows, columns) of a tabular stage artifact; (None, None) otherwise."""
+    if isinstance(artifact, pd.DataFrame):
+        return int(artifact.shape[0]), int(artifact.shape[1])
+    return None, None
+
+
+def run_stage_graph(
+    stages,
+    ctx,
+    previous_stages,
+    stage_seconds,
+    force=False,
+    on_stage_done=None,
+    stage_profiles=None,
+):
+    """Execute only stages whose fingerprint changed; reuse persisted artifacts otherwise.
+
+    A stage's fingerprint covers its code, the run options it reads, and the *output* hashes of
+    its dependencies, so an upstream stage that re-runs but produces identical
+    data does not force downstream stages to re-run. Artifacts of skipped
+    stages are unpickled lazily, only if a re-running stage needs them.
+    Per-stage measurements (see `profile_block`) go into `stage_profiles`.
+    """
+    if stage_profiles is None:
+        stage_profiles = {}
+    trace_memory = ctx.get("profile_memory", False)
+    output_dir = ctx["output_dir"]
+    os.makedirs(os.path.join(output_dir, STAGE_CACHE_DIR), exist_ok=True)
+    artifacts = {}
+    records = {}
+
+    def get(stage_name):
+        if stage_name not in artifacts:
+            with open(_stage_artifact_path(output_dir, stage_name), "rb") as f:
+                artifacts[stage_name] = pickle.load(f)
+        return artifacts[stage_name]
+
+    def store(stage, fingerprint, artifact):
+        payload = pickle.dumps(artifact, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(_stage_artifact_path(output_dir, stage["name"]), "wb") as f:
+            f.write(payload)
+        artifacts[stage["name"]] = artifact
+        records[stage["name"]] = {
+            "fingerprint": fingerprint,
+            "output_hash": hashlib.sha256(payload).hexdigest(),
+            "outputs": stage_outputs(stage, ctx["config"], artifact),
+            "status": "ran",
+        }
+
+    idx = 0
+    while idx < len(stages):
+        # Consecutive stages of one group share upstream deps and run as a batch.
+        members = [stages[idx]]
+        group = stages[idx].get("group")
+        while group and idx + len(members) < len(stages) and stages[idx + len(members)].get("group") == group:
+            members.append(stages[idx + len(members)])
+        idx += len(members)
+
+        pending = []
+        for stage in members:
+            name = stage["name"]
+            fingerprint = hashlib.sha256(
+                json.dumps(
+                    {
+                        "stage": name,
+                        "code": _code_fingerprint(stage_code(stage)),
+                        "deps": {dep: records[dep]["output_hash"] for dep in stage["deps"]},
+                        "config": {key: ctx["config"].get(key) for key in stage.get("config_keys", ())},
+                    },
+                    sort_keys=True,
+                ).encode("utf-8")
+            ).hexdigest()
+
+            previous = previous_stages.get(name, {})
+            reusable = (
+                not force
+                and not stage.get("always_run")
+                and previous.get("fingerprint") == fingerprint
+                and os.path.exists(_stage_artifact_path(output_dir, name))
+                and all(
+                    os.path.exists(os.path.join(output_dir, out))
+                    for out in previous.get("outputs", stage_outputs(stage, ctx["config"]))
+                )
+            )
+            if reusable:
+                records[name] = {**previous, "status": "cached"}
+                stage_profiles[name] = {"status": "cached"}
+                print(f"Stage {name}: up to date")
+            else:
+                pending.append((stage, fingerprint))
+
+        if not pending:
+            continue
+        if group:
+            group_profile = {"status": "ran", "stages": [stage["name"] for stage, _fp in pending]}
+            stage_profiles[group] = group_profile
+            try:
+                with profile_block(group_profile, trace_memory):
+                    group_artifacts, member_profiles = members[0]["run_group"](
+                        ctx, get, [stage for stage, _fingerprint in pending]
+                    )
+            finally:
+                stage_seconds[group] = group_profile["wall_seconds"]
+            for (stage, fingerprint), artifact in zip(pending, group_artifacts):
+                store(stage, fingerprint, artifact)
+                member_profile = {"status": "ran", **member_profiles.get(stage["name"], {})}
+                stage_profiles[stage["name"]] = member_profile
+                if "wall_seconds" in member_profile:
+                    stage_seconds[stage["name"]] = member_profile["wall_seconds"]
+        else:
+            stage, fingerprint = pending[0]
+            profile = {"status": "ran"}
+            stage_profiles[stage["name"]] = profile
+            try:
+                with profile_block(profile, trace_memory):
+                    artifact = stage["run"](ctx, get)
+            finally:
+                stage_seconds[stage["name"]] = profile["wall_seconds"]
+            profile["rows"], profile["columns"] = _artifact_shape(artifact)
+            store(stage, fingerprint, artifact)
+        if on_stage_done is not None:
+            on_stage_done(records)
+
+    return artifacts, records
+
+
+DEFAULT_RUN_OPTIONS = {
+    "export_png": False,
+    "force": False,
+    "plot_jobs": 0,
+    "table_max_rows": None,
+    "table_format": "csv",
+    "profile_memory": False,
+    "profile_summary": False,
+    "discovery_depth": 1,
+    "input_patterns": None,
+    "prune_columns": False,
+    "passthrough_columns": None,
+    "full_merged_csv": False,
+    "metric_dtype": RAW_METRIC_DTYPE,
+    "stream_chunk_rows": None,
+    "accumulator_store": None,
+    "columnar_format": None,
+    "merged_csv": True,
+    "class_rules": None,
+    "hit_rules": None,
+    "threshold_sweep": None,
+    **FIGURE_OPTION_DEFAULTS,
+}
+# Options that change output content (and therefore cache fingerprints).
+OUTPUT_OPTION_KEYS = (
+    "export_png",
+    "table_max_rows",
+    "table_format",
+    "prune_columns",
+    "passthrough_columns",
+    "full_merged_csv",
+    "metric_dtype",
+    "stream_chunk_rows",
+    "accumulator_store",
+    "columnar_format",
+    "merged_csv",
+    "class_rules",
+    "hit_rules",
+    "threshold_sweep",
+    *FIGURE_OPTION_KEYS,
+)
+
+
+def resolve_run_options(options=None):
+    """Fill unspecified run options with `DEFAULT_RUN_OPTIONS`."""
+    unknown = sorted(set(options or {}) - set(DEFAULT_RUN_OPTIONS))
+    if unknown:
+        raise ValueError(f"Unknown run options: {', '.join(unknown)}")
+    return {**DEFAULT_RUN_OPTIONS, **(options or {})}
+
+
+def write_run_profile(output_dir, profile):
+    """Write the machine-readable profile of one run into the output folder."""
+    profile_path = os.path.join(output_dir, RUN_PROFILE)
+    with open(profile_path, "w") as f:
+        json.dump(profile, f, indent=2)
+    return profile_path
+
+
+def format_profile_summary(profile):
+    """One-line run summary: totals plus the slowest stages."""
+    max_rss = profile.get("max_rss_bytes")
+    parts = [
+        f"profile {os.path.basename(os.path.normpath(profile['data_dir']))}:",
+        f"status={profile['status']}",
+        f"wall={profile['wall_seconds']:.2f}s",
+        f"cpu={profile['cpu_seconds']:.2f}s",
+        f"rss={max_rss / 2**20:.0f}MiB" if max_rss else "rss=n/a",
+    ]
+    timed_stages = [
+        (name, stage["wall_seconds"])
+        for name, stage in profile["stages"].items()
+        if stage.get("wall_seconds") is not None and not name.startswith("plot:")
+    ]
+    slowest = sorted(timed_stages, key=lambda item: item[1], reverse=True)[:4]
+    if slowest:
+        parts.append("| " + " ".join(f"{name}={seconds:.2f}s" for name, seconds in slowest))
+    if profile.get("cache_hit"):
+        parts.append("(cache hit)")
+    return " ".join(parts)
+
+
+def run_analysis(data_dir, options=None, stage_seconds=None):
+    """Run the end-to-end workflow for one plate; record wall time per stage.
+
+    `options` overrides `DEFAULT_RUN_OPTIONS`. `stage_seconds` is filled in
+    place so callers still see timings for the stages that completed when a
+    later stage raises. Unless the `force` option is set,
+    the run is skipped when the output folder's cache manifest matches the
+    current inputs, script, and config; otherwise only the stages downstream
+    of an actual change re-execute. Every run (including failures and cache
+    hits) writes `run_profile.json` with per-stage time, memory, and I/O.
+    Returns the output folder, whether the whole-plate cache was hit, and the
+    stages that re-ran.
+    """
+    options = resolve_run_options(options)
+    force = options["force"]
+    if stage_seconds is None:
+        stage_seconds = {}
+
+    # 1) Resolve output location and skip the plate when nothing changed.
+    output_dir = get_output_dir(data_dir)
+    print(f"Writing outputs to: {output_dir}")
+
+    started_tracing = options["profile_memory"] and not tracemalloc.is_tracing()
+    profile = {
+        "data_dir": os.path.abspath(data_dir),
+        "output_dir": output_dir,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "status": "failed",
+        "cache_hit": False,
+        "error": None,
+        "options": options,
+        "stages": {},
+    }
+    run_start = time.perf_counter()
+    run_cpu_start = time.process_time()
+    try:
+        fingerprint_profile = {"status": "ran"}
+        profile["stages"]["fingerprint"] = fingerprint_profile
+        with profile_block(fingerprint_profile, options["profile_memory"]):
+            input_csvs = find_input_csvs(
+                data_dir, options["discovery_depth"], options["input_patterns"]
+            )
+            config = {key: options[key] for key in OUTPUT_OPTION_KEYS}
+            store_source = None
+            if options["accumulator_store"]:
+                # Other plates' contributions change pooled statistics, so they are part of the key.
+                store = AccumulatorStore(options["accumulator_store"])
+                config["accumulator_store_others"] = store.fingerprint(exclude=os.path.abspath(data_dir))
+                store_source = store.source_fingerprint(os.path.abspath(data_dir))
+            manifest = load_cache_manifest(output_dir)
+            cache_key, inputs = compute_cache_key(*input_csvs, config, manifest)
+        stage_seconds["fingerprint"] = fingerprint_profile["wall_seconds"]
+        # This plate's own contribution must still be in the store as the last run left it
+        # (not removed, reset, or restored from an older copy); otherwise rebuild and rewrite it.
+        store_intact = store_source == (manifest or {}).get("accumulator_store_source")
+        if not force and store_intact and is_cache_hit(manifest, cache_key, output_dir):
+            print(f"Outputs are up to date (cache key {cache_key[:12]}); skipping. Use --force to rebuild.")
+            profile["status"] = "succeeded"
+            profile["cache_hit"] = True
+            return {"output_dir": output_dir, "cache_hit": True, "stages_run": []}
+
+        # 2) Re-run only stages whose inputs/code changed; persist progress as stages finish.
+        stages = build_pipeline_stages()
+        outputs = [out for stage in stages for out in stage_outputs(stage, config)]
+        previous_stages = (manifest or {}).get("stages", {})
+        if not store_intact:
+            previous_stages = {name: record for name, record in previous_stages.items() if name != "aggregate"}
+        ctx = {
+            "data_dir": data_dir,
+            "output_dir": output_dir,
+            "input_csvs": input_csvs,
+            "inputs": inputs,
+            "config": config,
+            "plot_jobs": options["plot_jobs"],
+            "profile_memory": options["profile_memory"],
+        }
+
+        def checkpoint(records):
+            write_cache_manifest(output_dir, None, inputs, config, outputs, {**previous_stages, **records})
+
+        _artifacts, records = run_stage_graph(
+            stages,
+            ctx,
+            previous_stages,
+            stage_seconds,
+            force,
+            on_stage_done=checkpoint,
+            stage_profiles=profile["stages"],
+        )
+        # Data-dependent outputs (figure pages) are known once each stage has run.
+        outputs = [
+            out for stage in stages for out in records[stage["name"]].get("outputs", stage_outputs(stage, config))
+        ]
+        if options["accumulator_store"]:
+            store_source = AccumulatorStore(options["accumulator_store"]).source_fingerprint(
+                os.path.abspath(data_dir)
+            )
+        write_cache_manifest(output_dir, cache_key, inputs, config, outputs, records, store_source)
+        profile["status"] = "succeeded"
+        stages_run = [name for name, record in records.items() if record["status"] == "ran"]
+        return {"output_dir": output_dir, "cache_hit": False, "stages_run": stages_run}
+    except Exception as e:
+        profile["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        profile["wall_seconds"] = round(time.perf_counter() - run_start, 4)
+        profile["cpu_seconds"] = round(time.process_time() - run_cpu_start, 4)
+        profile["max_rss_bytes"] = _max_rss_bytes()
+        profile["children_max_rss_bytes"] = _max_rss_bytes("children")
+        if started_tracing:
+            tracemalloc.stop()
+        write_run_profile(output_dir, profile)
+        if options["profile_summary"]:
+            print(format_profile_summary(profile), file=sys.stderr)
+
+
+ANALYZE_CONFIG_DEFAULTS = {
+    "extra_stats": (),
+    "plot_jobs": 1,
+    "table_max_rows": None,
+    "table_format": "csv",
+    "columnar_format": None,
+    "merged_csv": True,
+    "class_rules": None,
+    "hit_rules": None,
+    **FIGURE_OPTION_DEFAULTS,
+}
+
+
+class AnalysisResult:
+    """In-memory result of `analyze`: tables, thresholds, findings, lazy figures.
+
+    Nothing is written to disk until `save` is called; figures are drawn on
+    first access and cached.
+    """
+
+    def __init__(self, merged, target_cols, plot_data, thresholds, config):
+        self.merged = merged
+        self.target_cols = target_cols
+        self.plot_data = plot_data
+        self.thresholds = thresholds
+        self.config = config
+        self.key_findings = compute_key_findings(
+            plot_data, thresholds["mock_expression_threshold"], config["hit_rules"]
+        )
+        self.figure_options = {key: config[key] for key in FIGURE_OPTION_KEYS}
+        self._figure_data = None
+        self._figures = {}
+
+    @property
+    def hits(self):
+        """Samples passing every Key Findings step (the last hit rule)."""
+        return list(self.key_findings["hits"])
+
+    def hit_calls(self):
+        """Per-sample pass/fail for every hit rule as a DataFrame."""
+        return hit_calls(self.plot_data, self.key_findings["passes"])
+
+    def threshold_sweep(self, ranges):
+        """Hit counts per combination of rule multipliers (see `threshold_sweep`)."""
+        return threshold_sweep(
+            self.plot_data, self.thresholds["mock_expression_threshold"], ranges, self.config["hit_rules"]
+        )
+
+    @property
+    def figure_data(self):
+        """Plot rows in figure order (mock rows removed), built on first use."""
+        if self._figure_data is None:
+            self._figure_data = build_figure_data(self.plot_data)
+        return self._figure_data
+
+    def table(self):
+        """Report data table (display names, `mean ± SEM` strings, pass flag)."""
+        return build_report_table(self.plot_data, self.thresholds["mock_expression_threshold"])
+
+    def figure(self, metric_id):
+        """Matplotlib `Figure` for one metric id from `METRIC_CONFIGS` (first page when paged)."""
+        if metric_id not in self._figures:
+            metric_cfgs = {cfg["metric_id"]: cfg for cfg in METRIC_CONFIGS}
+            if metric_id not in metric_cfgs:
+                raise ValueError(
+                    f"Unknown metric id {metric_id!r}; expected one of: {', '.join(metric_cfgs)}"
+                )
+            metric_cfg = metric_cfgs[metric_id]
+            figure_mode = resolve_figure_mode(len(self.figure_data), self.figure_options)
+            title, _filename, rows = figure_pages(self.figure_data, metric_cfg, self.figure_options)[0]
+            self._figures[metric_id] = build_metric_figure(
+                rows,
+                metric_cfg,
+                self.thresholds["mock_expression_threshold"],
+                self.thresholds["percent_parent_threshold"],
+                "rank" if figure_mode == "rank" else "bars",
+                self.figure_options["label_top_k"],
+                metric_y_max(self.figure_data, metric_cfg, self.thresholds["mock_expression_threshold"]),
+                title,
+            )
+        return self._figures[metric_id]
+
+    def report_markdown(self):
+        """Markdown report text with the data table inlined."""
+        plot_files = [
+            [(title, filename) for title, filename, _rows in figure_pages(self.figure_data, cfg, self.figure_options)]
+            for cfg in METRIC_CONFIGS
+        ]
+        return build_report_markdown(
+            self.plot_data,
+            plot_files,
+            self.thresholds["mock_expression_threshold"],
+            findings=self.key_findings,
+        )
+
+    def save(self, output_dir):
+        """Write the CLI's result files into `output_dir` with the same writers.
+
+        That is the merged table (CSV and/or columnar), `sample_stats`,
+        figures, the report and `hit_calls.csv`. Run bookkeeping
+        (`run_profile.json`, the cache manifest) is CLI-only.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        columnar_format = self.config["columnar_format"]
+        write_merged_tables(self.merged, output_dir, columnar_format, self.config["merged_csv"])
+        if columnar_format:
+            write_sample_stats(self.plot_data, output_dir, columnar_format)
+        plot_files = render_metric_plots(
+            self.figure_data,
+            METRIC_CONFIGS,
+            output_dir,
+            self.thresholds["mock_expression_threshold"],
+            self.thresholds["percent_parent_threshold"],
+            self.config["plot_jobs"],
+            figure_options=self.figure_options,
         )
         generate_report(
-            plot_data,
+            self.plot_data,
             plot_files,
-            target_cols,
+            self.target_cols,
             output_dir,
-            mock_expression_threshold,
-            percent_parent_threshold,
+            self.thresholds["mock_expression_threshold"],
+            self.thresholds["percent_parent_threshold"],
+            self.config["table_max_rows"],
+            self.config["table_format"],
+            self.config["hit_rules"],
+        )
+        return output_dir
+
+
+def analyze(raw_df, mapping_df, config=None):
+    """Run the analysis on in-memory DataFrames and return an `AnalysisResult`.
+
+    `raw_df` is the FlowJo table (first column = sample identifier) and
+    `mapping_df` the plate mapping, exactly as `pd.read_csv` would load them.
+    `config` overrides `ANALYZE_CONFIG_DEFAULTS`.
+    """
+    unknown = sorted(set(config or {}) - set(ANALYZE_CONFIG_DEFAULTS))
+    if unknown:
+        raise ValueError(
+            f"Unknown analyze config keys: {', '.join(unknown)}. "
+            f"Expected any of: {', '.join(ANALYZE_CONFIG_DEFAULTS)}"
+        )
+    config = {**ANALYZE_CONFIG_DEFAULTS, **(config or {})}
+    if config["table_format"] not in REPORT_TABLE_FORMATS:
+        raise ValueError(
+            f"Unsupported table_format {config['table_format']!r}; "
+            f"expected one of: {', '.join(REPORT_TABLE_FORMATS)}"
+        )
+    if config["columnar_format"] not in (None, *COLUMNAR_FORMATS):
+        raise ValueError(
+            f"Unsupported columnar_format {config['columnar_format']!r}; "
+            f"expected one of: {', '.join(COLUMNAR_FORMATS)}"
+        )
+
+    resolve_hit_rules(config["hit_rules"])
+    resolve_figure_options({key: config[key] for key in FIGURE_OPTION_KEYS})
+
+    merged = merge_raw_and_mapping(raw_df, mapping_df)
+    target_cols = identify_columns(merged)
+    validate_target_columns(target_cols, merged.columns)
+    rules = resolve_class_rules(config["class_rules"])
+    plot_data = add_sample_classes(build_plot_data(merged, target_cols, tuple(config["extra_stats"])), rules)
+    thresholds = {
+        "mock_expression_threshold": calculate_mock_expression_threshold(merged, target_cols, rules),
+        "percent_parent_threshold": calculate_percent_parent_plot_threshold(plot_data),
+        "flag_percent_parent_threshold": calculate_percent_parent_threshold(plot_data),
+    }
+    return AnalysisResult(merged, target_cols, plot_data, thresholds, config)
+
+
+def analyze_directory(data_dir, config=None):
+    """`analyze` on the raw/mapping CSV pair discovered in `data_dir` (nothing is written)."""
+    raw_csv, mapping_csv = find_input_csvs(data_dir)
+    return analyze(read_input_csv(raw_csv), read_input_csv(mapping_csv), config)
+
+
+def expand_data_dirs(patterns, manifest_path=None):
+    """Expand CLI directory arguments, glob patterns, and an optional manifest file.
+
+    Manifest files list one directory (or glob) per line; blank lines and lines
+    starting with `#` are ignored, and relative entries resolve against the
+    manifest's own folder. Order is preserved and duplicates are dropped.
+    """
+    entries = list(patterns or [])
+    if manifest_path:
+        manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+        with open(manifest_path) as f:
+            for line in f:
+                entry = line.strip()
+                if not entry or entry.startswith("#"):
+                    continue
+                if not os.path.isabs(entry):
+                    entry = os.path.join(manifest_dir, entry)
+                entries.append(entry)
+
+    data_dirs = []
+    seen = set()
+    for entry in entries:
+        # Unmatched globs fall through as literal paths so they surface as per-plate failures.
+        matches = sorted(glob.glob(entry)) if glob.has_magic(entry) else [entry]
+        for match in matches:
+            if glob.has_magic(entry) and not input_path_exists(match):
+                continue
+            key = os.path.abspath(os.path.normpath(match))
+            if key not in seen:
+                seen.add(key)
+                data_dirs.append(match)
+    return data_dirs
+
+
+def resolve_input_patterns(raw_patterns=None, mapping_patterns=None):
+    """Input filename patterns with per-role overrides; None when both use the defaults."""
+    if not raw_patterns and not mapping_patterns:
+        return None
+    return {
+        "mapping": list(mapping_patterns or INPUT_FILE_PATTERNS["mapping"]),
+        "raw": list(raw_patterns or INPUT_FILE_PATTERNS["raw"]),
+    }
+
+
+def _init_batch_worker(in_process_plots=True):
+    """Process-pool initializer: force a non-interactive backend in each worker.
+
+    With `in_process_plots`, automatic figure rendering (`plot_jobs=0`)
+    stays in the worker instead of starting a figure pool per plate.
+    """
+    global _IN_BATCH_WORKER
+    plt.switch_backend("Agg")
+    _IN_BATCH_WORKER = in_process_plots
+
+
+def _analyze_plate_safely(data_dir, options=None):
+    """Analyze one plate and capture any failure as a status record."""
+    import traceback
+
+    record = {
+        "data_dir": data_dir,
+        "output_dir": None,
+        "status": "succeeded",
+        "cache_hit": False,
+        "stages_run": [],
+        "error": None,
+        "traceback": None,
+        "stage_seconds": {},
+        "total_seconds": None,
+    }
+    start = time.perf_counter()
+    try:
+        result = run_analysis(data_dir, options, record["stage_seconds"])
+        record["output_dir"] = result["output_dir"]
+        record["cache_hit"] = result["cache_hit"]
+        record["stages_run"] = result["stages_run"]
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = f"{type(e).__name__}: {e}"
+        record["traceback"] = traceback.format_exc()
+    record["total_seconds"] = round(time.perf_counter() - start, 4)
+    return record
+
+
+def write_batch_summary(records, summary_dir, jobs, wall_seconds):
+    """Write batch-level JSON + markdown summaries of plate status and stage timings."""
+    os.makedirs(summary_dir, exist_ok=True)
+    succeeded = [r for r in records if r["status"] == "succeeded"]
+    failed = [r for r in records if r["status"] != "succeeded"]
+    cached = [r for r in succeeded if r.get("cache_hit")]
+
+    json_path = os.path.join(summary_dir, BATCH_SUMMARY_JSON)
+    with open(json_path, "w") as f:
+        json.dump(
+            {
+                "jobs": jobs,
+                "wall_seconds": round(wall_seconds, 4),
+                "plates": len(records),
+                "succeeded": len(succeeded),
+                "failed": len(failed),
+                "cached": len(cached),
+                "results": records,
+            },
+            f,
+            indent=2,
+        )
+
+    stage_names = []
+    for record in records:
+        for stage_name in record["stage_seconds"]:
+            if stage_name not in stage_names:
+                stage_names.append(stage_name)
+    table_df = pd.DataFrame(
+        [
+            {
+                "Plate": os.path.basename(os.path.normpath(r["data_dir"])),
+                "Status": r["status"],
+                "Cached": "Yes" if r.get("cache_hit") else "No",
+                **{f"{name} (s)": r["stage_seconds"].get(name) for name in stage_names},
+                "Total (s)": r["total_seconds"],
+                "Error": r["error"] or "",
+            }
+            for r in records
+        ]
+    )
+
+    md_path = os.path.join(summary_dir, BATCH_SUMMARY_MD)
+    with open(md_path, "w") as f:
+        f.write("# Flow Cytometry Batch Summary\n\n")
+        f.write(f"- Plates: {len(records)}\n")
+        f.write(f"- Succeeded: {len(succeeded)}\n")
+        f.write(f"- Failed: {len(failed)}\n")
+        f.write(f"- Skipped (cache hit): {len(cached)}\n")
+        f.write(f"- Worker processes: {jobs}\n")
+        f.write(f"- Wall time: {wall_seconds:.2f} s\n\n")
+        f.write("## Plates\n\n")
+        f.write(table_df.to_markdown(index=False))
+        f.write("\n")
+
+    print(f"Generated {json_path}")
+    print(f"Generated {md_path}")
+    return json_path, md_path
+
+
+def run_batch(data_dirs, jobs=1, options=None, summary_dir=None):
+    """Fan the per-plate workflow out over a process pool and summarize results."""
+    options = resolve_run_options(options)
+    if summary_dir is None:
+        summary_dir = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+
+    # Output folders are keyed by input basename, so same-named plates would overwrite each other.
+    by_output = {}
+    for data_dir in data_dirs:
+        by_output.setdefault(_output_dir_path(data_dir), []).append(data_dir)
+    records_by_dir = {}
+    runnable = []
+    for output_path, dirs in by_output.items():
+        if len(dirs) == 1:
+            runnable.append(dirs[0])
+            continue
+        for data_dir in dirs:
+            records_by_dir[data_dir] = {
+                "data_dir": data_dir,
+                "output_dir": output_path,
+                "status": "failed",
+                "cache_hit": False,
+                "stages_run": [],
+                "error": (
+                    "Output directory collision: plates "
+                    f"{', '.join(dirs)} all map to {output_path}"
+                ),
+                "traceback": None,
+                "stage_seconds": {},
+                "total_seconds": 0.0,
+            }
+
+    if jobs <= 1 or len(runnable) <= 1:
+        for data_dir in runnable:
+            records_by_dir[data_dir] = _analyze_plate_safely(data_dir, options)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_batch_worker) as pool:
+            futures = {
+                pool.submit(_analyze_plate_safely, data_dir, options): data_dir
+                for data_dir in runnable
+            }
+            for future in as_completed(futures):
+                record = future.result()
+                records_by_dir[futures[future]] = record
+                print(f"[{record['status']}] {record['data_dir']} ({record['total_seconds']:.2f} s)")
+
+    # Report in input order regardless of completion order.
+    records = [records_by_dir[data_dir] for data_dir in data_dirs]
+    for record in records:
+        if record["status"] != "succeeded":
+            print(f"Failed: {record['data_dir']}: {record['error']}")
+    write_batch_summary(records, summary_dir, jobs, time.perf_counter() - start)
+    return records
+
+
+def preflight_plate(data_dir, options=None):
+    """Check one plate's inputs from CSV headers and sample-name columns only.
+
+    Runs input discovery, `resolve_mapping_columns`, the `identify_columns`
+    patterns, and the raw/mapping sample coverage check of the merge, without
+    loading metric values. Returns a record whose `problems` lists every
+    issue found (empty when the plate would pass these checks).
+    """
+    options = resolve_run_options(options)
+    record = {
+        "data_dir": data_dir,
+        "status": "ok",
+        "raw_csv": None,
+        "mapping_csv": None,
+        "raw_samples": None,
+        "mapping_samples": None,
+        "problems": [],
+        "warnings": [],
+    }
+    problems = record["problems"]
+    try:
+        raw_csv, mapping_csv = find_input_csvs(
+            data_dir, options["discovery_depth"], options["input_patterns"]
         )
+    except (FileNotFoundError, ValueError) as e:
+        problems.append(str(e))
+        record["status"] = "invalid"
+        return record
+    record["raw_csv"] = raw_csv
+    record["mapping_csv"] = mapping_csv
+
+    try:
+        raw_header = list(read_input_csv(raw_csv, nrows=0).columns)
+        mapping_header = list(read_input_csv(mapping_csv, nrows=0).columns)
+    except Exception as e:
+        problems.append(f"Could not read CSV header: {type(e).__name__}: {e}")
+        record["status"] = "invalid"
+        return record
+
+    try:
+        validate_target_columns(match_metric_columns(raw_header), raw_header)
+    except ValueError as e:
+        problems.append(str(e))
+
+    mapping_cols = None
+    try:
+        mapping_cols = resolve_mapping_columns(mapping_header)
+    except ValueError as e:
+        problems.append(str(e))
+
+    if raw_header and mapping_cols is not None:
+        # Same cleaning and matching rules as `merge_raw_and_mapping`, on two small column reads.
+        raw_names = read_input_csv(raw_csv, usecols=[0]).iloc[:, 0]
+        raw_names = raw_names[~raw_names.astype(str).str.strip().str.lower().isin(["mean", "sd"])].dropna()
+        mapping = read_input_csv(mapping_csv, usecols=list(mapping_cols.values()))
+        mapping_names = mapping[mapping_cols["Sample Name"]]
+        metadata_cols = [mapping_cols[col] for col in REQUIRED_MAPPING_COLUMNS[1:]]
+        incomplete = mapping[metadata_cols].isna().any(axis=1)
+        complete_names = set(mapping_names[~incomplete])
+        incomplete_names = set(mapping_names[incomplete])
+        unmatched = [
+            str(name)
+            for name in dict.fromkeys(raw_names)
+            if name not in complete_names or name in incomplete_names
+        ]
+        record["raw_samples"] = int(raw_names.nunique())
+        record["mapping_samples"] = int(mapping_names.nunique())
+        if unmatched:
+            preview = ", ".join(unmatched[:10])
+            suffix = "..." if len(unmatched) > 10 else ""
+            problems.append(
+                "Found raw samples missing mapping metadata (Updated Sample Name, Sample Type, and/or Replicate). "
+                f"Unmatched samples ({len(unmatched)}): {preview}{suffix}"
+            )
+        unused = [str(name) for name in dict.fromkeys(mapping_names.dropna()) if name not in set(raw_names)]
+        if unused:
+            preview = ", ".join(unused[:10])
+            suffix = "..." if len(unused) > 10 else ""
+            record["warnings"].append(f"Mapping samples without raw rows ({len(unused)}): {preview}{suffix}")
+
+    if problems:
+        record["status"] = "invalid"
+    return record
+
+
+def run_preflight(data_dirs, jobs=1, options=None, summary_dir=None):
+    """Preflight many plates; print every problem and write `preflight_summary.json`."""
+    if summary_dir is None:
+        summary_dir = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    if jobs <= 1 or len(data_dirs) <= 1:
+        records = [preflight_plate(data_dir, options) for data_dir in data_dirs]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            records = list(
+                pool.map(preflight_plate, data_dirs, [options] * len(data_dirs), chunksize=16)
+            )
+    wall_seconds = time.perf_counter() - start
+
+    invalid = [record for record in records if record["status"] != "ok"]
+    for record in records:
+        for problem in record["problems"]:
+            print(f"[invalid] {record['data_dir']}: {problem}")
+        for warning in record["warnings"]:
+            print(f"[warning] {record['data_dir']}: {warning}")
+    print(
+        f"Preflight checked {len(records)} plate(s) in {wall_seconds:.2f} s: "
+        f"{len(records) - len(invalid)} ok, {len(invalid)} invalid"
+    )
+
+    os.makedirs(summary_dir, exist_ok=True)
+    json_path = os.path.join(summary_dir, PREFLIGHT_SUMMARY_JSON)
+    with open(json_path, "w") as f:
+        json.dump(
+            {
+                "plates": len(records),
+                "ok": len(records) - len(invalid),
+                "invalid": len(invalid),
+                "wall_seconds": round(wall_seconds, 4),
+                "results": records,
+            },
+            f,
+            indent=2,
+        )
+    print(f"Generated {json_path}")
+    return records
+
+
+def main():
+    """CLI entrypoint for the end-to-end analysis/report generation workflow."""
+    parser = argparse.ArgumentParser(description="Analyze Flow Cytometry Data")
+    parser.add_argument(
+        "data_dir",
+        nargs="*",
+        help="Path(s) or glob(s) of directories containing raw CSV and plate mapping CSV",
+    )
+    parser.add_argument("--export-png", action="store_true", help="Export plots as PNG files")
+    parser.add_argument(
+        "--prune-columns",
+        action="store_true",
+        help="Load only the sample and metric columns (float32 metrics, categorical metadata)",
+    )
+    parser.add_argument(
+        "--passthrough-column",
+        action="append",
+        help="Extra raw column to keep with --prune-columns (repeatable)",
+    )
+    parser.add_argument(
+        "--full-merged-csv",
+        action="store_true",
+        help="With --prune-columns, still write every raw column to processed_flow_data.csv",
+    )
+    parser.add_argument(
+        "--metric-dtype",
+        choices=RAW_METRIC_DTYPES,
+        default=RAW_METRIC_DTYPE,
+        help="Metric column dtype with --prune-columns (default: float32; float64 keeps full precision)",
+    )
+    parser.add_argument(
+        "--stream-chunk-rows",
+        type=int,
+        help="Stream the raw CSV in chunks of this many rows instead of loading it whole",
+    )
+    parser.add_argument(
+        "--columnar-format",
+        choices=COLUMNAR_FORMATS,
+        help="Also write processed_flow_data and sample_stats as typed Parquet/Feather tables (needs pyarrow)",
+    )
+    parser.add_argument(
+        "--no-merged-csv",
+        action="store_true",
+        help="With --columnar-format, skip the processed_flow_data.csv compatibility export",
+    )
+    parser.add_argument(
+        "--class-rules",
+        help="JSON file overriding SAMPLE_CLASS_RULES keys (mock/FLAG/His name patterns, roles, orderings)",
+    )
+    parser.add_argument(
+        "--hit-rules",
+        help="JSON file with Key Findings hit rules ('rules' replaces HIT_RULES, 'references' extends HIT_REFERENCES)",
+    )
+    parser.add_argument(
+        "--sweep",
+        action="append",
+        metavar="RULE=RANGE",
+        help=(
+            "Hit-rule multipliers to sweep, e.g. passed_expression=1:3:0.5 or passed_percent_parent=1.5,2,3 "
+            "(repeatable; writes threshold_sweep.csv, plus a heatmap for two rules)"
+        ),
+    )
+    parser.add_argument(
+        "--accumulator-store",
+        help="JSON store of per-sample accumulators; pools replicates of the same sample across plates/runs",
+    )
+    parser.add_argument(
+        "--validate-only",
+        action="store_true",
+        help="Only check CSV headers, mapping columns, and sample coverage; write preflight_summary.json",
+    )
+    parser.add_argument(
+        "--discover",
+        action="append",
+        metavar="ROOT",
+        help="Recursively find plate folders (complete raw + mapping pair) under ROOT; implies batch mode",
+    )
+    parser.add_argument(
+        "--discovery-depth",
+        type=int,
+        default=1,
+        help="Folder levels below each data_dir searched for its CSVs (default: 1)",
+    )
+    parser.add_argument(
+        "--discovery-index",
+        help="JSON index of directory listings reused by --discover to skip unchanged folders",
+    )
+    parser.add_argument(
+        "--raw-pattern",
+        action="append",
+        help="Filename glob for the raw CSV (repeatable; default: *flowjo table*.csv, *reanaly*.csv)",
+    )
+    parser.add_argument(
+        "--mapping-pattern",
+        action="append",
+        help="Filename glob for the mapping CSV (repeatable; default: *plate_mapping*.csv)",
+    )
+    parser.add_argument(
+        "--manifest",
+        help="Text file listing plate directories (one per line) to analyze in batch mode",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes for batch mode (default: 1)",
+    )
+    parser.add_argument(
+        "--plot-jobs",
+        type=int,
+        default=0,
+        help="Worker processes for figure rendering (default: 0 = up to CPU count, two bar charts per worker)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-run even when the output folder's cache manifest says inputs are unchanged",
+    )
+    parser.add_argument(
+        "--batch-summary-dir",
+        help="Folder for batch_summary.json/.md and preflight_summary.json (default: project folder)",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="Also record peak traced allocations per stage in run_profile.json (slower)",
+    )
+    parser.add_argument(
+        "--profile-summary",
+        action="store_true",
+        help="Print a one-line timing/memory summary per plate on stderr",
+    )
+    parser.add_argument(
+        "--figure-mode",
+        choices=FIGURE_MODES,
+        default=FIGURE_OPTION_DEFAULTS["figure_mode"],
+        help=(
+            "Figure layout: one bar per sample, paged bar charts, or one ranked plot "
+            "(default: auto = ranked above --large-library-threshold samples)"
+        ),
+    )
+    parser.add_argument(
+        "--large-library-threshold",
+        type=int,
+        default=FIGURE_OPTION_DEFAULTS["large_library_threshold"],
+        help="Figure samples (mock rows excluded) above which auto mode draws ranked plots (default: 200)",
+    )
+    parser.add_argument(
+        "--bars-per-page",
+        type=int,
+        default=FIGURE_OPTION_DEFAULTS["bars_per_page"],
+        help="Samples per page with --figure-mode paged (default: 60)",
+    )
+    parser.add_argument(
+        "--label-top-k",
+        type=int,
+        default=FIGURE_OPTION_DEFAULTS["label_top_k"],
+        help="Experimental samples labeled in ranked plots besides the controls (default: 10)",
+    )
+    parser.add_argument(
+        "--table-max-rows",
+        type=int,
+        help="Write the report data table to a separate file when it exceeds this many rows",
+    )
+    parser.add_argument(
+        "--table-format",
+        choices=REPORT_TABLE_FORMATS,
+        default="csv",
+        help="File format for an oversized report data table (default: csv)",
+    )
+    args = parser.parse_args()
+    options = {
+        "export_png": args.export_png,
+        "force": args.force,
+        "plot_jobs": args.plot_jobs,
+        "table_max_rows": args.table_max_rows,
+        "table_format": args.table_format,
+        "profile_memory": args.profile_memory,
+        "profile_summary": args.profile_summary,
+        "discovery_depth": args.discovery_depth,
+        "input_patterns": resolve_input_patterns(args.raw_pattern, args.mapping_pattern),
+        "prune_columns": args.prune_columns,
+        "passthrough_columns": args.passthrough_column,
+        "full_merged_csv": args.full_merged_csv,
+        "metric_dtype": args.metric_dtype,
+        "stream_chunk_rows": args.stream_chunk_rows,
+        "accumulator_store": os.path.abspath(args.accumulator_store) if args.accumulator_store else None,
+        "columnar_format": args.columnar_format,
+        "merged_csv": not args.no_merged_csv,
+        "class_rules": None,
+        "hit_rules": None,
+        "threshold_sweep": None,
+        "figure_mode": args.figure_mode,
+        "large_library_threshold": args.large_library_threshold,
+        "bars_per_page": args.bars_per_page,
+        "label_top_k": args.label_top_k,
+    }
+    try:
+        resolve_figure_options({key: options[key] for key in FIGURE_OPTION_KEYS})
+    except ValueError as e:
+        parser.error(str(e))
+    if args.sweep:
+        try:
+            options["threshold_sweep"] = dict(parse_sweep_spec(spec) for spec in args.sweep)
+        except ValueError as e:
+            parser.error(f"--sweep: {e}")
+    if args.hit_rules:
+        try:
+            options["hit_rules"] = load_hit_rules(args.hit_rules)
+        except (OSError, ValueError) as e:
+            parser.error(f"--hit-rules: {e}")
+    if options["threshold_sweep"]:
+        rule_names = [rule["name"] for rule in resolve_hit_rules(options["hit_rules"])["rules"]]
+        unknown = [name for name in options["threshold_sweep"] if name not in rule_names]
+        if unknown:
+            parser.error(f"--sweep: unknown hit rules {', '.join(unknown)}; available: {', '.join(rule_names)}")
+        try:
+            check_sweep_size(options["threshold_sweep"])
+        except ValueError as e:
+            parser.error(f"--sweep: {e}")
+    if args.class_rules:
+        try:
+            options["class_rules"] = load_class_rules(args.class_rules)
+        except (OSError, ValueError) as e:
+            parser.error(f"--class-rules: {e}")
+    if args.no_merged_csv and not args.columnar_format:
+        parser.error("--no-merged-csv requires --columnar-format")
+
+    data_dirs = expand_data_dirs(args.data_dir, args.manifest)
+    if args.discover:
+        index = DiscoveryIndex(args.discovery_index, options["input_patterns"])
+        for root in args.discover:
+            plate_dirs, ambiguous = discover_plate_dirs(root, patterns=options["input_patterns"], index=index)
+            print(f"Discovered {len(plate_dirs)} plate folder(s) under {root}")
+            for description in ambiguous.values():
+                print(f"Ambiguous inputs (will be reported as failed): {description}")
+            # Ambiguous folders still run so the batch summary lists them with the error.
+            data_dirs.extend(sorted(plate_dirs + list(ambiguous)))
+        index.save()
+        seen = set()
+        data_dirs = [
+            d for d in data_dirs
+            if not (os.path.abspath(d) in seen or seen.add(os.path.abspath(d)))
+        ]
+    if not data_dirs:
+        parser.error("provide at least one data_dir, --discover root, or --manifest")
+
+    if args.validate_only:
+        records = run_preflight(data_dirs, args.jobs, options, args.batch_summary_dir)
+        if any(record["status"] != "ok" for record in records):
+            sys.exit(1)
+        return
+
+    # Batch mode: many plates (or a manifest/discovery root) get per-plate isolation and a summary.
+    if len(data_dirs) > 1 or args.manifest or args.discover:
+        records = run_batch(data_dirs, args.jobs, options, args.batch_summary_dir)
+        if any(record["status"] != "succeeded" for record in records):
+            sys.exit(1)
+        return
+
+    try:
+        run_analysis(data_dirs[0], options)
     except Exception as e:
         # Preserve full traceback for faster debugging in local runs.
         print(f"Error: {e}")
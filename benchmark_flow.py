@@ -0,0 +1,332 @@
+"""Synthetic-data benchmark for the `analyze_flow.py` pipeline stages.
+
+Generates realistic FlowJo-export and plate-mapping CSV pairs at several
+scales, runs each pipeline stage on them, and writes timings to a JSON file
+that can be compared across script versions.
+
+Generated data mirrors real exports:
+- FlowJo metric headers (`Cells/Singlets/... | Freq. of Parent (%)`, etc.).
+- An unnamed first (sample) column and an `Unnamed:` placeholder column.
+- Trailing `Mean` / `SD` artifact rows.
+- Mock (His/FLAG), positive (a-His, K1-70, FLAG binder), and negative
+  controls plus experimental designs, each with replicates.
+
+Examples:
+
+    python3 benchmark_flow.py --scales 96 384 --repeats 5
+    python3 benchmark_flow.py --scales 100k --output bench_new.json --compare bench_old.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import analyze_flow
+
+SCALES = {
+    "96": {"wells": 96, "replicates": 3},
+    "384": {"wells": 384, "replicates": 3},
+    "1536": {"wells": 1536, "replicates": 2},
+    "100k": {"designs": 100_000, "replicates": 1},
+}
+
+# (True Sample Name, Sample Type, replicates)
+CONTROL_SAMPLES = (
+    ("mock_His", "Negative Control", 3),
+    ("mock_FLAG", "Negative Control", 3),
+    ("Negative Control 1", "Negative Control", 3),
+    ("a-His control", "Positive Control", 3),
+    ("K1-70 control", "Positive Control", 3),
+    ("FLAG binder control", "Positive Control", 3),
+)
+
+FLAG_GATE = "Cells/Singlets/a-FLAG_AF647(+)"
+HIS_GATE = f"{FLAG_GATE}/a-His_AF488(+)"
+METRIC_HEADERS = (
+    "Cells/Singlets | Count",
+    f"{FLAG_GATE} | Count",
+    f"{FLAG_GATE} | Freq. of Parent (%)",
+    f"{FLAG_GATE} | Geometric Mean (R1-A :: miRFP-A)",
+    f"{FLAG_GATE} | Geometric Mean (B1-A :: AF488-A)",
+    f"{FLAG_GATE} | Geometric Mean (Ratio_AF488_AF647)",
+    f"{HIS_GATE} | Count",
+    f"{HIS_GATE} | Freq. of Parent (%)",
+    f"{HIS_GATE} | Geometric Mean (R1-A :: miRFP-A)",
+    f"{HIS_GATE} | Geometric Mean (B1-A :: AF488-A)",
+    f"{HIS_GATE} | Geometric Mean (Ratio_AF488_AF647)",
+)
+
+
+def _plate_layout(scale):
+    """List of (True Sample Name, Sample Type, replicate) rows for a scale."""
+    spec = SCALES[scale]
+    replicates = spec["replicates"]
+    rows = [
+        (name, sample_type, rep)
+        for name, sample_type, n_reps in CONTROL_SAMPLES
+        for rep in range(1, n_reps + 1)
+    ]
+    if "designs" in spec:
+        n_designs = spec["designs"]
+    else:
+        n_designs = max((spec["wells"] - len(rows)) // replicates, 1)
+    rows.extend(
+        (f"Design_{idx:06d}", "Experimental Sample", rep)
+        for idx in range(1, n_designs + 1)
+        for rep in range(1, replicates + 1)
+    )
+    return rows
+
+
+def generate_dataset(scale, data_dir, seed=0):
+    """Write `<scale> FlowJo table.csv` and `<scale>_plate_mapping.csv` into `data_dir`."""
+    rng = np.random.default_rng(seed)
+    layout = _plate_layout(scale)
+    n_rows = len(layout)
+    sample_ids = [f"BENCH{scale}.{idx:06d}.mqd" for idx in range(1, n_rows + 1)]
+
+    mapping_df = pd.DataFrame(
+        {
+            "Sample Name": sample_ids,
+            "Updated Sample Name": [row[0] for row in layout],
+            "Sample Type": [row[1] for row in layout],
+            "Replicate": [row[2] for row in layout],
+        }
+    )
+
+    singlets = rng.integers(10_000, 40_000, n_rows)
+    flag_freq = rng.uniform(1, 95, n_rows)
+    flag_count = np.round(singlets * flag_freq / 100.0)
+    his_freq = rng.gamma(1.2, 1.5, n_rows)
+    his_count = np.round(flag_count * his_freq / 100.0)
+    mirfp = rng.lognormal(2.5, 0.4, n_rows)
+    af488 = rng.lognormal(4.8, 0.3, n_rows)
+    his_mirfp = rng.lognormal(6.0, 0.8, n_rows)
+    his_af488 = rng.lognormal(5.0, 0.5, n_rows)
+    raw_values = np.column_stack(
+        [
+            singlets,
+            flag_count,
+            flag_freq,
+            mirfp,
+            af488,
+            af488 / mirfp,
+            his_count,
+            his_freq,
+            his_mirfp,
+            his_af488,
+            his_af488 / his_mirfp,
+        ]
+    )
+    raw_df = pd.DataFrame(np.round(raw_values, 3), columns=list(METRIC_HEADERS))
+    raw_df.insert(0, "", sample_ids)
+    raw_df[f"Unnamed: {len(METRIC_HEADERS) + 1}"] = np.nan
+
+    # FlowJo appends summary rows that the pipeline must drop.
+    summary_rows = pd.DataFrame(
+        [["Mean", *raw_values.mean(axis=0), np.nan], ["SD", *raw_values.std(axis=0), np.nan]],
+        columns=raw_df.columns,
+    )
+    raw_df = pd.concat([raw_df, summary_rows], ignore_index=True)
+
+    os.makedirs(data_dir, exist_ok=True)
+    raw_csv = os.path.join(data_dir, f"{scale} FlowJo table.csv")
+    mapping_csv = os.path.join(data_dir, f"{scale}_plate_mapping.csv")
+    raw_df.to_csv(raw_csv, index=False)
+    mapping_df.to_csv(mapping_csv, index=False)
+    return raw_csv, mapping_csv
+
+
+def _timed(func, *args, **kwargs):
+    """Call `func` and return (result, wall seconds)."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run_stages_once(data_dir, output_dir, include_plots=True, plot_jobs=1):
+    """Run each pipeline stage once; return {stage: seconds} and row counts."""
+    seconds = {}
+    merged_df, seconds["clean_and_merge"] = _timed(analyze_flow.clean_and_merge, data_dir, output_dir)
+    target_cols, seconds["identify_columns"] = _timed(analyze_flow.identify_columns, merged_df)
+    analyze_flow.validate_target_columns(target_cols, merged_df.columns)
+    plot_data, seconds["build_plot_data"] = _timed(analyze_flow.build_plot_data, merged_df, target_cols)
+    # Classification runs once per plate; every consumer below reads its columns.
+    plot_data, seconds["classify_samples"] = _timed(analyze_flow.add_sample_classes, plot_data)
+
+    mock_threshold, seconds["calculate_mock_expression_threshold"] = _timed(
+        analyze_flow.calculate_mock_expression_threshold, merged_df, target_cols
+    )
+    _flag_threshold, seconds["calculate_percent_parent_threshold"] = _timed(
+        analyze_flow.calculate_percent_parent_threshold, plot_data
+    )
+    plot_threshold, seconds["calculate_percent_parent_plot_threshold"] = _timed(
+        analyze_flow.calculate_percent_parent_plot_threshold, plot_data
+    )
+
+    plot_files = [(cfg["title"], cfg["filename"]) for cfg in analyze_flow.METRIC_CONFIGS]
+    if include_plots:
+        (plot_files, _plot_data, plot_threshold), seconds["generate_plots"] = _timed(
+            analyze_flow.generate_plots,
+            merged_df,
+            target_cols,
+            output_dir,
+            mock_threshold,
+            plot_jobs=plot_jobs,
+        )
+    _report, seconds["generate_report"] = _timed(
+        analyze_flow.generate_report,
+        plot_data,
+        plot_files,
+        target_cols,
+        output_dir,
+        mock_threshold,
+        plot_threshold,
+    )
+    counts = {"raw_rows": int(len(merged_df)), "samples": int(len(plot_data))}
+    return seconds, counts
+
+
+def benchmark_scale(scale, repeats=3, max_plot_samples=5000, plot_jobs=1, seed=0):
+    """Generate one scale's dataset and time every stage over `repeats` runs."""
+    with tempfile.TemporaryDirectory(prefix=f"flow_bench_{scale}_") as tmp_dir:
+        data_dir = os.path.join(tmp_dir, f"bench_{scale}")
+        output_dir = os.path.join(tmp_dir, "output")
+        os.makedirs(output_dir)
+        (_raw_csv, _mapping_csv), generate_seconds = _timed(generate_dataset, scale, data_dir, seed)
+        n_samples = len({row[0] for row in _plate_layout(scale)})
+        include_plots = n_samples <= max_plot_samples
+
+        runs = []
+        counts = {}
+        for _ in range(repeats):
+            # Keep benchmark output quiet; stage functions print progress lines.
+            with open(os.devnull, "w") as devnull:
+                stdout = sys.stdout
+                sys.stdout = devnull
+                try:
+                    seconds, counts = run_stages_once(data_dir, output_dir, include_plots, plot_jobs)
+                finally:
+                    sys.stdout = stdout
+            runs.append(seconds)
+
+    stages = {}
+    for stage_name in runs[0]:
+        values = [run[stage_name] for run in runs]
+        stages[stage_name] = {
+            "min": round(min(values), 6),
+            "median": round(statistics.median(values), 6),
+            "max": round(max(values), 6),
+        }
+    return {
+        "scale": scale,
+        "repeats": repeats,
+        "generate_seconds": round(generate_seconds, 6),
+        "plots_skipped": not include_plots,
+        **counts,
+        "stages": stages,
+        "total_median": round(sum(stage["median"] for stage in stages.values()), 6),
+    }
+
+
+def _environment():
+    """Versions and revision recorded alongside timings."""
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=project_dir,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "git_revision": revision,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare_results(current, baseline):
+    """Print per-stage median ratios (current / baseline) for shared scales."""
+    baseline_by_scale = {result["scale"]: result for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        previous = baseline_by_scale.get(result["scale"])
+        if previous is None:
+            continue
+        for stage_name, stage in result["stages"].items():
+            old_stage = previous["stages"].get(stage_name)
+            if not old_stage:
+                continue
+            ratio = stage["median"] / old_stage["median"] if old_stage["median"] else float("nan")
+            rows.append(
+                {
+                    "Scale": result["scale"],
+                    "Stage": stage_name,
+                    "Baseline (s)": old_stage["median"],
+                    "Current (s)": stage["median"],
+                    "Ratio": round(ratio, 3),
+                }
+            )
+    if rows:
+        print(pd.DataFrame(rows).to_markdown(index=False))
+    else:
+        print("No overlapping scales/stages to compare.")
+    return rows
+
+
+def main():
+    """CLI entrypoint for generating synthetic data and timing pipeline stages."""
+    parser = argparse.ArgumentParser(description="Benchmark analyze_flow.py on synthetic plates")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["96", "384", "1536"])
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per scale (default: 3)")
+    parser.add_argument(
+        "--max-plot-samples",
+        type=int,
+        default=5000,
+        help="Skip generate_plots for scales with more samples than this (default: 5000)",
+    )
+    parser.add_argument("--plot-jobs", type=int, default=1, help="Figure workers (default: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for data generation")
+    parser.add_argument("--output", default="benchmark_results.json", help="Results JSON path")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        print(f"Benchmarking scale {scale}...")
+        result = benchmark_scale(scale, args.repeats, args.max_plot_samples, args.plot_jobs, args.seed)
+        results.append(result)
+        for stage_name, stage in result["stages"].items():
+            print(f"  {stage_name}: {stage['median']:.4f} s (median)")
+        if result["plots_skipped"]:
+            print(f"  generate_plots skipped ({result['samples']} samples > --max-plot-samples)")
+
+    payload = {"environment": _environment(), "results": results}
+    with open(args.output, "w") as f:
+        json.dump(payload, f, indent=2)
+    print(f"Saved benchmark results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare_results(payload, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+"""Native FCS 2.0/3.x reader with memory-mapped event access.
+
+This module lets the pipeline work from raw cytometer files instead of
+FlowJo-exported tables. Only the HEADER and TEXT segments are parsed in
+Python; the DATA segment is exposed as a read-only `numpy.memmap` with a
+structured dtype (one field per parameter), so opening a plate of large
+files costs a few kilobytes of reads per file and no event copies.
+
+Supported layouts:
+- `$MODE` L (list mode).
+- `$DATATYPE` F (float32), D (float64), and I (unsigned integers of 8/16/32/64 bits).
+- `$BYTEORD` little endian (`1,2,3,4` / `1,2`) or big endian (`4,3,2,1` / `2,1`).
+
+Sample identifiers used in plate mapping CSVs (for example
+`BWL2025-11-24.0001.mqd`) are resolved to files by file name, file stem,
+or the `$FIL` keyword, case-insensitively.
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+FCS_EXTENSIONS = (".fcs", ".lmd", ".mqd")
+HEADER_LENGTH = 58
+
+_FLOAT_FORMATS = {"F": (32, "f4"), "D": (64, "f8")}
+_INT_FORMATS = {8: "u1", 16: "u2", 32: "u4", 64: "u8"}
+_BYTE_ORDERS = {
+    "1,2,3,4": "<",
+    "1,2": "<",
+    "1,2,3,4,5,6,7,8": "<",
+    "4,3,2,1": ">",
+    "2,1": ">",
+    "8,7,6,5,4,3,2,1": ">",
+}
+
+
+def _parse_offset(raw):
+    """Parse one right-justified ASCII offset field from the FCS HEADER."""
+    text = raw.decode("ascii", errors="replace").strip()
+    return int(text) if text else 0
+
+
+def _parse_text_segment(text_bytes):
+    """Split a TEXT segment into an upper-cased keyword dictionary.
+
+    The first byte is the delimiter; a doubled delimiter inside a keyword or
+    value is an escaped literal delimiter.
+    """
+    if not text_bytes:
+        raise ValueError("FCS TEXT segment is empty")
+    text = text_bytes.decode("utf-8", errors="replace")
+    delimiter = text[0]
+
+    tokens = []
+    current = []
+    idx = 1
+    while idx < len(text):
+        ch = text[idx]
+        if ch == delimiter:
+            if idx + 1 < len(text) and text[idx + 1] == delimiter:
+                current.append(delimiter)
+                idx += 2
+                continue
+            tokens.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+        idx += 1
+    # Some writers omit the trailing delimiter.
+    if current:
+        tokens.append("".join(current))
+
+    keywords = {}
+    for key, value in zip(tokens[0::2], tokens[1::2]):
+        keywords[key.strip().upper()] = value.strip()
+    return keywords
+
+
+def _build_event_dtype(keywords):
+    """Build the packed structured dtype describing one event record."""
+    mode = keywords.get("$MODE", "L").upper()
+    if mode != "L":
+        raise ValueError(f"Unsupported FCS $MODE {mode!r}; only list mode (L) is supported.")
+
+    datatype = keywords.get("$DATATYPE", "").upper()
+    byteord = keywords.get("$BYTEORD", "").replace(" ", "")
+    endian = _BYTE_ORDERS.get(byteord)
+    if endian is None:
+        raise ValueError(f"Unsupported FCS $BYTEORD {byteord!r}.")
+
+    n_params = int(keywords["$PAR"])
+    names = []
+    formats = []
+    seen = {}
+    for idx in range(1, n_params + 1):
+        bits = keywords.get(f"$P{idx}B", "").strip()
+        if datatype in _FLOAT_FORMATS:
+            expected_bits, fmt = _FLOAT_FORMATS[datatype]
+            if bits not in ("", "*") and int(bits) != expected_bits:
+                raise ValueError(
+                    f"$P{idx}B={bits} is inconsistent with $DATATYPE {datatype} ({expected_bits} bits)."
+                )
+        elif datatype == "I":
+            if not bits.isdigit() or int(bits) not in _INT_FORMATS:
+                raise ValueError(
+                    f"Unsupported integer width $P{idx}B={bits!r}; expected one of 8, 16, 32, 64."
+                )
+            fmt = _INT_FORMATS[int(bits)]
+        else:
+            raise ValueError(f"Unsupported FCS $DATATYPE {datatype!r}; expected F, D, or I.")
+
+        # Field names must be unique; suffix duplicates with their parameter index.
+        name = keywords.get(f"$P{idx}N", f"P{idx}")
+        if name in seen:
+            name = f"{name}_P{idx}"
+        seen[name] = idx
+        names.append(name)
+        formats.append(endian + fmt)
+
+    return np.dtype({"names": names, "formats": formats})
+
+
+class FCSFile:
+    """Parsed FCS metadata plus a lazily created memory-mapped event table."""
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        with open(self.path, "rb") as f:
+            header = f.read(HEADER_LENGTH)
+            if len(header) < HEADER_LENGTH or not header.startswith(b"FCS"):
+                raise ValueError(f"Not an FCS file: {self.path}")
+            self.version = header[:6].decode("ascii", errors="replace")
+
+            text_start = _parse_offset(header[10:18])
+            text_end = _parse_offset(header[18:26])
+            data_start = _parse_offset(header[26:34])
+            data_end = _parse_offset(header[34:42])
+
+            f.seek(text_start)
+            self.keywords = _parse_text_segment(f.read(text_end - text_start + 1))
+
+        # Offsets beyond 99,999,999 bytes only live in TEXT keywords.
+        if data_start == 0 and data_end == 0:
+            data_start = int(self.keywords.get("$BEGINDATA", 0))
+            data_end = int(self.keywords.get("$ENDDATA", 0))
+        self.data_offset = data_start
+
+        self.dtype = _build_event_dtype(self.keywords)
+        self.event_count = int(self.keywords.get("$TOT", 0))
+        available = data_end - data_start + 1 if data_end >= data_start else 0
+        if self.event_count * self.dtype.itemsize > available:
+            raise ValueError(
+                f"FCS DATA segment in {self.path} is shorter than $TOT={self.event_count} "
+                f"events x {self.dtype.itemsize} bytes."
+            )
+        self._events = None
+
+        self.channels = []
+        for idx, field_name in enumerate(self.dtype.names, start=1):
+            self.channels.append(
+                {
+                    "index": idx,
+                    "field": field_name,
+                    "name": self.keywords.get(f"$P{idx}N", f"P{idx}"),
+                    "label": self.keywords.get(f"$P{idx}S", ""),
+                    "range": self.keywords.get(f"$P{idx}R", ""),
+                }
+            )
+
+    def __repr__(self):
+        return f"FCSFile({self.path!r}, events={self.event_count}, channels={len(self.channels)})"
+
+    @property
+    def sample_id(self):
+        """Sample identifier: `$FIL` when present, otherwise the file name."""
+        return self.keywords.get("$FIL") or os.path.basename(self.path)
+
+    @property
+    def events(self):
+        """Structured `numpy.memmap` over the DATA segment (read-only, zero-copy)."""
+        if self._events is None:
+            if self.event_count == 0:
+                self._events = np.zeros(0, dtype=self.dtype)
+            else:
+                self._events = np.memmap(
+                    self.path,
+                    dtype=self.dtype,
+                    mode="r",
+                    offset=self.data_offset,
+                    shape=(self.event_count,),
+                )
+        return self._events
+
+    def _find_channel(self, key):
+        """Resolve a channel by `$PnN`, `$PnS`, or FlowJo-style `PnN :: PnS` label."""
+        key_norm = str(key).strip().lower()
+        for channel in self.channels:
+            candidates = (channel["name"], channel["label"], self.channel_label(channel["name"]))
+            if key_norm in (str(c).strip().lower() for c in candidates if c):
+                return channel
+        available = ", ".join(self.channel_label(c["name"]) for c in self.channels)
+        raise KeyError(f"Channel {key!r} not found in {self.path}. Available channels: {available}")
+
+    def channel(self, key):
+        """Return one parameter's events as a strided view into the memmap."""
+        return self.events[self._find_channel(key)["field"]]
+
+    def channel_label(self, key):
+        """FlowJo display label for a channel, e.g. `R1-A :: miRFP-A`."""
+        for channel in self.channels:
+            if channel["name"] == key or channel["field"] == key:
+                return f"{channel['name']} :: {channel['label']}" if channel["label"] else channel["name"]
+        return self.channel_label(self._find_channel(key)["name"])
+
+
+def read_fcs(path):
+    """Open an FCS file (HEADER + TEXT only; events are mapped on first access)."""
+    return FCSFile(path)
+
+
+def _looks_like_fcs(path):
+    """Cheap magic-number sniff for files whose extension is not `.fcs`."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(3) == b"FCS"
+    except OSError:
+        return False
+
+
+def _sample_keys(name):
+    """Case-insensitive lookup keys for a sample or file name (full name and stems).
+
+    Only known FCS extensions are stripped (`x.0001.mqd.fcs` -> `x.0001.mqd`,
+    `x.0001`); acquisition counters such as `.0001` are part of the name, so
+    files from one acquisition day never share a date-only key.
+    """
+    lower_name = os.path.basename(str(name).strip()).lower()
+    keys = [lower_name]
+    stem = lower_name
+    for _ in range(2):
+        stem, ext = os.path.splitext(stem)
+        if ext not in FCS_EXTENSIONS or not stem:
+            break
+        keys.append(stem)
+    return keys
+
+
+def index_fcs_files(fcs_dir, recursive=False):
+    """Map lower-cased sample keys to FCS paths found under `fcs_dir`.
+
+    Keys include the file name, its stems (`x.0001.mqd.fcs` -> `x.0001.mqd`,
+    `x.0001`), and the `$FIL` keyword. Keys claimed by several files map to a
+    list of paths so callers can report the ambiguity.
+    """
+    index = {}
+
+    def add(key, path):
+        existing = index.get(key)
+        if existing is None:
+            index[key] = path
+        elif existing != path:
+            paths = existing if isinstance(existing, list) else [existing]
+            if path not in paths:
+                index[key] = sorted(paths + [path])
+
+    if recursive:
+        walker = ((root, files) for root, _dirs, files in os.walk(fcs_dir))
+    else:
+        walker = [(fcs_dir, [e.name for e in os.scandir(fcs_dir) if e.is_file()])]
+
+    for root, files in walker:
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            lower_name = name.lower()
+            if not lower_name.endswith(FCS_EXTENSIONS):
+                continue
+            if not lower_name.endswith(".fcs") and not _looks_like_fcs(path):
+                continue
+            for key in _sample_keys(name):
+                add(key, path)
+            try:
+                fil = FCSFile(path).keywords.get("$FIL")
+            except ValueError:
+                continue
+            if fil:
+                for key in _sample_keys(fil):
+                    add(key, path)
+    return index
+
+
+def resolve_fcs_samples(sample_names, fcs_dir, recursive=False):
+    """Resolve mapping-CSV sample identifiers to opened `FCSFile` objects.
+
+    Lookups never go below the sample's own name without its FCS extensions,
+    so a sample whose file is absent is reported as missing rather than
+    matched to a sibling file. Raises a ValueError listing every sample that
+    is missing or ambiguous.
+    """
+    index = index_fcs_files(fcs_dir, recursive=recursive)
+    resolved = {}
+    missing = []
+    ambiguous = []
+    for sample_name in sample_names:
+        match = None
+        for key in _sample_keys(sample_name):
+            if key in index:
+                match = index[key]
+                break
+        if match is None:
+            missing.append(str(sample_name))
+        elif isinstance(match, list):
+            ambiguous.append(f"{sample_name} -> {', '.join(match)}")
+        else:
+            resolved[sample_name] = FCSFile(match)
+
+    if missing or ambiguous:
+        problems = []
+        if missing:
+            preview = ", ".join(missing[:10])
+            suffix = "..." if len(missing) > 10 else ""
+            problems.append(f"No FCS file for samples ({len(missing)}): {preview}{suffix}")
+        if ambiguous:
+            problems.append(f"Ambiguous FCS matches: {'; '.join(ambiguous)}")
+        raise ValueError(f"Could not resolve FCS files in {fcs_dir}. " + " ".join(problems))
+    return resolved
+
+
+def load_plate_fcs(mapping_csv, fcs_dir, recursive=False):
+    """Resolve every `Sample Name` in a plate mapping CSV to its FCS file."""
+    import pandas as pd
+
+    from analyze_flow import resolve_mapping_columns
+
+    mapping_df = pd.read_csv(mapping_csv)
+    sample_col = resolve_mapping_columns(mapping_df.columns)["Sample Name"]
+    sample_names = mapping_df[sample_col].dropna().astype(str).drop_duplicates().tolist()
+    return resolve_fcs_samples(sample_names, fcs_dir, recursive=recursive)
+
+
+def write_fcs(path, channels, labels=None, extra_keywords=None, datatype="F"):
+    """Write a minimal FCS 3.1 list-mode file (used for fixtures and benchmarks).
+
+    `channels` maps `$PnN` names to equal-length 1-D arrays.
+    """
+    names = list(channels)
+    n_events = len(next(iter(channels.values()))) if names else 0
+    labels = labels or {}
+    if datatype == "F":
+        fmt, bits = "<f4", 32
+    elif datatype == "D":
+        fmt, bits = "<f8", 64
+    else:
+        raise ValueError(f"write_fcs supports $DATATYPE F or D, not {datatype!r}")
+
+    records = np.empty(n_events, dtype=[(name, fmt) for name in names])
+    for name in names:
+        records[name] = channels[name]
+    data_bytes = records.tobytes()
+
+    keywords = {
+        "$BEGINANALYSIS": "0",
+        "$ENDANALYSIS": "0",
+        "$BEGINSTEXT": "0",
+        "$ENDSTEXT": "0",
+        "$BYTEORD": "1,2,3,4",
+        "$DATATYPE": datatype,
+        "$MODE": "L",
+        "$NEXTDATA": "0",
+        "$PAR": str(len(names)),
+        "$TOT": str(n_events),
+        "$FIL": os.path.basename(path),
+    }
+    for idx, name in enumerate(names, start=1):
+        keywords[f"$P{idx}N"] = name
+        keywords[f"$P{idx}B"] = str(bits)
+        keywords[f"$P{idx}E"] = "0,0"
+        keywords[f"$P{idx}R"] = "262144"
+        if name in labels:
+            keywords[f"$P{idx}S"] = labels[name]
+    keywords.update(extra_keywords or {})
+
+    def render_text(begin, end):
+        keywords["$BEGINDATA"] = str(begin)
+        keywords["$ENDDATA"] = str(end)
+        parts = []
+        for key, value in keywords.items():
+            parts.append(str(key).replace("/", "//"))
+            parts.append(str(value).replace("/", "//"))
+        return ("/" + "/".join(parts) + "/").encode("utf-8")
+
+    # DATA offsets live in TEXT, whose length depends on them; iterate to a fixed point.
+    text_start = HEADER_LENGTH
+    data_start = 0
+    for _ in range(5):
+        text = render_text(data_start, data_start + len(data_bytes) - 1)
+        new_start = text_start + len(text)
+        if new_start == data_start:
+            break
+        data_start = new_start
+    text = render_text(data_start, data_start + len(data_bytes) - 1)
+    data_end = data_start + len(data_bytes) - 1
+
+    def field(value):
+        return f"{value:>8}".encode("ascii") if value <= 99_999_999 else b"       0"
+
+    header = (
+        b"FCS3.1    "
+        + field(text_start)
+        + field(text_start + len(text) - 1)
+        + field(data_start)
+        + field(data_end)
+        + field(0)
+        + field(0)
+    )
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(text)
+        f.write(data_bytes)
+    return path
+
+
+def main():
+    """CLI: print keywords/channels of FCS files for quick inspection."""
+    parser = argparse.ArgumentParser(description="Inspect FCS file metadata")
+    parser.add_argument("paths", nargs="+", help="FCS file(s) to inspect")
+    parser.add_argument("--keywords", action="store_true", help="Print all TEXT keywords")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        fcs = read_fcs(path)
+        print(f"{fcs.path}: {fcs.version}, {fcs.event_count} events, {len(fcs.channels)} channels")
+        print(f"  $DATATYPE={fcs.keywords.get('$DATATYPE')} $BYTEORD={fcs.keywords.get('$BYTEORD')}")
+        for channel in fcs.channels:
+            print(f"  P{channel['index']}: {fcs.channel_label(channel['name'])}")
+        if args.keywords:
+            for key, value in fcs.keywords.items():
+                print(f"  {key} = {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""Long-running local analysis server plus a tiny submit client.
+
+`python3 flow_server.py serve` imports the `analyze_flow` pipeline once and
+keeps a pool of warm worker processes (pandas/numpy/matplotlib already
+imported, Agg backend selected, script hash cached). Jobs are posted as JSON
+over local HTTP and run through the same `run_analysis` path as the CLI, so
+output folders, the result cache, and `run_profile.json` are unchanged.
+
+Endpoints:
+
+- `GET  /health`   server status, worker count, and job counters.
+- `POST /analyze`  `{"data_dir": "...", "options": {...}}` for a plate folder,
+  or `{"name": "...", "raw_csv": "<text>", "mapping_csv": "<text>", "options": {...}}`
+  for an uploaded CSV pair (written under the server's upload folder once no
+  other job is using that plate's output folder).
+
+Both forms return the batch-style status record (`status`, `output_dir`,
+`cache_hit`, `stages_run`, `stage_seconds`, `error`, ...) plus `artifacts`,
+the output files produced for the plate. `options` accepts the keys of
+`analyze_flow.DEFAULT_RUN_OPTIONS`.
+
+`python3 flow_server.py submit <data_dir> [--force] ...` replaces
+`python3 analyze_flow.py <data_dir>`. The client only uses the standard
+library, so it starts without paying the pandas/matplotlib import cost.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_UPLOAD_DIR = "flow_server_uploads"
+MAX_REQUEST_BYTES = 256 << 20
+
+
+def _init_server_worker():
+    """Process-pool initializer: pay imports and one-off hashing before the first job."""
+    import analyze_flow
+
+    # Jobs choose their figure workers through `plot_jobs` (see `AnalysisServer.resolve_options`).
+    analyze_flow._init_batch_worker(in_process_plots=False)
+    analyze_flow._script_sha256()
+
+
+def _list_artifacts(output_dir):
+    """Output files of one plate (stage cache internals excluded), sorted by name."""
+    from analyze_flow import STAGE_CACHE_DIR
+
+    if not output_dir or not os.path.isdir(output_dir):
+        return []
+    return sorted(
+        os.path.join(output_dir, name)
+        for name in os.listdir(output_dir)
+        if name != STAGE_CACHE_DIR and os.path.isfile(os.path.join(output_dir, name))
+    )
+
+
+def _run_job(data_dir, options):
+    """Worker entry point: analyze one plate and attach its artifact paths."""
+    from analyze_flow import _analyze_plate_safely
+
+    record = _analyze_plate_safely(data_dir, options)
+    record["artifacts"] = _list_artifacts(record["output_dir"])
+    return record
+
+
+def _worker_lost_record(data_dir, error, seconds):
+    """Failed status record for a job whose worker process died (OOM, segfault, ...)."""
+    return {
+        "data_dir": data_dir,
+        "output_dir": None,
+        "status": "failed",
+        "cache_hit": False,
+        "stages_run": [],
+        "error": f"{type(error).__name__}: worker process died while running this job ({error})",
+        "traceback": None,
+        "stage_seconds": {},
+        "total_seconds": round(seconds, 4),
+        "artifacts": [],
+    }
+
+
+class AnalysisServer:
+    """Job dispatcher shared by all HTTP handler threads."""
+
+    def __init__(self, jobs=1, upload_dir=DEFAULT_UPLOAD_DIR, plot_jobs=None):
+        import analyze_flow
+
+        self.af = analyze_flow
+        self.jobs = max(1, jobs)
+        self.upload_dir = os.path.abspath(upload_dir)
+        # Plates already saturate the pool; only nest figure workers when asked explicitly.
+        self.plot_jobs = plot_jobs if plot_jobs is not None else (1 if self.jobs > 1 else 0)
+        self.pool = self._new_pool()
+        self.started_at = time.time()
+        self.counters = {"submitted": 0, "succeeded": 0, "failed": 0, "running": 0, "pool_restarts": 0}
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+        # Start every worker now so the first request does not pay the import cost.
+        for future in [self.pool.submit(time.sleep, 0.05) for _ in range(self.jobs)]:
+            future.result()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_server_worker)
+
+    def _replace_broken_pool(self, broken_pool):
+        """Swap in a fresh pool (call with `self._lock` held); no-op if already replaced.
+
+        A dead worker leaves `ProcessPoolExecutor` broken for good, so every
+        later submit would fail. The new workers warm up on their first job.
+        """
+        if self.pool is not broken_pool:
+            return
+        print("A worker process died; restarting the worker pool", file=sys.stderr, flush=True)
+        broken_pool.shutdown(wait=False, cancel_futures=True)
+        self.pool = self._new_pool()
+        self.counters["pool_restarts"] += 1
+
+    def _wait(self, data_dir, pool, future, start):
+        """Record of a submitted job; a dead worker yields a failed record and a new pool."""
+        try:
+            return future.result()
+        except BrokenProcessPool as e:
+            with self._lock:
+                self._replace_broken_pool(pool)
+            return _worker_lost_record(data_dir, e, time.perf_counter() - start)
+
+    def resolve_options(self, options):
+        options = self.af.resolve_run_options(options)
+        if not options["plot_jobs"]:
+            options["plot_jobs"] = self.plot_jobs
+        if options["table_format"] not in self.af.REPORT_TABLE_FORMATS:
+            raise ValueError(
+                f"Unsupported table_format {options['table_format']!r}; "
+                f"expected one of: {', '.join(self.af.REPORT_TABLE_FORMATS)}"
+            )
+        return options
+
+    def upload_plate_dir(self, name):
+        """Plate folder for an uploaded CSV pair named `name` (not created yet)."""
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", str(name or "")).strip("._")
+        if not safe_name:
+            raise ValueError("Uploaded jobs need a non-empty 'name' for the plate folder")
+        return os.path.join(self.upload_dir, safe_name)
+
+    @staticmethod
+    def _write_upload(plate_dir, raw_text, mapping_text):
+        """Write an uploaded CSV pair into its plate folder."""
+        safe_name = os.path.basename(plate_dir)
+        os.makedirs(plate_dir, exist_ok=True)
+        for filename, text in (
+            (f"{safe_name} FlowJo table.csv", raw_text),
+            (f"{safe_name}_plate_mapping.csv", mapping_text),
+        ):
+            with open(os.path.join(plate_dir, filename), "w", newline="") as f:
+                f.write(text)
+
+    def _submit_to_pool(self, data_dir, options):
+        """(pool, future) for one job, replacing the pool first if a worker died."""
+        with self._lock:
+            pool = self.pool
+            try:
+                return pool, pool.submit(_run_job, data_dir, options)
+            except BrokenProcessPool:
+                self._replace_broken_pool(pool)
+                return self.pool, self.pool.submit(_run_job, data_dir, options)
+
+    def submit(self, data_dir, options, upload=None):
+        """Run one plate on the pool and wait for its record.
+
+        Jobs writing to the same output folder are serialized: an identical
+        request joins the running job, a different one waits for it first.
+        `upload` is an uploaded `(raw_text, mapping_text)` pair for `data_dir`
+        (see `upload_plate_dir`). It is written only once this job holds the
+        output folder, so it never replaces the CSVs of a job still running.
+        """
+        data_dir = os.path.abspath(data_dir)
+        if upload is None and not self.af.input_path_exists(data_dir):
+            raise FileNotFoundError(f"Data directory or archive does not exist: {data_dir}")
+        output_key = self.af._output_dir_path(data_dir)
+        job_key = {"options": options}
+        if upload is not None:
+            # Uploads with the same name but different contents must not join each other.
+            job_key["upload_sha256"] = hashlib.sha256("\0".join(upload).encode()).hexdigest()
+        job_key = json.dumps(job_key, sort_keys=True)
+        start = time.perf_counter()
+
+        while True:
+            with self._lock:
+                running = self._inflight.get(output_key)
+                if running is None:
+                    done = Future()
+                    self._inflight[output_key] = (job_key, done)
+                    self.counters["submitted"] += 1
+                    self.counters["running"] += 1
+                    break
+            if running[0] == job_key:
+                return running[1].result()
+            running[1].exception()
+
+        try:
+            if upload is not None:
+                self._write_upload(data_dir, *upload)
+            pool, future = self._submit_to_pool(data_dir, options)
+            record = self._wait(data_dir, pool, future, start)
+        except BaseException as e:
+            done.set_exception(e)
+            raise
+        else:
+            done.set_result(record)
+        finally:
+            with self._lock:
+                self._inflight.pop(output_key, None)
+                self.counters["running"] -= 1
+        with self._lock:
+            self.counters["succeeded" if record["status"] == "succeeded" else "failed"] += 1
+        print(
+            f"[{record['status']}] {record['data_dir']} ({record['total_seconds']:.2f} s)",
+            flush=True,
+        )
+        return record
+
+    def health(self):
+        return {
+            "status": "ok",
+            "pid": os.getpid(),
+            "jobs": self.jobs,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            **self.counters,
+        }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """JSON-over-HTTP front end for `AnalysisServer`."""
+
+    server_version = "FlowAnalysisServer/1"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, indent=2).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/health":
+            self._send_json(200, self.server.analysis.health())
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/analyze":
+            self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_REQUEST_BYTES:
+            self._send_json(413, {"error": f"Request body exceeds {MAX_REQUEST_BYTES} bytes"})
+            return
+        analysis = self.server.analysis
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            options = analysis.resolve_options(request.get("options"))
+            if "raw_csv" in request or "mapping_csv" in request:
+                if not (request.get("raw_csv") and request.get("mapping_csv")):
+                    raise ValueError("Uploaded jobs need both 'raw_csv' and 'mapping_csv' text")
+                data_dir = analysis.upload_plate_dir(request.get("name"))
+                upload = (request["raw_csv"], request["mapping_csv"])
+            elif request.get("data_dir"):
+                data_dir, upload = request["data_dir"], None
+            else:
+                raise ValueError("Request needs 'data_dir' or an uploaded 'raw_csv'/'mapping_csv' pair")
+            record = analysis.submit(data_dir, options, upload)
+        except (ValueError, FileNotFoundError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._send_json(200, record)
+
+    def log_message(self, format, *args):
+        # Job lines are printed by AnalysisServer; keep per-request access logs quiet.
+        del format, args
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, jobs=1, upload_dir=DEFAULT_UPLOAD_DIR, plot_jobs=None):
+    """Run the analysis server until interrupted."""
+    analysis = AnalysisServer(jobs, upload_dir, plot_jobs)
+    httpd = ThreadingHTTPServer((host, port), _RequestHandler)
+    httpd.daemon_threads = True
+    httpd.analysis = analysis
+    print(f"Serving flow analysis on http://{host}:{port} with {analysis.jobs} worker(s)", flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        analysis.shutdown()
+
+
+def submit_job(payload, server_url, timeout=None):
+    """POST one job to a running server; return the decoded JSON record."""
+    request = urllib.request.Request(
+        server_url.rstrip("/") + "/analyze",
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        detail = json.loads(e.read() or b"{}").get("error", e.reason)
+        raise ValueError(f"Server rejected job ({e.code}): {detail}") from None
+    except urllib.error.URLError as e:
+        raise ConnectionError(
+            f"Could not reach analysis server at {server_url} ({e.reason}). "
+            "Start it with: python3 flow_server.py serve"
+        ) from None
+
+
+def main():
+    """CLI: `serve` starts the server; `submit` sends one plate to it."""
+    parser = argparse.ArgumentParser(description="Local flow analysis server and client")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Start the analysis server")
+    serve_parser.add_argument("--host", default=DEFAULT_HOST, help=f"Bind address (default: {DEFAULT_HOST})")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port (default: {DEFAULT_PORT})")
+    serve_parser.add_argument("--jobs", type=int, default=1, help="Warm worker processes (default: 1)")
+    serve_parser.add_argument(
+        "--plot-jobs",
+        type=int,
+        help="Figure workers per job when a request does not set plot_jobs "
+        "(default: 1 with several workers, else one per figure)",
+    )
+    serve_parser.add_argument(
+        "--upload-dir",
+        default=DEFAULT_UPLOAD_DIR,
+        help=f"Folder for uploaded CSV pairs (default: {DEFAULT_UPLOAD_DIR})",
+    )
+
+    submit_parser = subparsers.add_parser("submit", help="Analyze one plate on a running server")
+    submit_parser.add_argument("data_dir", nargs="?", help="Directory containing raw CSV and plate mapping CSV")
+    submit_parser.add_argument(
+        "--upload",
+        nargs=2,
+        metavar=("RAW_CSV", "MAPPING_CSV"),
+        help="Send this CSV pair's contents instead of a folder path (for remote data)",
+    )
+    submit_parser.add_argument("--name", help="Plate name for --upload (default: raw CSV file stem)")
+    submit_parser.add_argument(
+        "--server",
+        default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}",
+        help="Server URL (default: %(default)s)",
+    )
+    submit_parser.add_argument("--force", action="store_true", help="Ignore the result cache")
+    submit_parser.add_argument("--plot-jobs", type=int, help="Figure workers for this job")
+    submit_parser.add_argument("--table-max-rows", type=int, help="See analyze_flow.py --table-max-rows")
+    submit_parser.add_argument("--table-format", help="See analyze_flow.py --table-format")
+    submit_parser.add_argument("--json", action="store_true", help="Print the full JSON record")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.host, args.port, args.jobs, args.upload_dir, args.plot_jobs)
+        return
+
+    options = {"force": args.force}
+    for key in ("plot_jobs", "table_max_rows", "table_format"):
+        if getattr(args, key) is not None:
+            options[key] = getattr(args, key)
+    if args.upload:
+        raw_path, mapping_path = args.upload
+        with open(raw_path) as f:
+            raw_text = f.read()
+        with open(mapping_path) as f:
+            mapping_text = f.read()
+        name = args.name or os.path.splitext(os.path.basename(raw_path))[0]
+        payload = {"name": name, "raw_csv": raw_text, "mapping_csv": mapping_text, "options": options}
+    elif args.data_dir:
+        payload = {"data_dir": os.path.abspath(args.data_dir), "options": options}
+    else:
+        submit_parser.error("provide a data_dir or --upload RAW_CSV MAPPING_CSV")
+
+    try:
+        record = submit_job(payload, args.server)
+    except (ValueError, ConnectionError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    if args.json:
+        print(json.dumps(record, indent=2))
+    else:
+        state = "cache hit" if record.get("cache_hit") else f"ran {', '.join(record['stages_run']) or 'nothing'}"
+        print(f"[{record['status']}] {record['data_dir']} ({record['total_seconds']:.2f} s, {state})")
+        if record["status"] == "succeeded":
+            print(f"Outputs: {record['output_dir']}")
+            for path in record.get("artifacts", []):
+                print(f"  {path}")
+        else:
+            print(f"Error: {record['error']}", file=sys.stderr)
+            if record.get("traceback"):
+                print(record["traceback"], file=sys.stderr)
+    if record["status"] != "succeeded":
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""Watch-folder daemon: analyze plate folders as they land on an export share.
+
+`python3 flow_watch.py /path/to/export_root` monitors the immediate child
+folders of the root. A folder is queued for `analyze_flow.run_analysis`
+once it holds a complete raw + plate-mapping pair (the same rules as
+`find_input_csvs`) and neither CSV's size nor mtime has changed for
+`--settle` seconds. Every new event on a folder restarts that debounce window.
+
+Change detection uses inotify (through ctypes, Linux only). It falls back to
+periodic rescans when inotify is unavailable or its watch limit is reached.
+
+Processed folders are recorded in a JSON state file. The record holds the
+input signature, status, and output folder, so a restarted daemon skips
+everything already analyzed. A folder is analyzed again only when its input
+CSVs change. Failed folders are not retried until their inputs change.
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import json
+import os
+import select
+import struct
+import sys
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import analyze_flow
+
+WATCH_STATE_VERSION = 1
+DEFAULT_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flow_watch_state.json")
+DEFAULT_SETTLE_SECONDS = 10.0
+DEFAULT_POLL_SECONDS = 5.0
+
+# <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """Report which plate folders under `root` changed, using Linux inotify.
+
+    The root and every folder up to two levels below it are watched, because
+    `find_input_csvs` accepts the CSV pair one level inside a plate folder.
+    """
+
+    def __init__(self, root):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self.root = os.path.abspath(root)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._paths = {}
+        self._add_tree(self.root, depth=2)
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return
+            # ENOSPC means fs.inotify.max_user_watches is exhausted; the caller falls back to polling.
+            raise OSError(err, f"inotify_add_watch failed for {path}: {os.strerror(err)}")
+        self._paths[wd] = path
+
+    def _add_tree(self, path, depth):
+        self._add_watch(path)
+        if depth <= 0:
+            return
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                self._add_tree(entry.path, depth - 1)
+
+    def _plate_folder(self, path):
+        """Top-level child of the root that contains `path` (None for the root itself)."""
+        rel = os.path.relpath(path, self.root)
+        if rel == "." or rel.startswith(".."):
+            return None
+        return os.path.join(self.root, rel.split(os.sep, 1)[0])
+
+    def wait(self, timeout):
+        """Block up to `timeout` seconds; return changed plate folders, or None to rescan all."""
+        readable, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        changed = set()
+        if not readable:
+            return changed
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset : offset + length].rstrip(b"\0").decode(errors="surrogateescape")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                parent = self._paths.get(wd)
+                if mask & IN_IGNORED:
+                    self._paths.pop(wd, None)
+                    continue
+                if parent is None:
+                    continue
+                path = os.path.join(parent, name) if name else parent
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    depth = 2 - len(os.path.relpath(path, self.root).split(os.sep))
+                    if depth >= 0:
+                        self._add_tree(path, depth)
+                folder = self._plate_folder(path)
+                if folder is not None:
+                    changed.add(folder)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback watcher: sleep, then ask for a full rescan."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def wait(self, timeout):
+        time.sleep(max(timeout, 0))
+        return None
+
+    def close(self):
+        pass
+
+
+def list_plate_folders(root):
+    """Immediate child folders of `root` that could hold a plate export."""
+    folders = []
+    for entry in os.scandir(root):
+        if entry.name.startswith(".") or entry.name.endswith("_analyzed_data"):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            folders.append(entry.path)
+    return sorted(folders)
+
+
+def folder_signature(folder):
+    """(path, size, mtime_ns) of every input candidate in the folder; None without a complete pair.
+
+    Folders with several raw or mapping candidates still get a signature, so
+    their analysis runs and records the ambiguity error in the state file.
+    Archive members (`<archive>::<member>`) use the member size and the
+    archive file's mtime; an archive that cannot be read yet (still being
+    copied) yields None.
+    """
+    try:
+        candidates = analyze_flow.scan_input_files(folder, max_depth=1)
+    except (FileNotFoundError, NotADirectoryError, EOFError, zipfile.BadZipFile, tarfile.ReadError):
+        return None
+    by_dir = analyze_flow._group_candidates_by_dir(candidates)
+    if not any(roles["raw"] and roles["mapping"] for roles in by_dir.values()):
+        return None
+    signature = []
+    for item in candidates:
+        archive, _member = analyze_flow.split_archive_path(item["path"])
+        try:
+            stat = os.stat(archive or item["path"])
+        except FileNotFoundError:
+            return None
+        size = item["size"] if archive else stat.st_size
+        signature.append([item["path"], size, stat.st_mtime_ns])
+    return signature
+
+
+def load_watch_state(state_path):
+    """Previously processed folders; empty when the file is missing or from another version."""
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {"version": WATCH_STATE_VERSION, "folders": {}}
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Watch state file {state_path} is not valid JSON ({e}); move it aside to start fresh") from None
+    if state.get("version") != WATCH_STATE_VERSION:
+        return {"version": WATCH_STATE_VERSION, "folders": {}}
+    return state
+
+
+def write_watch_state(state_path, state):
+    """Atomically replace the state file, so a crash never leaves it half-written."""
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def _analyze_folders(folders, options, pool):
+    """Run queued folders (in parallel when a pool is given); return their status records."""
+    if pool is None:
+        return [analyze_flow._analyze_plate_safely(folder, options) for folder in folders]
+    futures = [pool.submit(analyze_flow._analyze_plate_safely, folder, options) for folder in folders]
+    return [future.result() for future in futures]
+
+
+def watch_folder(
+    root,
+    options=None,
+    state_path=DEFAULT_STATE_FILE,
+    jobs=1,
+    settle_seconds=DEFAULT_SETTLE_SECONDS,
+    poll_seconds=DEFAULT_POLL_SECONDS,
+    use_inotify=True,
+    once=False,
+):
+    """Analyze new or modified plate folders under `root` until interrupted.
+
+    With `once`, every folder present at start-up is settled, processed, and
+    the function returns instead of watching for further changes. Returns the
+    status records of the plates analyzed by this call.
+    """
+    root = os.path.abspath(root)
+    if not os.path.isdir(root):
+        raise FileNotFoundError(f"Watch root does not exist: {root}")
+    options = analyze_flow.resolve_run_options(options)
+    state = load_watch_state(state_path)
+    processed = state["folders"]
+
+    watcher = None
+    if use_inotify and not once:
+        try:
+            watcher = InotifyWatcher(root)
+            print(f"Watching {root} (inotify)")
+        except OSError as e:
+            print(f"inotify unavailable ({e}); polling every {poll_seconds:g} s")
+    if watcher is None:
+        watcher = PollingWatcher(root)
+        if not once:
+            print(f"Watching {root} (polling every {poll_seconds:g} s)")
+
+    pool = (
+        ProcessPoolExecutor(max_workers=jobs, initializer=analyze_flow._init_batch_worker)
+        if jobs > 1
+        else None
+    )
+    pending = {}
+    dirty = None
+    results = []
+    try:
+        while True:
+            now = time.monotonic()
+            folders = list_plate_folders(root) if dirty is None else sorted(dirty | set(pending))
+            for folder in folders:
+                signature = folder_signature(folder)
+                previous = processed.get(folder)
+                if signature is None or (previous and previous["signature"] == signature):
+                    pending.pop(folder, None)
+                elif folder not in pending or pending[folder]["signature"] != signature:
+                    # New or still-growing export: (re)start its debounce window.
+                    pending[folder] = {"signature": signature, "changed_at": now}
+
+            ready = sorted(
+                folder for folder, entry in pending.items() if now - entry["changed_at"] >= settle_seconds
+            )
+            if ready:
+                print(f"Analyzing {len(ready)} settled folder(s): {', '.join(os.path.basename(f) for f in ready)}")
+                for record in _analyze_folders(ready, options, pool):
+                    folder = record["data_dir"]
+                    processed[folder] = {
+                        "signature": pending.pop(folder)["signature"],
+                        "status": record["status"],
+                        "output_dir": record["output_dir"],
+                        "error": record["error"],
+                        "analyzed_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                        "total_seconds": record["total_seconds"],
+                    }
+                    results.append(record)
+                    print(f"[{record['status']}] {folder} ({record['total_seconds']:.2f} s)")
+                    if record["error"]:
+                        print(f"  {record['error']}")
+                write_watch_state(state_path, state)
+
+            if once and not pending:
+                return results
+            wait_seconds = poll_seconds
+            if pending:
+                next_due = min(entry["changed_at"] for entry in pending.values()) + settle_seconds
+                wait_seconds = min(wait_seconds, max(next_due - time.monotonic(), 0.05))
+            changed = watcher.wait(wait_seconds)
+            dirty = None if changed is None else changed
+    except KeyboardInterrupt:
+        print("Stopping watcher")
+        return results
+    finally:
+        watcher.close()
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+def main():
+    """CLI entrypoint for the watch-folder daemon."""
+    parser = argparse.ArgumentParser(description="Analyze plate folders as they appear under a root directory")
+    parser.add_argument("root", help="Export share root; each child folder is one plate")
+    parser.add_argument("--state", default=DEFAULT_STATE_FILE, help="Persistent state file (default: %(default)s)")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes for analysis (default: 1)")
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=DEFAULT_SETTLE_SECONDS,
+        help="Seconds a folder's CSVs must stay unchanged before analysis (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_SECONDS,
+        help="Rescan interval when polling (default: %(default)s)",
+    )
+    parser.add_argument("--no-inotify", action="store_true", help="Always poll instead of using inotify")
+    parser.add_argument("--once", action="store_true", help="Process folders present now, then exit")
+    parser.add_argument("--plot-jobs", type=int, default=0, help="Figure workers per plate (default: automatic)")
+    parser.add_argument("--table-max-rows", type=int, help="See analyze_flow.py --table-max-rows")
+    parser.add_argument(
+        "--table-format",
+        choices=analyze_flow.REPORT_TABLE_FORMATS,
+        default="csv",
+        help="See analyze_flow.py --table-format",
+    )
+    parser.add_argument("--profile-summary", action="store_true", help="Print a one-line summary per plate")
+    args = parser.parse_args()
+
+    options = {
+        "plot_jobs": args.plot_jobs,
+        "table_max_rows": args.table_max_rows,
+        "table_format": args.table_format,
+        "profile_summary": args.profile_summary,
+    }
+    results = watch_folder(
+        args.root,
+        options,
+        state_path=args.state,
+        jobs=args.jobs,
+        settle_seconds=args.settle,
+        poll_seconds=args.poll_interval,
+        use_inotify=not args.no_inotify,
+        once=args.once,
+    )
+    if args.once and any(record["status"] != "succeeded" for record in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
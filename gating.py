@@ -0,0 +1,311 @@
+"""Vectorized hierarchical gating that reproduces FlowJo table statistics.
+
+Given FCS files (see `fcs_reader.py`) and a gating template, this module
+evaluates every gate as a NumPy boolean mask over all events and emits a
+DataFrame whose columns use FlowJo's export naming, for example:
+
+- `Cells/Singlets | Count`
+- `Cells/Singlets/a-FLAG_AF647(+) | Freq. of Parent (%)`
+- `Cells/Singlets/a-FLAG_AF647(+) | Geometric Mean (R1-A :: miRFP-A)`
+- `Cells/Singlets/a-FLAG_AF647(+)/a-His_AF488(+) | Geometric Mean (Ratio_AF488_AF647)`
+
+so `analyze_flow.py` (`identify_columns`, `build_plot_data`, thresholds,
+report) runs unchanged on the result.
+
+Template format (JSON):
+
+    {
+      "derived_channels": [
+        {"name": "Ratio_AF488_AF647", "numerator": "B1-A", "denominator": "R1-A"}
+      ],
+      "gates": [
+        {"name": "Cells", "type": "polygon", "x": "FSC-A", "y": "SSC-A",
+         "vertices": [[x1, y1], [x2, y2], ...]},
+        {"name": "Singlets", "parent": "Cells", "type": "rectangle",
+         "x": "FSC-A", "y": "FSC-H", "x_min": 0, "x_max": null, "y_min": 0, "y_max": null},
+        {"name": "a-FLAG_AF647(+)", "parent": "Cells/Singlets", "type": "threshold",
+         "channel": "R1-A", "min": 500}
+      ],
+      "statistics": [
+        {"gate": "Cells/Singlets", "stat": "Count"},
+        {"gate": "Cells/Singlets/a-FLAG_AF647(+)", "stat": "Freq. of Parent"},
+        {"gate": "Cells/Singlets/a-FLAG_AF647(+)", "stat": "Geometric Mean",
+         "channels": ["R1-A", "B1-A", "Ratio_AF488_AF647"]}
+      ]
+    }
+
+Gate bounds are inclusive at the minimum and exclusive at the maximum;
+`null` bounds are open. Geometric means use positive event values only
+(non-positive values have no logarithm) and are empty for empty gates.
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from fcs_reader import FCSFile, index_fcs_files, load_plate_fcs
+
+GATE_TYPES = ("rectangle", "polygon", "threshold")
+STAT_SUFFIXES = {
+    "count": "Count",
+    "freq. of parent": "Freq. of Parent (%)",
+    "geometric mean": "Geometric Mean",
+}
+GATED_TABLE_SUFFIX = "FlowJo table (gated).csv"
+
+
+def load_gating_template(path):
+    """Read and validate a JSON gating template."""
+    with open(path) as f:
+        template = json.load(f)
+    validate_gating_template(template)
+    return template
+
+
+def _gate_path(gate):
+    """Full FlowJo gate path (`Parent/Child`) for a template gate entry."""
+    parent = gate.get("parent")
+    return f"{parent}/{gate['name']}" if parent else gate["name"]
+
+
+def validate_gating_template(template):
+    """Check gate types, parent ordering, and statistic references up front."""
+    problems = []
+    known_paths = set()
+    for gate in template.get("gates", []):
+        gate_type = str(gate.get("type", "")).lower()
+        if "name" not in gate:
+            problems.append(f"gate without a name: {gate}")
+            continue
+        if gate_type not in GATE_TYPES:
+            problems.append(f"gate {gate['name']!r} has unsupported type {gate.get('type')!r}")
+        if gate.get("parent") and gate["parent"] not in known_paths:
+            problems.append(
+                f"gate {gate['name']!r} references parent {gate['parent']!r} before it is defined"
+            )
+        if gate_type == "polygon" and len(gate.get("vertices", [])) < 3:
+            problems.append(f"polygon gate {gate['name']!r} needs at least 3 vertices")
+        known_paths.add(_gate_path(gate))
+
+    for stat in template.get("statistics", []):
+        if stat.get("gate") not in known_paths:
+            problems.append(f"statistic references unknown gate {stat.get('gate')!r}")
+        if str(stat.get("stat", "")).lower() not in STAT_SUFFIXES:
+            problems.append(f"unsupported statistic {stat.get('stat')!r}")
+
+    if problems:
+        raise ValueError("Invalid gating template: " + "; ".join(problems))
+
+
+def points_in_polygon(x, y, vertices):
+    """Vectorized even-odd point-in-polygon test over all events.
+
+    Events outside the polygon's bounding box are rejected first, so the
+    per-edge crossing test only runs on the remaining candidates.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    vx = vertices[:, 0]
+    vy = vertices[:, 1]
+    inside = np.zeros(len(x), dtype=bool)
+
+    candidates = np.flatnonzero(
+        (x >= vx.min()) & (x <= vx.max()) & (y >= vy.min()) & (y <= vy.max())
+    )
+    if candidates.size == 0:
+        return inside
+    cx = x[candidates]
+    cy = y[candidates]
+
+    hit = np.zeros(candidates.size, dtype=bool)
+    xj, yj = vx[-1], vy[-1]
+    for xi, yi in zip(vx, vy):
+        crosses = (yi > cy) != (yj > cy)
+        if yj != yi:
+            x_cross = (xj - xi) * (cy - yi) / (yj - yi) + xi
+            hit ^= crosses & (cx < x_cross)
+        xj, yj = xi, yi
+
+    inside[candidates] = hit
+    return inside
+
+
+def _bounds_mask(values, lower, upper):
+    """Mask for `lower <= values < upper` with open (None) bounds."""
+    mask = np.ones(len(values), dtype=bool)
+    if lower is not None:
+        mask &= values >= lower
+    if upper is not None:
+        mask &= values < upper
+    return mask
+
+
+class _ChannelCache:
+    """Per-file float64 channel arrays, converted from the memmap on first use."""
+
+    def __init__(self, fcs, derived_channels):
+        self.fcs = fcs
+        self.derived = {d["name"]: d for d in derived_channels}
+        self._arrays = {}
+
+    def get(self, key):
+        if key not in self._arrays:
+            if key in self.derived:
+                spec = self.derived[key]
+                numerator = self.get(spec["numerator"])
+                denominator = self.get(spec["denominator"])
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    self._arrays[key] = np.where(denominator != 0, numerator / denominator, np.nan)
+            else:
+                self._arrays[key] = np.asarray(self.fcs.channel(key), dtype=np.float64)
+        return self._arrays[key]
+
+    def label(self, key):
+        """FlowJo statistic label: derived names as-is, channels as `PnN :: PnS`."""
+        if key in self.derived:
+            return key
+        return self.fcs.channel_label(key)
+
+
+def _evaluate_gate(gate, channels, parent_mask):
+    """Boolean mask for one gate, evaluated only on events inside its parent."""
+    idx = np.flatnonzero(parent_mask)
+    gate_type = str(gate["type"]).lower()
+    if gate_type == "threshold":
+        values = channels.get(gate["channel"])[idx]
+        result = _bounds_mask(values, gate.get("min"), gate.get("max"))
+    elif gate_type == "rectangle":
+        x = channels.get(gate["x"])[idx]
+        y = channels.get(gate["y"])[idx]
+        result = _bounds_mask(x, gate.get("x_min"), gate.get("x_max")) & _bounds_mask(
+            y, gate.get("y_min"), gate.get("y_max")
+        )
+    else:
+        x = channels.get(gate["x"])[idx]
+        y = channels.get(gate["y"])[idx]
+        result = points_in_polygon(x, y, gate["vertices"])
+
+    mask = np.zeros(len(parent_mask), dtype=bool)
+    mask[idx[result]] = True
+    return mask
+
+
+def _geometric_mean(values):
+    """Geometric mean of positive values; NaN when no positive events remain."""
+    positive = values[values > 0]
+    if positive.size == 0:
+        return np.nan
+    return float(np.exp(np.log(positive).mean()))
+
+
+def gate_sample(fcs, template):
+    """Evaluate the gate hierarchy for one FCS file; return FlowJo-named statistics."""
+    if not isinstance(fcs, FCSFile):
+        fcs = FCSFile(fcs)
+    channels = _ChannelCache(fcs, template.get("derived_channels", []))
+
+    all_events = np.ones(fcs.event_count, dtype=bool)
+    masks = {}
+    parents = {}
+    for gate in template.get("gates", []):
+        path = _gate_path(gate)
+        parent_mask = masks[gate["parent"]] if gate.get("parent") else all_events
+        masks[path] = _evaluate_gate(gate, channels, parent_mask)
+        parents[path] = parent_mask
+
+    row = {}
+    for stat in template.get("statistics", []):
+        path = stat["gate"]
+        stat_key = str(stat["stat"]).lower()
+        mask = masks[path]
+        if stat_key == "count":
+            row[f"{path} | Count"] = int(np.count_nonzero(mask))
+        elif stat_key == "freq. of parent":
+            parent_count = int(np.count_nonzero(parents[path]))
+            row[f"{path} | Freq. of Parent (%)"] = (
+                100.0 * np.count_nonzero(mask) / parent_count if parent_count else np.nan
+            )
+        else:
+            channel_keys = stat.get("channels") or [stat["channel"]]
+            for key in channel_keys:
+                column = f"{path} | Geometric Mean ({channels.label(key)})"
+                row[column] = _geometric_mean(channels.get(key)[mask])
+    return row
+
+
+def _gate_sample_path(path, template):
+    """Process-pool worker: open by path so only the path crosses processes."""
+    return gate_sample(FCSFile(path), template)
+
+
+def gate_plate(fcs_files, template, jobs=1):
+    """Gate every sample of a plate; return one FlowJo-style table row per sample.
+
+    `fcs_files` maps sample names (as used in the plate mapping) to `FCSFile`
+    objects or paths. Row order follows the mapping order.
+    """
+    sample_names = list(fcs_files)
+    paths = [f.path if isinstance(f, FCSFile) else f for f in fcs_files.values()]
+    if jobs <= 1 or len(paths) <= 1:
+        rows = [gate_sample(fcs_files[name], template) for name in sample_names]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            rows = list(
+                pool.map(_gate_sample_path, paths, [template] * len(paths), chunksize=4)
+            )
+
+    table = pd.DataFrame(rows)
+    table.insert(0, "Sample Name", sample_names)
+    return table
+
+
+def write_gated_table(table, fcs_dir, output_path=None):
+    """Write the gated table where `_pick_csvs_from_dir` will find it as a raw CSV.
+
+    Discovery prefers the gated table over a FlowJo export in the same folder.
+    """
+    if output_path is None:
+        dir_name = os.path.basename(os.path.abspath(os.path.normpath(fcs_dir)))
+        output_path = os.path.join(fcs_dir, f"{dir_name} {GATED_TABLE_SUFFIX}")
+    table.to_csv(output_path, index=False)
+    print(f"Saved gated table to {output_path}")
+    return output_path
+
+
+def main():
+    """CLI: gate a plate of FCS files and write a FlowJo-style table CSV."""
+    from analyze_flow import _pick_csvs_from_dir
+
+    parser = argparse.ArgumentParser(description="Gate FCS files into a FlowJo-style table")
+    parser.add_argument("fcs_dir", help="Directory containing the plate's FCS files")
+    parser.add_argument("template", help="Gating template JSON")
+    parser.add_argument("--mapping", help="Plate mapping CSV (default: *plate_mapping*.csv in fcs_dir)")
+    parser.add_argument("--output", help="Output CSV path (default: '<dir> FlowJo table (gated).csv' in fcs_dir)")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes (default: 1)")
+    args = parser.parse_args()
+
+    template = load_gating_template(args.template)
+    mapping_csv = args.mapping or _pick_csvs_from_dir(args.fcs_dir)[1]
+    if mapping_csv:
+        fcs_files = load_plate_fcs(mapping_csv, args.fcs_dir)
+    else:
+        # Without a mapping, gate every FCS file found and name rows by file name.
+        index = index_fcs_files(args.fcs_dir)
+        fcs_files = {
+            os.path.basename(path): path
+            for key, path in sorted(index.items())
+            if isinstance(path, str) and key == os.path.basename(path).lower()
+        }
+
+    start = time.perf_counter()
+    table = gate_plate(fcs_files, template, jobs=args.jobs)
+    print(f"Gated {len(table)} samples in {time.perf_counter() - start:.2f} s")
+    write_gated_table(table, args.fcs_dir, args.output)
+
+
+if __name__ == "__main__":
+    main()
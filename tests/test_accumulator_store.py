@@ -0,0 +1,65 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analyze_flow
+from analyze_flow import AccumulatorStore, build_plot_data, clean_and_merge, identify_columns
+from benchmark_flow import generate_dataset
+
+STAT_COLUMNS = [f"{key}_{stat}" for key in analyze_flow.PLOT_METRIC_KEYS for stat in ("mean", "sem")]
+
+
+@pytest.fixture
+def plates(tmp_path, monkeypatch):
+    plate_dirs = []
+    for seed in (1, 2):
+        data_dir = tmp_path / f"plate{seed}"
+        data_dir.mkdir()
+        generate_dataset("96", str(data_dir), seed=seed)
+        plate_dirs.append(str(data_dir))
+    monkeypatch.setattr(analyze_flow, "_output_dir_path", lambda data_dir: f"{data_dir}_out")
+    return plate_dirs
+
+
+def _merged(data_dir, tmp_path):
+    output_dir = tmp_path / f"merged_{len(list(tmp_path.iterdir()))}"
+    output_dir.mkdir()
+    return clean_and_merge(data_dir, str(output_dir))
+
+
+def test_pooled_store_matches_fresh_computation_on_all_rows(plates, tmp_path):
+    store = AccumulatorStore(str(tmp_path / "store.json"))
+    merged = [_merged(data_dir, tmp_path) for data_dir in plates]
+    for data_dir, df in zip(plates, merged):
+        pooled = build_plot_data(df, identify_columns(df), accumulator_store=store, source_id=data_dir)
+    # Re-adding a plate replaces its contribution instead of counting it twice.
+    pooled = build_plot_data(merged[0], identify_columns(merged[0]), accumulator_store=store, source_id=plates[0])
+
+    combined = pd.concat(merged, ignore_index=True)
+    expected = build_plot_data(combined, identify_columns(combined))
+    pooled = pooled.set_index(["Sample Name", "Sample Type"]).sort_index()
+    expected = expected.set_index(["Sample Name", "Sample Type"]).sort_index()
+    assert pooled.index.equals(expected.index)
+    for column in STAT_COLUMNS:
+        np.testing.assert_allclose(pooled[column], expected[column], rtol=1e-12, atol=1e-12, err_msg=column)
+
+
+def test_cache_key_covers_the_plates_own_store_contribution(plates, tmp_path):
+    store_path = str(tmp_path / "store.json")
+    options = {"accumulator_store": store_path}
+    for data_dir in plates:
+        assert not analyze_flow.run_analysis(data_dir, options)["cache_hit"]
+    # The second plate changed the first plate's pooled statistics; after that rebuild it is up to date.
+    assert not analyze_flow.run_analysis(plates[0], options)["cache_hit"]
+    assert analyze_flow.run_analysis(plates[0], options)["cache_hit"]
+
+    with analyze_flow.locked_accumulator_store(store_path) as store:
+        store.remove_source(plates[0])
+    result = analyze_flow.run_analysis(plates[0], options)
+    assert not result["cache_hit"]
+    assert "aggregate" in result["stages_run"]
+    with open(store_path) as f:
+        assert sorted(json.load(f)["sources"]) == sorted(plates)
+    assert analyze_flow.run_analysis(plates[0], options)["cache_hit"]
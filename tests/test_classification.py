@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analyze_flow import classify_samples, compute_key_findings, control_mask, resolve_class_rules
+
+SAMPLE_TYPES = ["Experimental", "Negative Control", "Positive Control", "Experimental positive control", "Blank"]
+
+
+def _plot_data():
+    return pd.DataFrame(
+        {
+            "Sample Name": ["Design_1", "Mock + His", "a-His", "Design_2", "Empty"],
+            "Sample Type": SAMPLE_TYPES,
+            "percent_parent_mean": [30.0, 1.0, 20.0, 40.0, 0.0],
+            "mfi_ratio_mean": [2.0, 0.5, 1.5, 3.0, 0.1],
+            "mirfp_expression_mean": [50.0, 1.0, 40.0, 60.0, 0.0],
+        }
+    )
+
+
+def test_roles_match_independently_like_the_original_checks():
+    plot_data = _plot_data()
+    types = plot_data["Sample Type"].str
+    classes = classify_samples(plot_data)
+
+    expected_experimental = types.contains("experimental", case=False).to_numpy()
+    expected_controls = types.contains("negative|positive", case=False).to_numpy()
+    np.testing.assert_array_equal(classes["is_experimental"].to_numpy(), expected_experimental)
+    np.testing.assert_array_equal(control_mask(classes), expected_controls)
+    # The overlapping type counts as both, not only as its first matching role.
+    assert classes.loc[3, ["is_experimental", "is_positive"]].tolist() == [True, True]
+
+
+def test_key_findings_use_every_row_of_an_overlapping_type():
+    plot_data = _plot_data()
+    findings = compute_key_findings(plot_data, mock_expression_threshold=5.0)
+
+    controls = plot_data[plot_data["Sample Type"].str.contains("negative|positive", case=False)]
+    assert findings["controls_ratio_mean"] == pytest.approx(controls["mfi_ratio_mean"].mean())
+    assert findings["passed_expression"] == ["Design_1", "Design_2"]
+
+
+def test_role_overrides_must_define_every_role():
+    with pytest.raises(ValueError, match="must define exactly"):
+        resolve_class_rules({"roles": {"negative": "neg", "positive": "pos"}})
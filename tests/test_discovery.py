@@ -0,0 +1,24 @@
+import pytest
+
+from analyze_flow import discover_plate_dirs, find_input_csvs
+
+
+def _touch(directory, *names):
+    for name in names:
+        (directory / name).write_text("Sample Name\n")
+
+
+def test_gated_table_takes_precedence_over_flowjo_export(tmp_path):
+    _touch(tmp_path, "Plate FlowJo table.csv", "Plate FlowJo table (gated).csv", "Plate_plate_mapping.csv")
+
+    raw_csv, mapping_csv = find_input_csvs(str(tmp_path))
+    assert raw_csv.endswith("Plate FlowJo table (gated).csv")
+    assert mapping_csv.endswith("Plate_plate_mapping.csv")
+    assert discover_plate_dirs(str(tmp_path)) == ([str(tmp_path)], {})
+
+
+def test_two_flowjo_exports_are_still_ambiguous(tmp_path):
+    _touch(tmp_path, "A FlowJo table.csv", "B FlowJo table.csv", "Plate_plate_mapping.csv")
+
+    with pytest.raises(ValueError, match="Ambiguous inputs"):
+        find_input_csvs(str(tmp_path))
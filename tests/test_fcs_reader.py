@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from fcs_reader import _sample_keys, resolve_fcs_samples, write_fcs
+
+
+def _write_sample(directory, name):
+    write_fcs(str(directory / name), {"FSC-A": np.arange(4, dtype=np.float32)})
+
+
+def test_sample_keys_strip_only_fcs_extensions():
+    assert _sample_keys("BWL2025-11-24.0001.mqd") == ["bwl2025-11-24.0001.mqd", "bwl2025-11-24.0001"]
+    assert _sample_keys("x.0001.mqd.fcs") == ["x.0001.mqd.fcs", "x.0001.mqd", "x.0001"]
+
+
+def test_missing_sample_is_not_matched_to_sibling_file(tmp_path):
+    _write_sample(tmp_path, "BWL2025-11-24.0001.mqd")
+
+    resolved = resolve_fcs_samples(["BWL2025-11-24.0001.mqd"], str(tmp_path))
+    assert resolved["BWL2025-11-24.0001.mqd"].path.endswith("BWL2025-11-24.0001.mqd")
+
+    with pytest.raises(ValueError, match=r"No FCS file for samples \(1\): BWL2025-11-24.0002.mqd"):
+        resolve_fcs_samples(["BWL2025-11-24.0002.mqd"], str(tmp_path))
+
+
+def test_missing_sample_is_missing_not_ambiguous(tmp_path):
+    _write_sample(tmp_path, "BWL2025-11-24.0001.mqd")
+    _write_sample(tmp_path, "BWL2025-11-24.0003.mqd")
+
+    with pytest.raises(ValueError) as excinfo:
+        resolve_fcs_samples(["BWL2025-11-24.0002.mqd"], str(tmp_path))
+    assert "No FCS file" in str(excinfo.value)
+    assert "Ambiguous" not in str(excinfo.value)
+
+
+def test_sample_without_extension_matches_fcs_file(tmp_path):
+    _write_sample(tmp_path, "Plate1_A01.fcs")
+
+    resolved = resolve_fcs_samples(["plate1_a01"], str(tmp_path))
+    assert resolved["plate1_a01"].path.endswith("Plate1_A01.fcs")
@@ -0,0 +1,47 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import flow_server
+
+
+@pytest.fixture
+def server(tmp_path):
+    analysis = flow_server.AnalysisServer(jobs=1, upload_dir=str(tmp_path / "uploads"))
+    yield analysis
+    analysis.shutdown()
+
+
+def test_upload_with_same_name_waits_for_running_job(server, monkeypatch):
+    def fake_submit(data_dir, options):
+        # Stand-in for a worker: read the uploaded raw CSV after a delay, like a running job.
+        future = Future()
+
+        def job():
+            time.sleep(0.3)
+            with open(os.path.join(data_dir, f"{os.path.basename(data_dir)} FlowJo table.csv")) as f:
+                future.set_result({"status": "succeeded", "data_dir": data_dir, "total_seconds": 0.3, "raw": f.read()})
+
+        threading.Thread(target=job).start()
+        return server.pool, future
+
+    monkeypatch.setattr(server, "_submit_to_pool", fake_submit)
+    plate_dir = server.upload_plate_dir("Plate 1")
+    records = {}
+
+    def submit(text):
+        records[text] = server.submit(plate_dir, {}, (text, "mapping"))
+
+    threads = [threading.Thread(target=submit, args=(text,)) for text in ("first", "second")]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+
+    assert records["first"]["raw"] == "first"
+    assert records["second"]["raw"] == "second"
+    assert server.health()["submitted"] == 2
@@ -0,0 +1,41 @@
+import os
+import zipfile
+
+import analyze_flow
+import flow_watch
+from benchmark_flow import generate_dataset
+
+
+def _zipped_plate(root, name):
+    export_dir = root / "export"
+    export_dir.mkdir()
+    generate_dataset("96", str(export_dir), seed=1)
+    plate_dir = root / name
+    plate_dir.mkdir()
+    with zipfile.ZipFile(plate_dir / "export.zip", "w") as zf:
+        for file_name in os.listdir(export_dir):
+            zf.write(export_dir / file_name, file_name)
+    return plate_dir
+
+
+def test_folder_signature_covers_archived_plate(tmp_path):
+    plate_dir = _zipped_plate(tmp_path, "PlateZ")
+
+    signature = flow_watch.folder_signature(str(plate_dir))
+    assert signature is not None
+    assert all(path.startswith(str(plate_dir / "export.zip") + "::") for path, _size, _mtime in signature)
+
+    (plate_dir / "export.zip").write_bytes(b"PK\x03\x04 still copying")
+    assert flow_watch.folder_signature(str(plate_dir)) is None
+
+
+def test_watch_once_analyzes_archived_plate(tmp_path, monkeypatch):
+    watch_root = tmp_path / "watch"
+    watch_root.mkdir()
+    plate_dir = _zipped_plate(tmp_path, "watch/PlateZ")
+    monkeypatch.setattr(analyze_flow, "_output_dir_path", lambda data_dir: str(tmp_path / "out"))
+
+    records = flow_watch.watch_folder(
+        str(watch_root), state_path=str(tmp_path / "state.json"), settle_seconds=0, once=True
+    )
+    assert [(record["data_dir"], record["status"]) for record in records] == [(str(plate_dir), "succeeded")]
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analyze_flow import PLOT_METRIC_KEYS, build_plot_data, clean_and_merge, get_sem, grouped_stats, identify_columns
+from benchmark_flow import generate_dataset
+
+
+def _get_sem_plot_data(df, target_cols):
+    """Sample-level table the way it was built before `grouped_stats`: `agg(["mean", get_sem])`."""
+    grouped = (
+        df.groupby(["True Sample Name", "Sample Type"], sort=False)
+        .agg({target_cols[key]: ["mean", get_sem] for key in PLOT_METRIC_KEYS})
+        .reset_index()
+    )
+    stat_columns = [f"{key}_{stat}" for key in PLOT_METRIC_KEYS for stat in ("mean", "sem")]
+    grouped.columns = ["Sample Name", "Sample Type", *stat_columns]
+    return grouped
+
+
+def test_sem_matches_get_sem_including_edge_groups():
+    df = pd.DataFrame(
+        {
+            "name": ["single", "pair", "pair", "gap", "gap", "gap", "lone_nan", "nan_pair", "nan_pair"],
+            "value": [4.2, 1.0, 3.5, 2.0, np.nan, 7.25, np.nan, np.nan, 5.0],
+        }
+    )
+    expected = df.groupby("name", sort=False)["value"].agg(["mean", get_sem]).reset_index()
+    result = grouped_stats(df, ["name"], {"metric": "value"})
+
+    assert result["name"].tolist() == expected["name"].tolist()
+    np.testing.assert_array_equal(result["metric_mean"].to_numpy(), expected["mean"].to_numpy())
+    np.testing.assert_allclose(result["metric_sem"].to_numpy(), expected["get_sem"].to_numpy(), rtol=1e-15)
+
+
+@pytest.mark.parametrize("seed", [1, 7])
+def test_build_plot_data_matches_get_sem_aggregation(tmp_path, seed):
+    data_dir = tmp_path / "plate"
+    data_dir.mkdir()
+    generate_dataset("384", str(data_dir), seed=seed)
+    merged = clean_and_merge(str(data_dir), str(tmp_path))
+    target_cols = identify_columns(merged)
+
+    result = build_plot_data(merged, target_cols)
+    expected = _get_sem_plot_data(merged, target_cols)
+    for column in ("Sample Name", "Sample Type"):
+        assert result[column].astype(str).tolist() == expected[column].astype(str).tolist()
+    for column in expected.columns[2:]:
+        np.testing.assert_allclose(result[column], expected[column], rtol=1e-12, atol=0, err_msg=column)
+        assert [f"{value:.2f}" for value in result[column]] == [f"{value:.2f}" for value in expected[column]]
@@ -0,0 +1,43 @@
+import json
+import os
+
+import pytest
+
+import analyze_flow
+import flow_server
+from benchmark_flow import generate_dataset
+
+
+@pytest.fixture
+def many_cpus(monkeypatch):
+    monkeypatch.setattr(analyze_flow.os, "cpu_count", lambda: 8)
+    monkeypatch.setattr(analyze_flow, "_IN_BATCH_WORKER", False)
+
+
+def test_batch_workers_render_figures_in_process(many_cpus):
+    assert analyze_flow.resolve_plot_jobs(0, 4, 2) == 2
+    analyze_flow._init_batch_worker()
+    assert analyze_flow.resolve_plot_jobs(0, 4, 2) == 1
+    assert analyze_flow.resolve_plot_jobs(0, 4, 1) == 1
+    # An explicit worker count is still honoured.
+    assert analyze_flow.resolve_plot_jobs(3, 4, 2) == 3
+
+
+def test_server_workers_keep_their_figure_pool(many_cpus):
+    flow_server._init_server_worker()
+    assert analyze_flow.resolve_plot_jobs(0, 4, 2) == 2
+
+
+def test_plate_in_batch_worker_records_in_process_figures(many_cpus, tmp_path, monkeypatch):
+    data_dir = tmp_path / "plate"
+    data_dir.mkdir()
+    generate_dataset("96", str(data_dir), seed=2)
+    monkeypatch.setattr(analyze_flow, "_output_dir_path", lambda _data_dir: str(tmp_path / "out"))
+    analyze_flow._init_batch_worker()
+
+    result = analyze_flow.run_analysis(str(data_dir), {"force": True})
+    with open(os.path.join(result["output_dir"], "run_profile.json")) as f:
+        stages = json.load(f)["stages"]
+    plot_profiles = [profile for name, profile in stages.items() if name.startswith("plot:")]
+    assert len(plot_profiles) == len(analyze_flow.METRIC_CONFIGS)
+    assert {profile["workers"] for profile in plot_profiles} == {1}
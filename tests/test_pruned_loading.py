@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+import analyze_flow
+from benchmark_flow import generate_dataset
+
+
+@pytest.fixture
+def plate_dir(tmp_path, monkeypatch):
+    data_dir = tmp_path / "plate"
+    data_dir.mkdir()
+    generate_dataset("96", str(data_dir), seed=3)
+    monkeypatch.setattr(analyze_flow, "_output_dir_path", lambda _data_dir: str(tmp_path / "out"))
+    return str(data_dir)
+
+
+def _report(data_dir, **options):
+    result = analyze_flow.run_analysis(data_dir, {"force": True, **options})
+    with open(os.path.join(result["output_dir"], "experiment_summary.md")) as f:
+        return f.read()
+
+
+def test_pruned_columns_report_matches_default_path(plate_dir):
+    assert _report(plate_dir, prune_columns=True) == _report(plate_dir)
+
+
+def test_float32_metrics_aggregate_like_float64():
+    # (9.42 + 2.51) / 2 sits on a rounding boundary: 5.96 from float64, 5.97 from a plain float32 upcast.
+    df = analyze_flow.pd.DataFrame({"name": ["a", "a"], "value": [9.42, 2.51]})
+    pruned = df.astype({"value": "float32"})
+    stats = analyze_flow.grouped_stats(pruned, ["name"], {"metric": "value"})
+    assert stats["metric_mean"].tolist() == analyze_flow.grouped_stats(df, ["name"], {"metric": "value"})[
+        "metric_mean"
+    ].tolist()
+    assert f"{stats['metric_mean'].iloc[0]:.2f}" == "5.96"
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analyze_flow import (
+    REPORT_DISPLAY_COLS,
+    build_plot_data,
+    build_report_table,
+    calculate_mock_expression_threshold,
+    calculate_percent_parent_threshold,
+    clean_and_merge,
+    generate_report,
+    identify_columns,
+)
+from benchmark_flow import generate_dataset
+
+TABLE_METRICS = ("mirfp_expression", "percent_parent", "mfi_ratio", "mfi_af488")
+
+
+def _row_wise_table(plot_data, mock_expression_threshold):
+    """The report table the way it was built before vectorizing: one `apply(axis=1)` per column."""
+    table_df = plot_data.copy()
+    table_df[REPORT_DISPLAY_COLS["mock_expression_pass"]] = table_df.apply(
+        lambda row: (
+            "Yes"
+            if (
+                "mock" not in str(row["Sample Name"]).lower()
+                and float(row["mirfp_expression_mean"]) > float(mock_expression_threshold)
+            )
+            else "No"
+        ),
+        axis=1,
+    )
+    for metric in TABLE_METRICS:
+        table_df[REPORT_DISPLAY_COLS[metric]] = table_df.apply(
+            lambda r: f"{r[metric + '_mean']:.2f} ± {r[metric + '_sem']:.2f}",
+            axis=1,
+        )
+    return table_df[
+        ["Sample Name", "Sample Type", REPORT_DISPLAY_COLS["mock_expression_pass"]]
+        + [REPORT_DISPLAY_COLS[metric] for metric in TABLE_METRICS]
+    ]
+
+
+def _row_wise_report(plot_data, plot_files, mock_expression_threshold):
+    """Markdown report text as the original `generate_report` wrote it."""
+
+    def names(df):
+        values = df["Sample Name"].astype(str).tolist()
+        return ", ".join(values) if values else "None"
+
+    types = plot_data["Sample Type"].astype(str)
+    experimental = plot_data[types.str.contains("experimental", case=False, na=False)]
+    passed_expression = experimental[experimental["mirfp_expression_mean"] > float(mock_expression_threshold)]
+    flag_threshold = calculate_percent_parent_threshold(plot_data)
+    passed_percent_parent = (
+        passed_expression.iloc[0:0]
+        if flag_threshold is None
+        else passed_expression[passed_expression["percent_parent_mean"] > float(flag_threshold)]
+    )
+    controls = plot_data[types.str.contains("negative|positive", case=False, na=False)]
+    controls_ratio_mean = float(controls["mfi_ratio_mean"].mean()) if not controls.empty else float("nan")
+    passed_ratio = passed_percent_parent[passed_percent_parent["mfi_ratio_mean"] > controls_ratio_mean]
+
+    text = "# Flow Cytometry Analysis Summary\n\n## Key Findings\n\n"
+    text += f"- Experimental samples >2X mock expression: {len(passed_expression)} ({names(passed_expression)})\n"
+    if flag_threshold is not None:
+        text += (
+            "- From that subset, samples >2X FLAG binding %Parent threshold: "
+            f"{len(passed_percent_parent)} ({names(passed_percent_parent)})\n"
+        )
+    else:
+        text += (
+            "- From that subset, samples >2X FLAG binding %Parent threshold: "
+            "threshold unavailable (no qualifying FLAG non-mock control found)\n"
+        )
+    if np.isnan(controls_ratio_mean):
+        text += (
+            "- From that subset, samples above mean AF488/AF647 ratio of all controls: "
+            "control average unavailable\n\n"
+        )
+    else:
+        text += (
+            "- From that subset, samples above mean AF488/AF647 ratio of all controls "
+            f"({controls_ratio_mean:.2f}): {len(passed_ratio)} ({names(passed_ratio)})\n\n"
+        )
+    text += "## Data Table\n\n"
+    text += _row_wise_table(plot_data, mock_expression_threshold).to_markdown(index=False) + "\n\n"
+    text += "## Figures\n\n"
+    for title, png_filename in plot_files:
+        text += f"### {title}\n![{title}]({png_filename})\n\n"
+    return text
+
+
+def test_report_table_matches_row_wise_formatting():
+    means = [np.nan, -0.0, 2.675, 0.005, 1.0e7, 12.345, 3.0]
+    plot_data = pd.DataFrame(
+        {
+            "Sample Name": ["Design_1", "Mock + His", "MOCK_FLAG", "a-His", "Design_2", "Design_3", "Empty"],
+            "Sample Type": ["Experimental", "Negative Control", "Negative Control", "Positive Control"]
+            + ["Experimental", "Experimental", "Blank"],
+            **{f"{metric}_mean": means for metric in TABLE_METRICS},
+            **{f"{metric}_sem": list(reversed(means)) for metric in TABLE_METRICS},
+        }
+    )
+    expected = _row_wise_table(plot_data, 2.0).astype(object)
+    pd.testing.assert_frame_equal(build_report_table(plot_data, 2.0).astype(object), expected)
+
+
+# None: the plate's own mock threshold (no hits); 10.0 leaves samples at every Key Findings step.
+@pytest.mark.parametrize("threshold", [None, 10.0])
+def test_report_text_matches_row_wise_report(tmp_path, threshold):
+    data_dir = tmp_path / "plate"
+    data_dir.mkdir()
+    generate_dataset("384", str(data_dir), seed=11)
+    merged = clean_and_merge(str(data_dir), str(tmp_path))
+    target_cols = identify_columns(merged)
+    plot_data = build_plot_data(merged, target_cols)
+    if threshold is None:
+        threshold = calculate_mock_expression_threshold(merged, target_cols)
+    plot_files = [("Percent Parent", "percent_parent_plot.png"), ("MFI Ratio", "mfi_ratio_plot.png")]
+
+    generate_report(plot_data, plot_files, target_cols, str(tmp_path), threshold, None)
+    with open(tmp_path / "experiment_summary.md") as f:
+        assert f.read() == _row_wise_report(plot_data, plot_files, threshold)
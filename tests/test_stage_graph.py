@@ -0,0 +1,29 @@
+from analyze_flow import build_pipeline_stages, stage_code, stage_outputs
+
+
+def _code_names(stage):
+    return {name for name, _part in stage_code(stage)}
+
+
+def test_stage_code_covers_each_stage_function_and_its_helpers():
+    stages = {stage["name"]: stage for stage in build_pipeline_stages()}
+    for stage in stages.values():
+        entry = stage.get("run") or stage["run_group"]
+        assert entry.__name__ in _code_names(stage), stage["name"]
+
+    assert {"_stage_merge", "clean_and_merge", "load_raw_table", "RAW_METRIC_DTYPE"} <= _code_names(stages["merge"])
+    assert {"render_metric_plots", "page_filename", "resolve_figure_options", "COLOR_MAP"} <= _code_names(
+        stages["plot:percent_parent"]
+    )
+
+
+def test_plot_stage_code_includes_its_metric_config():
+    stage = next(stage for stage in build_pipeline_stages() if stage["name"] == "plot:mfi_ratio")
+    assert stage["metric_cfg"] in [part for _name, part in stage_code(stage)]
+
+
+def test_paged_plot_stage_lists_every_page_file():
+    stage = next(stage for stage in build_pipeline_stages() if stage["name"] == "plot:mfi_ratio")
+    pages = [("Ratio (page 1/2)", "mfi_ratio_plot.png"), ("Ratio (page 2/2)", "mfi_ratio_plot_page2.png")]
+    assert stage_outputs(stage, {}) == ["mfi_ratio_plot.png"]
+    assert stage_outputs(stage, {}, pages) == ["mfi_ratio_plot.png", "mfi_ratio_plot_page2.png"]
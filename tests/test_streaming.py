@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analyze_flow import (
+    PLOT_METRIC_KEYS,
+    GroupedAccumulator,
+    build_plot_data,
+    clean_and_merge,
+    find_input_csvs,
+    grouped_stats,
+    identify_columns,
+    stream_clean_and_merge,
+)
+from benchmark_flow import generate_dataset
+
+STAT_COLUMNS = [f"{key}_{stat}" for key in PLOT_METRIC_KEYS for stat in ("mean", "sem")]
+
+
+@pytest.fixture(scope="module")
+def plate(tmp_path_factory):
+    data_dir = tmp_path_factory.mktemp("plate")
+    generate_dataset("384", str(data_dir), seed=5)
+    return str(data_dir)
+
+
+@pytest.mark.parametrize("chunk_rows", [37, 1000])
+def test_streamed_statistics_match_in_memory_path(plate, tmp_path, chunk_rows):
+    (tmp_path / "memory").mkdir()
+    (tmp_path / "streamed").mkdir()
+    merged = clean_and_merge(plate, str(tmp_path / "memory"))
+    expected = build_plot_data(merged, identify_columns(merged))
+    streamed = stream_clean_and_merge(*find_input_csvs(plate), str(tmp_path / "streamed"), chunk_rows)["plot_data"]
+
+    assert streamed["Sample Name"].tolist() == expected["Sample Name"].tolist()
+    for column in STAT_COLUMNS:
+        np.testing.assert_allclose(streamed[column], expected[column], rtol=1e-12, atol=1e-12, err_msg=column)
+        assert [f"{value:.2f}" for value in streamed[column]] == [f"{value:.2f}" for value in expected[column]]
+
+
+def test_accumulator_mean_does_not_drift_across_chunks():
+    values = [14.99, 14.99, 15.0, 14.99, 15.0, 15.01, 14.97] * 7
+    df = pd.DataFrame({"name": ["a"] * len(values), "value": values})
+    accumulator = GroupedAccumulator(["name"], {"metric": "value"})
+    for start in range(0, len(df), 3):
+        accumulator.update(df.iloc[start : start + 3])
+    expected = grouped_stats(df, ["name"], {"metric": "value"}, stats=("mean", "std"))
+    result = accumulator.result(("mean", "std"))
+    assert result["metric_mean"].iloc[0] == expected["metric_mean"].iloc[0]
+    assert result["metric_std"].iloc[0] == pytest.approx(expected["metric_std"].iloc[0], rel=1e-12)
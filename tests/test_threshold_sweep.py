@@ -0,0 +1,17 @@
+import pytest
+
+import analyze_flow
+from analyze_flow import check_sweep_size, parse_sweep_spec
+
+
+def test_parse_sweep_spec_rejects_too_many_multipliers():
+    assert parse_sweep_spec("passed_ratio=1:3:0.5") == ("passed_ratio", [1.0, 1.5, 2.0, 2.5, 3.0])
+    with pytest.raises(ValueError, match="exceeds the limit"):
+        parse_sweep_spec("passed_ratio=0:100:0.01")
+
+
+def test_check_sweep_size_rejects_too_many_combinations(monkeypatch):
+    monkeypatch.setattr(analyze_flow, "SWEEP_MAX_COMBINATIONS", 20)
+    assert check_sweep_size({"a": [1, 2, 3, 4], "b": [1, 2, 3, 4, 5]}) == 20
+    with pytest.raises(ValueError, match="21 combinations"):
+        check_sweep_size({"a": [1, 2, 3, 4, 5, 6, 7], "b": [1, 2, 3]})